@@ -0,0 +1,89 @@
+"""
+File:       benchmarks/estop_latency.py
+Author:     Ali Karimiafshar
+
+Floods an AgvSocket server with motion commands, then sends an e-stop and
+measures how long it takes to reach the control handler, which is where
+the Controller stops the wave. Also reports how many queued messages the
+e-stop overtook.
+Run from the repository root: python -m benchmarks.estop_latency
+"""
+
+import contextlib
+import io
+import queue
+import statistics
+import threading
+import time
+
+from onboard_controller.agv_command import AgvCommand
+from tools.agv_socket import AgvSocket
+
+IP = "127.0.0.1"
+PORT = 5301
+TRIALS = 20
+FLOOD_SIZE = 2000
+PARSE_TIME = 0.0005
+
+
+def main():
+    message_queue: queue.Queue = queue.Queue()
+    e_stopped = threading.Event()
+
+    def control_handler(msg) -> None:
+        e_stopped.set()
+
+    def message_handler() -> None:
+        # Stands in for parsing and enqueueing each queued message.
+        while True:
+            message_queue.get()
+            time.sleep(PARSE_TIME)
+
+    threading.Thread(target=message_handler, daemon=True).start()
+
+    # Keep the per-message console output out of the results.
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        server = AgvSocket(ip=IP, port=PORT, isServer=True)
+        thread = threading.Thread(
+            target=server.start_server,
+            args=(message_queue, control_handler),
+            daemon=True,
+        )
+        thread.start()
+        time.sleep(0.1)
+        client = AgvSocket(ip=IP, port=PORT)
+        thread.join()
+
+        latencies: list[float] = []
+        backlogs: list[int] = []
+        for _ in range(TRIALS):
+            e_stopped.clear()
+            for i in range(FLOOD_SIZE):
+                client.send_message(f"{AgvCommand.forward.value} {i}")
+
+            sent = time.perf_counter()
+            client.send_message(AgvCommand.e_stop.value)
+            e_stopped.wait()
+            latencies.append(time.perf_counter() - sent)
+            backlogs.append(message_queue.qsize())
+
+            # Let the queue drain before the next trial.
+            while not message_queue.empty():
+                time.sleep(0.01)
+
+    ms = sorted(latency * 1000 for latency in latencies)
+    print(f"E-stop after {FLOOD_SIZE} queued commands, {TRIALS} trials")
+    print(
+        f"send-to-stop: p50 {statistics.median(ms):.3f} ms  "
+        f"max {ms[-1]:.3f} ms"
+    )
+    print(
+        f"queued messages overtaken: median {statistics.median(backlogs):.0f}"
+        f"  (~{statistics.median(backlogs) * PARSE_TIME * 1000:.0f} ms of "
+        "parsing through the FIFO)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+File:       benchmarks/instruction_latency.py
+Author:     Ali Karimiafshar
+
+Measures the software latency from a message being received to its
+instruction reaching the executor, for the event-driven pipeline used by
+the Controller and for the previous 50 ms polling lists.
+Run from the repository root: python -m benchmarks.instruction_latency
+"""
+
+import queue
+import random
+import statistics
+import threading
+import time
+from typing import Callable
+
+from onboard_controller.instruction_queue import InstructionQueue
+from onboard_controller.instructions import Instruction
+
+MESSAGE_COUNT = 200
+TIMER_INTERVAL = 0.050
+
+
+def parse(msg: str) -> Instruction:
+    words = msg.split()
+    return Instruction(command=words[0], value=float(words[1]))
+
+
+def event_driven(
+    executed: Callable[[], None]
+) -> tuple[Callable, Callable, Callable]:
+    """Message queue -> parser thread -> InstructionQueue -> executor."""
+
+    message_queue: queue.Queue[str] = queue.Queue()
+    instructions = InstructionQueue()
+
+    def message_handler() -> None:
+        for _ in range(MESSAGE_COUNT):
+            instructions.put(parse(message_queue.get()))
+
+    def instruction_handler() -> None:
+        for _ in range(MESSAGE_COUNT):
+            instructions.get()
+            executed()
+
+    return message_queue.put, message_handler, instruction_handler
+
+
+def polling(
+    executed: Callable[[], None]
+) -> tuple[Callable, Callable, Callable]:
+    """The previous shared list and instruction list polled every 50 ms."""
+
+    shared_list: list[str] = []
+    instructions: list[Instruction] = []
+    mutex = threading.Lock()
+
+    def receive(msg: str) -> None:
+        with mutex:
+            shared_list.append(msg)
+
+    def message_handler() -> None:
+        for _ in range(MESSAGE_COUNT):
+            while not shared_list:
+                time.sleep(TIMER_INTERVAL)
+            with mutex:
+                msg = shared_list.pop(0)
+            with mutex:
+                instructions.append(parse(msg))
+
+    def instruction_handler() -> None:
+        for _ in range(MESSAGE_COUNT):
+            while not instructions:
+                time.sleep(TIMER_INTERVAL)
+            with mutex:
+                instructions.pop(0)
+            executed()
+
+    return receive, message_handler, instruction_handler
+
+
+def measure(pipeline: Callable) -> list[float]:
+    """Feeds MESSAGE_COUNT messages to the pipeline at random intervals.
+
+    Args:
+        pipeline (Callable): event_driven or polling.
+
+    Returns:
+        list[float]: Receive-to-executor latency of each message in seconds.
+    """
+
+    send_times: list[float] = []
+    latencies: list[float] = []
+
+    def executed() -> None:
+        latencies.append(time.perf_counter() - send_times[len(latencies)])
+
+    receive, message_handler, instruction_handler = pipeline(executed)
+    threads = [
+        threading.Thread(target=message_handler),
+        threading.Thread(target=instruction_handler),
+    ]
+    for thread in threads:
+        thread.start()
+
+    for i in range(MESSAGE_COUNT):
+        time.sleep(random.uniform(0.001, 0.020))
+        send_times.append(time.perf_counter())
+        receive(f"FORWARD {i}")
+
+    for thread in threads:
+        thread.join()
+
+    return latencies
+
+
+def summarize(latencies: list[float]) -> str:
+    ms = sorted(latency * 1000 for latency in latencies)
+    p99 = ms[int(len(ms) * 0.99) - 1]
+    return (
+        f"p50 {statistics.median(ms):8.3f} ms  "
+        f"p99 {p99:8.3f} ms  max {ms[-1]:8.3f} ms"
+    )
+
+
+def main():
+    print(f"Receive-to-executor latency over {MESSAGE_COUNT} messages")
+    print(f"event-driven: {summarize(measure(event_driven))}")
+    print(f"     polling: {summarize(measure(polling))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+File:       benchmarks/motion_profile.py
+Author:     Ali Karimiafshar
+
+Compares the total move time of the fixed stair ramp against trapezoidal
+and S-curve profiles, across the distances of typical routes. Each ramp's
+peak acceleration is reported alongside, measured between the middles of
+consecutive levels, as is the time taken to generate a profile with and
+without memoization. Results are printed as JSON.
+Run from the repository root: python -m benchmarks.motion_profile
+    --output results.json   Also write the results to a file
+"""
+
+import argparse
+import json
+import platform
+import time
+
+from tools.agv_tools import AgvTools
+from tools.config import read_config
+from tools.motion_profile import (
+    MotionProfile,
+    create_ramp,
+    peak_acceleration,
+    ramp_duration,
+)
+
+# unit: inch
+DISTANCES = [1, 3, 6, 12, 24, 36.5, 60, 120]
+
+
+def describe(ramp) -> dict:
+    return {
+        "seconds": round(ramp_duration(ramp), 3),
+        "peak_acceleration": round(peak_acceleration(ramp), 2),
+        "segments": len(ramp),
+        "frequencies": len({frequency for frequency, _ in ramp}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--output", help="Also write the JSON to this file.")
+    args = parser.parse_args()
+
+    config = read_config()
+    trapezoid = MotionProfile(
+        max_velocity=config.motion_max_velocity,
+        acceleration=config.motion_acceleration,
+        levels=config.motion_profile_levels,
+    )
+    s_curve = MotionProfile(
+        max_velocity=config.motion_max_velocity,
+        acceleration=config.motion_acceleration,
+        jerk=config.motion_jerk or 4 * config.motion_acceleration,
+        levels=config.motion_profile_levels,
+    )
+
+    results = []
+    for inches in DISTANCES:
+        pulse_num = AgvTools.calc_pulse_num_from_dist(inches=inches)
+        stair = AgvTools.create_ramp_inputs(inches=inches)
+        stair_seconds = ramp_duration(stair)
+
+        result = {"inches": inches, "pulses": pulse_num}
+        result["stair"] = describe(stair)
+        for name, profile in [("trapezoid", trapezoid), ("s_curve", s_curve)]:
+            ramp = profile.ramp(pulse_num)
+            result[name] = describe(ramp)
+            result[name]["speedup"] = round(
+                stair_seconds / ramp_duration(ramp), 2
+            )
+        results.append(result)
+
+    # Generation time of a long move, first computed then memoized.
+    pulse_num = AgvTools.calc_pulse_num_from_dist(inches=120)
+    create_ramp.cache_clear()
+    start = time.perf_counter()
+    s_curve.ramp(pulse_num)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    s_curve.ramp(pulse_num)
+    warm = time.perf_counter() - start
+
+    report = {
+        "benchmark": "motion_profile",
+        "profile": {
+            "max_velocity": trapezoid.max_velocity,
+            "acceleration": trapezoid.acceleration,
+            "jerk": s_curve.jerk,
+            "levels": trapezoid.levels,
+        },
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "generation_us": {
+            "computed": round(cold * 1e6, 1),
+            "memoized": round(warm * 1e6, 1),
+        },
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+File:       benchmarks/move_gaps.py
+Author:     Ali Karimiafshar
+
+Sends a series of short manual moves to the Controller on simulated
+hardware and measures the idle time it leaves around each one: the time
+taken to execute them all, less the time their ramps take to transmit.
+Also reports the distance travelled and the largest difference between
+the pulses counted and commanded for a move.
+Run from the repository root: python -m benchmarks.move_gaps
+    --moves 10              Number of moves
+    --inches 1              Length of each move
+    --speed 1               Virtual seconds per real second
+    --output results.json   Also write the results to a file
+"""
+
+import argparse
+import atexit
+import contextlib
+import io
+import json
+import platform
+import threading
+import time
+
+from onboard_controller.agv_command import AgvCommand
+from onboard_controller.controller import Controller
+from onboard_controller.hardware import SimulatedHardware
+from tools.agv_socket import AgvSocket
+from tools.agv_tools import AgvTools
+from tools.config import read_config
+from tools.motion_estimator import MotionEstimator
+from tools.motion_profile import MotionProfile
+from tools.transport import InProcessTransport
+
+IP = "127.0.0.1"
+PORT = 5305
+
+
+def run_moves(moves: int, inches: float, speed: float) -> dict:
+    """Starts a Controller on simulated hardware, sends it the moves and
+    waits for the last to be executed.
+
+    Returns:
+        dict: Virtual seconds taken, distance travelled and the pulse
+            error of each move.
+    """
+
+    hardware = SimulatedHardware(speed=speed)
+    server = AgvSocket(
+        ip=IP,
+        port=PORT,
+        isServer=True,
+        transport=InProcessTransport("gaps"),
+    )
+
+    controllers: list[Controller] = []
+    thread = threading.Thread(
+        target=lambda: controllers.append(Controller(server, hardware)),
+        daemon=True,
+    )
+    thread.start()
+    time.sleep(0.1)
+
+    client = AgvSocket(ip=IP, port=PORT, transport=InProcessTransport("gaps"))
+    thread.join()
+    client.start_listener(lambda msg: None)
+
+    start = hardware.clock.time()
+    for _ in range(moves):
+        seq = client.send_command(f"{AgvCommand.forward.value} {inches}")
+
+    window = client.window
+    with window.condition:
+        window.condition.wait_for(lambda: window.last_executed >= seq)
+
+    elapsed = hardware.clock.time() - start
+    hardware.clock.sleep(0.5)
+    pose = hardware.get_pose()
+    errors = list(controllers[0].pulse_errors.samples)
+
+    for sock in [server, client]:
+        sock.cleanup_server()
+        atexit.unregister(sock.cleanup_server)
+    server.handler.join(timeout=1)
+    client.log.sink.drain()
+
+    return {"seconds": elapsed, "inches": pose.y, "pulse_errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--moves", type=int, default=10)
+    parser.add_argument("--inches", type=float, default=1.0)
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--output", help="Also write the JSON to this file.")
+    args = parser.parse_args()
+
+    # Keep the Controller's log messages out of the JSON.
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        result = run_moves(args.moves, args.inches, args.speed)
+
+    estimator = MotionEstimator(MotionProfile.from_config(read_config()))
+    pulse_num = AgvTools.calc_pulse_num_from_dist(inches=args.inches)
+    ramp_seconds = args.moves * estimator.move_time(pulse_num)
+    idle = (result["seconds"] - ramp_seconds) / args.moves
+
+    report = {
+        "benchmark": "move_gaps",
+        "moves": args.moves,
+        "inches": args.inches,
+        "speed": args.speed,
+        "seconds": round(result["seconds"], 3),
+        "ramp_seconds": round(ramp_seconds, 3),
+        "idle_ms_per_move": round(idle * 1000, 1),
+        "inches_travelled": round(result["inches"], 3),
+        "inches_commanded": args.moves * args.inches,
+        "max_pulse_error": max(result["pulse_errors"], default=0),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+File:       benchmarks/obstacle_latency.py
+Author:     Ali Karimiafshar
+
+Measures how long the Controller takes to stop the steps once an obstacle
+appears in front of the AGV, with the optical sensors polled by the flag
+handler and with edge callbacks. The AGV drives forward on simulated
+hardware while the horizontal sensor is repeatedly blocked and cleared.
+Latency percentiles and histograms of both are printed as JSON.
+Run from the repository root: python -m benchmarks.obstacle_latency
+    --trials 20             Obstacles per mode
+    --speed 1               Virtual seconds per real second
+    --output results.json   Also write the results to a file
+"""
+
+import argparse
+import atexit
+import contextlib
+import io
+import json
+import platform
+import random
+import threading
+import time
+
+from onboard_controller.agv_command import AgvCommand
+from onboard_controller.controller import Controller
+from onboard_controller.hardware import SimulatedHardware
+from onboard_controller.pi_bcm_pin_assignment import Pin
+from tools.agv_socket import AgvSocket
+from tools.histogram import RollingHistogram
+from tools.transport import InProcessTransport
+
+IP = "127.0.0.1"
+PORT = 5304
+
+# unit: seconds of virtual time
+# Driving time between obstacles, and how long each one stays.
+DRIVE_TIME = (0.3, 0.6)
+BLOCKED_TIME = 0.2
+TIMEOUT = 2.0
+
+
+def measure(is_edge_triggered: bool, trials: int, speed: float) -> dict:
+    """Starts a Controller on simulated hardware, drives it forward and
+    blocks its horizontal sensor trials times.
+
+    Returns:
+        dict: Latency percentiles and histogram in milliseconds.
+    """
+
+    hardware = SimulatedHardware(speed=speed)
+    sensor = Pin.horizontal_os.value
+    hardware.set_input(sensor, 0)
+
+    name = "edge" if is_edge_triggered else "polled"
+    server = AgvSocket(
+        ip=IP,
+        port=PORT,
+        isServer=True,
+        transport=InProcessTransport(name),
+    )
+    server.config.sensor_edge_callbacks = is_edge_triggered
+
+    controllers: list[Controller] = []
+    thread = threading.Thread(
+        target=lambda: controllers.append(Controller(server, hardware)),
+        daemon=True,
+    )
+    thread.start()
+    time.sleep(0.1)
+
+    client = AgvSocket(ip=IP, port=PORT, transport=InProcessTransport(name))
+    thread.join()
+    client.start_listener(lambda msg: None)
+    client.send_command(f"{AgvCommand.forward.value} 10000")
+
+    clock, pi = hardware.clock, hardware.pi
+    latencies = RollingHistogram(size=trials)
+    for _ in range(trials):
+        # Drive for a while, whether starting or resuming.
+        while not pi.wave_tx_busy():
+            time.sleep(0.001)
+        clock.sleep(random.uniform(*DRIVE_TIME))
+
+        onset = clock.time()
+        hardware.set_input(sensor, 1)
+        while clock.time() - onset < TIMEOUT:
+            if pi.interrupted_at is not None and pi.interrupted_at >= onset:
+                latencies.add((pi.interrupted_at - onset) * 1000)
+                break
+            time.sleep(0.0001)
+
+        clock.sleep(BLOCKED_TIME)
+        hardware.set_input(sensor, 0)
+
+    controller = controllers[0]
+    client.send_command(AgvCommand.e_stop.value)
+    time.sleep(0.1)
+    for sock in [server, client]:
+        sock.cleanup_server()
+        atexit.unregister(sock.cleanup_server)
+    server.handler.join(timeout=1)
+    client.log.sink.drain()
+
+    result = {
+        "trials": len(latencies),
+        "p50_ms": round(latencies.percentile(0.50), 2),
+        "p99_ms": round(latencies.percentile(0.99), 2),
+        "max_ms": round(max(latencies.samples), 2),
+        "histogram_ms": {
+            str(edge): count for edge, count in latencies.buckets() if count
+        },
+    }
+    if is_edge_triggered:
+        # As recorded by the Controller, from pigpiod's edge ticks.
+        recorded = controller.obstacle_latency
+        result["controller_p50_ms"] = round(recorded.percentile(0.50), 2)
+        result["controller_p99_ms"] = round(recorded.percentile(0.99), 2)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--trials", type=int, default=20)
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--output", help="Also write the JSON to this file.")
+    args = parser.parse_args()
+
+    # Keep the Controller's log messages out of the JSON.
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        polled = measure(False, args.trials, args.speed)
+        edge = measure(True, args.trials, args.speed)
+
+    report = {
+        "benchmark": "obstacle_latency",
+        "speed": args.speed,
+        "polled": polled,
+        "edge": edge,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+File:       benchmarks/qr_latency.py
+Author:     Ali Karimiafshar
+
+Measures how long a QR code marker takes to be decoded once it comes into
+view, with frames from a FrameGrabber on the simulated camera. Markers
+appear at random times between frames, so the latency is up to one frame
+period of waiting plus the decode. Also times the decode alone, with and
+without the configured region of interest.
+Run from the repository root: python -m benchmarks.qr_latency
+    --trials 30             Markers shown
+    --fps 30                Frames per second of the simulated camera
+    --output results.json   Also write the results to a file
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import time
+
+import cv2
+
+from onboard_controller.frame_grabber import FrameGrabber
+from onboard_controller.hardware import SimulatedHardware
+from tools.config import read_config
+from tools.histogram import RollingHistogram
+
+MARKER = "START START END END"
+
+
+def measure(
+    trials: int, fps: float, roi: "list[int] | None", config
+) -> tuple[RollingHistogram, list[float]]:
+    """Shows a marker trials times and decodes frames until it is read.
+
+    Returns:
+        tuple[RollingHistogram, list[float]]: Latencies from the marker
+            appearing to being decoded, and the decode times, in ms.
+    """
+
+    hardware = SimulatedHardware()
+    camera = hardware.camera()
+    camera.fps = fps
+    grabber = FrameGrabber(
+        camera, config.camera_width, config.camera_height, roi
+    )
+    grabber.start()
+
+    detector = cv2.QRCodeDetector()
+    latencies = RollingHistogram(size=trials)
+    decodes: list[float] = []
+    frame_id, frame = 0, None
+    for _ in range(trials):
+        hardware.clock.sleep(random.uniform(0.1, 0.2))
+        hardware.set_marker(MARKER)
+        shown = hardware.clock.time()
+
+        text = ""
+        while text != MARKER:
+            frame_id, frame = grabber.read(frame_id, frame)
+            start = time.perf_counter()
+            text, _, _ = detector.detectAndDecode(frame)
+            decodes.append((time.perf_counter() - start) * 1000)
+
+        latencies.add((hardware.clock.time() - shown) * 1000)
+        hardware.set_marker(None)
+
+    grabber.stop()
+    return latencies, decodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--trials", type=int, default=30)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--output", help="Also write the JSON to this file.")
+    args = parser.parse_args()
+
+    config = read_config()
+    roi = config.camera_roi
+    if roi is None:
+        # The middle half of the frame, around the marker.
+        w, h = config.camera_width, config.camera_height
+        roi = [w // 4, h // 4, w // 2, h // 2]
+
+    report = {
+        "benchmark": "qr_latency",
+        "fps": args.fps,
+        "frame_period_ms": round(1000 / args.fps, 1),
+        "resolution": [config.camera_width, config.camera_height],
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    for name, region in [("full_frame", None), ("roi", roi)]:
+        latencies, decodes = measure(args.trials, args.fps, region, config)
+        report[name] = {
+            "roi": region,
+            "p50_ms": round(latencies.percentile(0.50), 1),
+            "p99_ms": round(latencies.percentile(0.99), 1),
+            "max_ms": round(max(latencies.samples), 1),
+            "decode_ms": round(statistics.median(decodes), 2),
+        }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+File:       benchmarks/qr_worker.py
+Author:     Ali Karimiafshar
+
+Measures how QR decoding disturbs the timing of the motion threads. A
+thread stands in for the chain streamer, waking every millisecond to do a
+little Python work, while frames from the simulated camera are decoded on
+a thread of the same process, by the QR worker process, or not at all.
+Reports how late the thread wakes and the frames decoded per second.
+Run from the repository root: python -m benchmarks.qr_worker
+    --seconds 5             Duration of each run
+    --fps 30                Frames per second of the simulated camera
+    --output results.json   Also write the results to a file
+"""
+
+import argparse
+import json
+import platform
+import threading
+import time
+
+import cv2
+
+from onboard_controller.frame_grabber import FrameGrabber
+from onboard_controller.hardware import SimulatedHardware
+from onboard_controller.qr_worker import QrWorker
+from tools.config import read_config
+from tools.histogram import RollingHistogram
+
+MARKER = "START START END END"
+
+# unit: seconds
+# Period of the stand-in for the motion threads.
+PERIOD = 0.001
+
+
+def motion_loop(seconds: float) -> RollingHistogram:
+    """Wakes every period for seconds, and records how late it woke.
+
+    Returns:
+        RollingHistogram: Lateness of each wake in milliseconds.
+    """
+
+    lateness = RollingHistogram(size=int(seconds / PERIOD))
+    deadline = time.perf_counter()
+    end = deadline + seconds
+    while deadline < end:
+        deadline += PERIOD
+        time.sleep(max(0.0, deadline - time.perf_counter()))
+        lateness.add(max(0.0, time.perf_counter() - deadline) * 1000)
+
+        # Some bookkeeping, as when the next chunk of a chain is queued.
+        sum(i * i for i in range(50))
+
+    return lateness
+
+
+def measure(mode: str, seconds: float, fps: float, config) -> dict:
+    """Decodes frames in the given mode while running the motion loop.
+
+    Returns:
+        dict: Lateness percentiles in ms, and frames decoded per second.
+    """
+
+    hardware = SimulatedHardware()
+    hardware.set_marker(MARKER)
+    camera = hardware.camera()
+    camera.fps = fps
+    grabber = FrameGrabber(
+        camera, config.camera_width, config.camera_height, config.camera_roi
+    )
+    grabber.start()
+
+    decoded = 0
+    stopped = threading.Event()
+
+    def decode_in_thread():
+        nonlocal decoded
+        detector = cv2.QRCodeDetector()
+        frame_id, frame = 0, None
+        while not stopped.is_set():
+            frame_id, frame = grabber.read(frame_id, frame, timeout=0.1)
+            if frame is not None:
+                detector.detectAndDecode(frame)
+                decoded += 1
+
+    def decode_in_worker():
+        nonlocal decoded
+        while not stopped.is_set():
+            if worker.result(timeout=0.1) is not None:
+                decoded += 1
+
+    worker = None
+    thread = None
+    if mode == "thread":
+        thread = threading.Thread(target=decode_in_thread, daemon=True)
+    elif mode == "process":
+        worker = QrWorker(grabber)
+        worker.start()
+        thread = threading.Thread(target=decode_in_worker, daemon=True)
+
+    if thread is not None:
+        thread.start()
+        # Let decoding reach its pace.
+        time.sleep(1)
+
+    decoded = 0
+    lateness = motion_loop(seconds)
+    rate = decoded / seconds
+
+    stopped.set()
+    if thread is not None:
+        thread.join()
+    if worker is not None:
+        worker.stop()
+    grabber.stop()
+
+    return {
+        "p50_ms": round(lateness.percentile(0.50), 3),
+        "p99_ms": round(lateness.percentile(0.99), 3),
+        "max_ms": round(max(lateness.samples), 3),
+        "decoded_fps": round(rate, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--output", help="Also write the JSON to this file.")
+    args = parser.parse_args()
+
+    config = read_config()
+    report = {
+        "benchmark": "qr_worker",
+        "seconds": args.seconds,
+        "fps": args.fps,
+        "resolution": [config.camera_width, config.camera_height],
+        "roi": config.camera_roi,
+    }
+    for mode in ["none", "thread", "process"]:
+        report[mode] = measure(mode, args.seconds, args.fps, config)
+
+    report.update(
+        {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+    )
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
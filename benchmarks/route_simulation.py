@@ -0,0 +1,148 @@
+"""
+File:       benchmarks/route_simulation.py
+Author:     Ali Karimiafshar
+
+Runs a saved route through the Controller on simulated hardware, in
+virtual time running faster than real time. The route is uploaded over an
+in-process connection as the stationary controller would, and timed until
+the AGV acknowledges executing it. The time taken, the final pose and the
+estimated duration are printed as JSON.
+Run from the repository root: python -m benchmarks.route_simulation
+    --route start_to_end    Route in the routes directory to run
+    --speed 20              Virtual seconds per real second
+    --drive differential    Drive mode, shared or differential
+    --output results.json   Also write the results to a file
+"""
+
+import argparse
+import atexit
+import contextlib
+import io
+import json
+import platform
+import threading
+import time
+
+from onboard_controller.controller import Controller
+from onboard_controller.hardware import SimulatedHardware
+from onboard_controller.route_upload import RouteUpload
+from tools.agv_socket import AgvSocket
+from tools.config import read_config
+from tools.motion_estimator import MotionEstimator, read_route
+from tools.motion_profile import MotionProfile
+from tools.transport import InProcessTransport
+
+IP = "127.0.0.1"
+PORT = 5303
+
+
+def run_route(
+    route: RouteUpload, hardware: SimulatedHardware, drive_mode: str
+) -> dict:
+    """Starts a Controller on the hardware, uploads the route and waits for
+    it to be executed.
+
+    Returns:
+        dict: Virtual and real seconds taken, and the final pose.
+    """
+
+    server = AgvSocket(
+        ip=IP,
+        port=PORT,
+        isServer=True,
+        transport=InProcessTransport("simulation"),
+    )
+    server.config.drive_mode = drive_mode
+    thread = threading.Thread(
+        target=Controller, args=(server, hardware), daemon=True
+    )
+    thread.start()
+    time.sleep(0.1)
+
+    client = AgvSocket(
+        ip=IP, port=PORT, transport=InProcessTransport("simulation")
+    )
+    thread.join()
+    client.start_listener(lambda msg: None)
+
+    start = hardware.clock.time()
+    real_start = time.perf_counter()
+    seq = client.send_command(route.to_message())
+
+    window = client.window
+    with window.condition:
+        window.condition.wait_for(lambda: window.last_executed >= seq)
+
+    elapsed = hardware.clock.time() - start
+    real_elapsed = time.perf_counter() - real_start
+    pose = hardware.get_pose()
+
+    for sock in [server, client]:
+        sock.cleanup_server()
+        atexit.unregister(sock.cleanup_server)
+    server.handler.join(timeout=1)
+
+    # Write out the log messages before stdout is restored.
+    client.log.sink.drain()
+
+    return {
+        "seconds": round(elapsed, 3),
+        "real_seconds": round(real_elapsed, 3),
+        "pose": {
+            "x": round(pose.x, 2),
+            "y": round(pose.y, 2),
+            "heading": round(pose.heading, 1),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--route", default="start_to_end")
+    parser.add_argument("--speed", type=float)
+    parser.add_argument("--drive", choices=["shared", "differential"])
+    parser.add_argument("--output", help="Also write the JSON to this file.")
+    args = parser.parse_args()
+
+    config = read_config()
+    speed = args.speed or config.simulation_speed
+    drive_mode = args.drive or config.drive_mode
+    start_name, _, end_name = args.route.partition("_to_")
+    instructions = read_route(f"./routes/{args.route}.txt")
+    route = RouteUpload(start_name, end_name, instructions)
+
+    # Keep the Controller's log messages out of the JSON.
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        hardware = SimulatedHardware(
+            speed=speed, differential=drive_mode == "differential"
+        )
+        result = run_route(route, hardware, drive_mode)
+
+    estimator = MotionEstimator(
+        MotionProfile.from_config(config),
+        drive_mode=drive_mode,
+        corner_radius=config.corner_radius,
+    )
+    report = {
+        "benchmark": "route_simulation",
+        "route": args.route,
+        "instructions": len(instructions),
+        "speed": speed,
+        "drive": drive_mode,
+        "estimated_seconds": round(estimator.route_time(instructions), 3),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        **result,
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
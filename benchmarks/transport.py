@@ -0,0 +1,271 @@
+"""
+File:       benchmarks/transport.py
+Author:     Ali Karimiafshar
+
+Measures AgvSocket framing throughput and round-trip latency. Every message
+the client sends is echoed back by the server, across message sizes, burst
+patterns and a realistic mix of motion commands. Results are printed as
+JSON so runs can be compared between releases.
+Run from the repository root: python -m benchmarks.transport
+    --transport tcp         AgvSocket server and client over loopback TCP
+    --transport unix        The same over a Unix domain socket
+    --transport inproc      The same over in-process pipes
+    --transport socketpair  The bare framing over a socket pair
+    --output results.json   Also write the results to a file
+"""
+
+import argparse
+import atexit
+import contextlib
+import io
+import json
+import os
+import platform
+import queue
+import random
+import socket
+import threading
+import time
+from typing import Callable
+
+from onboard_controller.agv_command import AgvCommand
+from tools.agv_async_socket import encode_frame
+from tools.agv_socket import AgvSocket
+from tools.config import read_config
+from tools.frame_reader import FrameReader
+from tools.transport import (
+    InProcessTransport,
+    TcpTransport,
+    Transport,
+    UnixTransport,
+)
+
+IP = "127.0.0.1"
+PORT = 5302
+MESSAGE_COUNT = 5000
+SIZES = [16, 64, 256, 1024, 4096]
+BURSTS = [1, 8, 64]
+MIX = [
+    (AgvCommand.forward, 0.4),
+    (AgvCommand.backward, 0.1),
+    (AgvCommand.rotate_cw, 0.25),
+    (AgvCommand.rotate_ccw, 0.25),
+]
+TRANSPORTS: dict[str, Callable[[], Transport]] = {
+    "tcp": lambda: TcpTransport(IP, PORT),
+    "unix": lambda: UnixTransport(f"/tmp/agv_benchmark_{os.getpid()}.sock"),
+    "inproc": lambda: InProcessTransport("benchmark"),
+    "socketpair": None,
+}
+
+
+class AgvSocketLink:
+    def __init__(self, transport: Callable[[], Transport]) -> None:
+        """AgvSocket client connected to an AgvSocket server that echoes
+        every message it receives.
+
+        Args:
+            transport (Callable[[], Transport]): Creates the transport of
+                the server and of the client.
+        """
+
+        self.received: queue.Queue[str] = queue.Queue()
+
+        self.server = server = AgvSocket(
+            ip=IP, port=PORT, isServer=True, transport=transport()
+        )
+        message_queue: queue.Queue = queue.Queue()
+        thread = threading.Thread(
+            target=server.start_server, args=(message_queue,), daemon=True
+        )
+        thread.start()
+        time.sleep(0.1)
+
+        self.client = AgvSocket(ip=IP, port=PORT, transport=transport())
+        thread.join()
+        self.client.start_listener(self.received.put)
+
+        def echo() -> None:
+            while True:
+                server.send_message(message_queue.get())
+
+        threading.Thread(target=echo, daemon=True).start()
+
+    def send(self, msg: str) -> None:
+        self.client.send_message(msg)
+
+    def close(self) -> None:
+        self.client.cleanup_server()
+        atexit.unregister(self.client.cleanup_server)
+        self.server.handler.join(timeout=1)
+
+        # Write out the log messages before stdout is restored.
+        self.client.log.sink.drain()
+
+
+class SocketPairLink:
+    def __init__(self) -> None:
+        """The AgvSocket framing over a socket pair, without the TCP stack
+        or the server's message queue."""
+
+        config = read_config()
+        self.header_size = config.socket_message_header_size
+        self.encoding = config.socket_encoding_format
+        self.received: queue.Queue[str] = queue.Queue()
+
+        self.near, far = socket.socketpair()
+
+        def echo() -> None:
+            reader = FrameReader(far, self.header_size, self.encoding)
+            while True:
+                for msg in reader.read_frames():
+                    far.sendall(
+                        encode_frame(msg, self.header_size, self.encoding)
+                    )
+
+        def listen() -> None:
+            reader = FrameReader(self.near, self.header_size, self.encoding)
+            while True:
+                for msg in reader.read_frames():
+                    self.received.put(msg)
+
+        threading.Thread(target=echo, daemon=True).start()
+        threading.Thread(target=listen, daemon=True).start()
+
+    def send(self, msg: str) -> None:
+        self.near.sendall(encode_frame(msg, self.header_size, self.encoding))
+
+    def close(self) -> None:
+        self.near.close()
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run(link, messages: list[str], burst: int) -> dict:
+    """Sends the messages in bursts, waiting for every echo of a burst
+    before sending the next. Echoes arrive in order, so each one is
+    matched to its send time by position.
+
+    Args:
+        link (TcpLink | SocketPairLink): The link to measure.
+        messages (list[str]): The messages to send.
+        burst (int): Messages sent back to back. 1 sends each message
+            only once the previous one has returned.
+
+    Returns:
+        dict: Throughput and round-trip latency percentiles.
+    """
+
+    header_size = read_config().socket_message_header_size
+    frame_bytes = sum(len(msg.encode()) + header_size for msg in messages)
+    rtts: list[float] = []
+
+    start = time.perf_counter()
+    for i in range(0, len(messages), burst):
+        sent = []
+        for msg in messages[i : i + burst]:
+            sent.append(time.perf_counter())
+            link.send(msg)
+
+        for send_time in sent:
+            link.received.get()
+            rtts.append(time.perf_counter() - send_time)
+    elapsed = time.perf_counter() - start
+
+    us = sorted(rtt * 1e6 for rtt in rtts)
+    return {
+        "messages": len(messages),
+        "burst": burst,
+        "messages_per_second": round(len(messages) / elapsed),
+        "bytes_per_second": round(frame_bytes / elapsed),
+        "rtt_us": {
+            "p50": round(percentile(us, 0.50), 1),
+            "p99": round(percentile(us, 0.99), 1),
+            "p99.9": round(percentile(us, 0.999), 1),
+            "max": round(us[-1], 1),
+        },
+    }
+
+
+def sized_messages(size: int, count: int) -> list[str]:
+    """Forward commands padded to size bytes."""
+
+    msg = f"{AgvCommand.forward.value} 30.0 "
+    return [(msg + "x" * size)[:size]] * count
+
+
+def mixed_messages(count: int, seed: int = 0) -> list[str]:
+    """Motion commands in the proportions an operator typically sends."""
+
+    rng = random.Random(seed)
+    commands, weights = zip(*MIX)
+    messages = []
+    for command in rng.choices(commands, weights, k=count):
+        if command in [AgvCommand.forward, AgvCommand.backward]:
+            value = rng.choice([6.0, 12.0, 24.0, 36.5])
+        else:
+            value = rng.choice([45.0, 90.0, 180.0])
+        messages.append(f"{command.value} {value}")
+
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--transport", choices=TRANSPORTS, default="tcp")
+    parser.add_argument("--count", type=int, default=MESSAGE_COUNT)
+    parser.add_argument("--output", help="Also write the JSON to this file.")
+    args = parser.parse_args()
+
+    # Keep the connection log messages out of the JSON.
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        if args.transport == "socketpair":
+            link = SocketPairLink()
+        else:
+            link = AgvSocketLink(TRANSPORTS[args.transport])
+
+        # Warm up the connection and the threads before measuring.
+        run(link, mixed_messages(200), burst=8)
+
+        results = []
+        for size in SIZES:
+            for burst in BURSTS:
+                result = run(link, sized_messages(size, args.count), burst)
+                results.append({"scenario": f"size_{size}", **result})
+
+        for burst in BURSTS:
+            result = run(link, mixed_messages(args.count), burst)
+            results.append({"scenario": "command_mix", **result})
+
+        link.close()
+
+    report = {
+        "benchmark": "transport",
+        "transport": args.transport,
+        # The socket pair always uses the text framing.
+        "wire_format": (
+            "text"
+            if args.transport == "socketpair"
+            else read_config().socket_wire_format
+        ),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+File:       benchmarks/wire_protocol.py
+Author:     Ali Karimiafshar
+
+Compares the text and binary wire protocols over a loopback socket pair.
+The decode time covers everything after the bytes are received: parsing
+the frame headers, decoding the payloads and validating the commands into
+instructions, for both protocols alike.
+Run from the repository root: python -m benchmarks.wire_protocol
+"""
+
+import socket
+import threading
+import time
+
+from onboard_controller.agv_command import AgvCommand
+from onboard_controller.instructions import Instruction
+from tools import wire_protocol
+from tools.config import read_config
+from tools.frame_reader import FrameReader
+from tools.wire_protocol import MOTION_COMMANDS, CommandFrame
+
+MESSAGE_COUNT = 100000
+MESSAGES = ["FORWARD 30.0", "ROTATECW 90.0", "BACKWARD 12.5", "ROTATECCW 45.0"]
+
+
+def parse_text(msg: str) -> Instruction:
+    """Mirrors the validation Controller.parse_message performs on a text
+    motion command."""
+
+    words = [n.upper() for n in msg.split()]
+    if len(words) != 2:
+        return
+
+    if words[0] not in [cmd.value for cmd in AgvCommand]:
+        return
+
+    return Instruction(command=words[0], value=float(words[1]))
+
+
+def parse_binary(frame: CommandFrame) -> Instruction:
+    """Mirrors the fast path Controller.parse_message takes for a binary
+    motion command."""
+
+    if frame.command in MOTION_COMMANDS:
+        return Instruction(command=frame.command.value, value=frame.value)
+
+
+def run(binary: bool) -> dict:
+    """Streams MESSAGE_COUNT commands through a socket pair and decodes them
+    into instructions on the receiving side.
+
+    Args:
+        binary (bool): Whether to use the binary protocol.
+
+    Returns:
+        dict: Bytes per message, messages per second and decode time.
+    """
+
+    config = read_config()
+    sender, receiver = socket.socketpair()
+
+    def encode(msg: str) -> bytes:
+        if binary:
+            return wire_protocol.encode_message(
+                msg, config.socket_encoding_format
+            )
+
+        header = f"{len(msg):<{config.socket_message_header_size}}"
+        return (header + msg).encode(config.socket_encoding_format)
+
+    parse = parse_binary if binary else parse_text
+
+    reader = FrameReader(
+        receiver,
+        config.socket_message_header_size,
+        config.socket_encoding_format,
+    )
+    if binary:
+        reader.set_binary()
+
+    total_bytes = 0
+
+    def send_all() -> None:
+        nonlocal total_bytes
+        for i in range(MESSAGE_COUNT):
+            frame = encode(MESSAGES[i % len(MESSAGES)])
+            total_bytes += len(frame)
+            sender.sendall(frame)
+        sender.close()
+
+    start = time.perf_counter()
+    thread = threading.Thread(target=send_all)
+    thread.start()
+
+    received = 0
+    decode_time = 0.0
+    while not reader.closed:
+        # Only the receive is left out of the decode time.
+        reader.fill_buffer()
+
+        decode_start = time.perf_counter()
+        frames = reader.parse_frames()
+        for frame in frames:
+            parse(frame)
+        decode_time += time.perf_counter() - decode_start
+        received += len(frames)
+
+    elapsed = time.perf_counter() - start
+    thread.join()
+    receiver.close()
+
+    return {
+        "bytes_per_message": total_bytes / received,
+        "messages_per_second": received / elapsed,
+        "decode_us_per_message": decode_time / received * 1e6,
+    }
+
+
+def main():
+    results = {"text": run(binary=False), "binary": run(binary=True)}
+
+    print(f"{MESSAGE_COUNT} messages over a loopback socket pair")
+    for name, result in results.items():
+        print(
+            f"{name:>6}: {result['bytes_per_message']:5.1f} B/msg  "
+            f"{result['messages_per_second']:9.0f} msg/s  "
+            f"{result['decode_us_per_message']:5.2f} us/msg decode"
+        )
+
+
+if __name__ == "__main__":
+    main()
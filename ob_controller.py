@@ -7,14 +7,20 @@ import socket
 from time import sleep
 
 from onboard_controller.controller import Controller
+from tools.agv_async_socket import AsyncAgvServer
 from tools.agv_socket import AgvSocket
+from tools.config import read_config
 
 
 def main():
     PORT = 1234
     SERVER = socket.gethostbyname(socket.gethostname() + ".local")
 
-    server = AgvSocket(ip=SERVER, port=PORT, isServer=True)
+    # Serve several stationary controllers at once if configured.
+    if read_config().socket_multi_client:
+        server = AsyncAgvServer(ip=SERVER, port=PORT)
+    else:
+        server = AgvSocket(ip=SERVER, port=PORT, isServer=True)
 
     ctrl = Controller(server)
 
@@ -13,6 +13,11 @@ class AgvCommand(Enum):
     set_mode = "!SETMODE"
     halt = "!HALT"
     traverse_route = "!TRAVERSE"
+    upload_route = "!ROUTE"
+    telemetry = "!TELEMETRY"
+    ack = "!ACK"
+    ping = "!PING"
+    pong = "!PONG"
 
     forward = "FORWARD"
     backward = "BACKWARD"
@@ -3,7 +3,9 @@ File:       onboard_controller/controller.py
 Author:     Ali Karimiafshar
 """
 
+import dataclasses
 import math
+import queue
 import socket
 import threading
 import time
@@ -12,35 +14,92 @@ import cv2
 import gpiozero
 import pigpio
 from stationary_controller.mode import Mode
+from tools.agv_logger import get_logger
 from tools.agv_socket import AgvSocket
 from tools.agv_tools import AgvTools
+from tools.chain_streamer import ChainStreamer
+from tools.flow_control import ABORTED, ACCEPTED, EXECUTED, ack_message
+from tools.histogram import RollingHistogram
+from tools.motion_estimator import (
+    DIRECTION_SETTLE_TIME,
+    ROTATE_SETTLE_TIME,
+)
+from tools.motion_profile import STEPS_PER_INCH, MotionProfile
+from tools.wave_cache import WaveCache
+from tools.wire_protocol import MOTION_COMMANDS, CommandFrame, split_sequence
 
 from onboard_controller.agv_command import AgvCommand
+from onboard_controller.differential_drive import (
+    DifferentialMove,
+    plan_route,
+)
+from onboard_controller.frame_grabber import FrameGrabber
+from onboard_controller.hardware import Hardware, create_hardware
+from onboard_controller.instruction_queue import InstructionQueue
 from onboard_controller.instructions import Instruction
 from onboard_controller.pi_bcm_pin_assignment import Pin
+from onboard_controller.qr_worker import QrWorker
+from onboard_controller.route_compiler import (
+    MOVE_PINS,
+    CompiledMove,
+    PinState,
+)
+from onboard_controller.route_upload import RouteUpload
+from onboard_controller.telemetry import TelemetryPublisher, TelemetrySnapshot
 
 MAX_VELOCITY = 2.25
 
 
 class Controller:
-    def __init__(self, server: AgvSocket) -> None:
+    def __init__(self, server: AgvSocket, hardware: Hardware = None) -> None:
+        """Executes the instructions received by the server.
+
+        Args:
+            server (AgvSocket): Server the stationary controller connects to.
+            hardware (Hardware, optional): GPIO and pigpio access. Defaults
+                to None, the backend set by the hardware_backend option.
+        """
+
         self.mode = Mode.Unselected
+        self.log = get_logger("controller")
 
-        self.shared_list: list[str] = []
+        # Sleeps are timed by the hardware, so a simulation can run faster
+        # than real time.
+        self.hardware = hardware or create_hardware(server.config)
+        self.clock = self.hardware.clock
+
+        self.message_queue: queue.Queue[str | CommandFrame] = queue.Queue()
         self.server = server
 
-        self.mutex_shared_list = threading.Lock()
-        self.mutex_instruction = threading.Lock()
-        self.instructions: list[Instruction] = []
+        # Parsing blocks while the queue is full, which holds back the
+        # accepted acknowledgements and so the sender's window.
+        self.instructions = InstructionQueue(
+            maxsize=server.config.instruction_queue_size
+        )
         self.valid_commands = [cmd.value for cmd in AgvCommand]
 
         self.timer_interval = 0.050
+
+        # Step frequencies of each move, accelerating and decelerating
+        # within the limits of the motors.
+        self.motion_profile = MotionProfile.from_config(server.config)
         self.destinations_list: list[str] = []
         self.qr_text = ""
 
+        # The camera is opened once by the QR scanner thread, and each new
+        # frame is decoded into the same buffer.
+        self.frame_grabber: FrameGrabber = None
+        self.qr_detector = cv2.QRCodeDetector()
+        self.qr_frame_id = 0
+        self.qr_frame = None
+
+        # Decodes the frames in a separate process instead, if configured.
+        self.qr_worker: QrWorker = None
+
         # Flags
         self.is_e_stopped = False
         self.is_halted = False
+        self.is_link_lost = False
         self.is_agv_busy = False
         self.is_verifying_orientation = False
         self.is_obstructed = False
@@ -48,10 +107,26 @@ class Controller:
         self.is_right_vos_actuated = False
         self.is_userful_qr_code_scanned = False
 
-        server.start_server(self.shared_list, self.mutex_shared_list)
+        # Instruction being executed, reported through telemetry.
+        self.current_instruction: Instruction = None
+        self.current_expected_pulses = 0
+
+        # Set while the AGV is neither halted, e-stopped nor out of contact.
+        self.motion_allowed = threading.Event()
+        self.motion_allowed.set()
 
         self.MOTORS_GPIO_BCM = Pin.motors.value
 
+        # With differential drive the motors pin steps the left wheel, and
+        # the right wheel has its own, so routes can follow arcs.
+        self.is_differential = server.config.drive_mode == "differential"
+        self.corner_radius = server.config.corner_radius
+        self.RIGHT_MOTOR_GPIO_BCM = Pin.right_motor_step.value
+
+        # Output levels set by the last compiled move, or None once anything
+        # else has driven the outputs.
+        self.pin_state: PinState = None
+
         LDBW_BCM = Pin.left_motor_backward_direction.value
         RDBW_BCM = Pin.right_motor_backward_direction.value
 
@@ -64,26 +139,30 @@ class Controller:
 
         try:
             self.backward_directions = [
-                gpiozero.OutputDevice(pin=LDBW_BCM, active_high=False),
-                gpiozero.OutputDevice(pin=RDBW_BCM),
+                self.hardware.output(pin=LDBW_BCM, active_high=False),
+                self.hardware.output(pin=RDBW_BCM),
             ]
-            self.right_motor_kill_switch = gpiozero.OutputDevice(
+            self.right_motor_kill_switch = self.hardware.output(
                 pin=TOGGLE_RIGHT_MOTOR
             )
-            self.left_motor_kill_switch = gpiozero.OutputDevice(
+            self.left_motor_kill_switch = self.hardware.output(
                 pin=TOGGLE_LEFT_MOTOR
             )
-            self.horizontal_os = gpiozero.InputDevice(pin=HORIZONTAL_OS)
-            self.vertical_right_os = gpiozero.InputDevice(
-                pin=RIGHT_VERTICAL_OS
-            )
-            self.vertical_left_os = gpiozero.InputDevice(pin=LEFT_VERTICAL_OS)
+            self.horizontal_os = self.hardware.input(pin=HORIZONTAL_OS)
+            self.vertical_right_os = self.hardware.input(pin=RIGHT_VERTICAL_OS)
+            self.vertical_left_os = self.hardware.input(pin=LEFT_VERTICAL_OS)
+            self.sensors = {
+                HORIZONTAL_OS: self.horizontal_os,
+                LEFT_VERTICAL_OS: self.vertical_left_os,
+                RIGHT_VERTICAL_OS: self.vertical_right_os,
+            }
         except gpiozero.exc.BadPinFactory:
-            print("GPIOZERO Bad Pin Factory.")
+            # Without the devices the Controller cannot run. The simulated
+            # backend needs no pin factory.
+            self.log.error("gpiozero bad pin factory")
+            raise
 
-        # Note: must first run "sudo pigpiod -t 0 -s 4" in pi terminal. \
-        # The -s 4 option selects sample rate of 4 (rows of the freq table)
-        self.pi = pigpio.pi()
+        self.pi = self.hardware.pi
         self.pi.set_mode(self.MOTORS_GPIO_BCM, pigpio.OUTPUT)
         self.pi.set_pull_up_down(self.MOTORS_GPIO_BCM, pigpio.PUD_UP)
         self.motors_edge_counter = self.pi.callback(
@@ -92,7 +171,55 @@ class Controller:
         self.motors_edge_counter.tally()
         self.motors_edge_counter.reset_tally()
 
-        message_handler = threading.Thread(target=self.shared_list_handler)
+        if self.is_differential:
+            self.pi.set_mode(self.RIGHT_MOTOR_GPIO_BCM, pigpio.OUTPUT)
+            self.pi.set_pull_up_down(self.RIGHT_MOTOR_GPIO_BCM, pigpio.PUD_UP)
+            self.right_edge_counter = self.pi.callback(
+                user_gpio=self.RIGHT_MOTOR_GPIO_BCM
+            )
+
+        # Each frequency level's wave is built once, so moves only chain.
+        self.waves = WaveCache(self.pi, server.config.wave_cache_size)
+
+        # Ramps too long for a single chain are sent in chunks.
+        self.streamer = ChainStreamer(self.pi, self.waves, self.clock)
+
+        # Latest level of each optical sensor by pin.
+        self.sensor_levels = {
+            pin: device.value for pin, device in self.sensors.items()
+        }
+
+        # Sensor edges stop the steps straight from pigpiod's callback
+        # thread, instead of at the flag handler's next poll.
+        self.is_edge_triggered = server.config.sensor_edge_callbacks
+        self.glitch_filter = server.config.sensor_glitch_filter_us
+        self.sensor_callbacks = []
+        if self.is_edge_triggered:
+            for pin in self.sensors:
+                self.pi.set_glitch_filter(pin, self.glitch_filter)
+                self.sensor_callbacks.append(
+                    self.pi.callback(
+                        pin, pigpio.EITHER_EDGE, self.on_sensor_edge
+                    )
+                )
+
+        # Milliseconds from an obstacle's edge to the steps stopping.
+        self.obstacle_latency = RollingHistogram()
+
+        # Counted minus commanded pulses of the last finished move, and the
+        # sizes of recent errors.
+        self.pulse_error = 0
+        self.pulse_errors = RollingHistogram()
+
+        # E-stop and halt bypass the message queue, so the hardware must be
+        # ready before the first message can arrive.
+        server.start_server(
+            self.message_queue,
+            self.handle_control_message,
+            self.handle_link_change,
+        )
+
+        message_handler = threading.Thread(target=self.message_queue_handler)
         inst_handler = threading.Thread(target=self.instruction_handler)
         flag_handler = threading.Thread(target=self.flag_handler)
         qr_code = threading.Thread(target=self.qr_scanner)
@@ -101,12 +228,50 @@ class Controller:
         flag_handler.start()
         # qr_code.start()
 
+        self.telemetry = TelemetryPublisher(
+            server=server,
+            sample=self.telemetry_snapshot,
+            rate_hz=server.config.telemetry_rate_hz,
+        )
+        self.telemetry.start()
+
+    def telemetry_snapshot(self) -> TelemetrySnapshot:
+        inst = self.current_instruction
+        return TelemetrySnapshot(
+            timestamp=time.time(),
+            mode=self.mode.name,
+            command=inst.command if self.is_agv_busy and inst else "",
+            value=inst.value if self.is_agv_busy and inst else 0.0,
+            pulse_count=self.motors_edge_counter.tally(),
+            expected_pulses=self.current_expected_pulses,
+            queue_depth=len(self.instructions),
+            is_agv_busy=self.is_agv_busy,
+            is_obstructed=self.is_obstructed,
+            is_halted=self.is_halted,
+            is_e_stopped=self.is_e_stopped,
+            is_left_vos_actuated=self.is_left_vos_actuated,
+            is_right_vos_actuated=self.is_right_vos_actuated,
+            pulse_error=self.pulse_error,
+        )
+
     def qr_scanner(self):
-        while self.server.connected:
+        config = self.server.config
+        self.frame_grabber = FrameGrabber(
+            self.hardware.camera(config.camera_index),
+            width=config.camera_width,
+            height=config.camera_height,
+            roi=config.camera_roi,
+        )
+        self.frame_grabber.start()
+        if config.qr_worker_process:
+            self.qr_worker = QrWorker(self.frame_grabber)
+            self.qr_worker.start()
+
+        # Each pass decodes the next frame as soon as it arrives.
+        while self.server.running:
             self.qr_text = self.get_string_from_qr_code()
             # self.qr_text = "START START END END"
             if not self.qr_text:
-                time.sleep(self.timer_interval)
                 continue
 
             lst = self.qr_text.split()
@@ -118,85 +283,220 @@ class Controller:
                     self.start_station_name != start_name
                     or self.end_station_name not in end_names
                 ):
-                    print(self.start_station_name, self.end_station_name)
-                    print(start_name, end_names)
-                    print(self.end_station_name not in end_names)
+                    self.log.debug(
+                        "qr code for another route",
+                        route_start=self.start_station_name,
+                        route_end=self.end_station_name,
+                        qr_start=start_name,
+                        qr_ends=end_names,
+                    )
                     self.is_userful_qr_code_scanned = False
-                    time.sleep(self.timer_interval)
                     continue
 
             except AttributeError:
-                time.sleep(self.timer_interval)
                 continue
 
             self.is_userful_qr_code_scanned = True
-            time.sleep(self.timer_interval)
+
+        if self.qr_worker is not None:
+            self.qr_worker.stop()
+        self.frame_grabber.stop()
 
     def flag_handler(self):
-        while self.server.connected:
-            self.is_obstructed = (
-                self.horizontal_os.value == 1 or self.is_halted
-            )
-            self.is_left_vos_actuated = self.vertical_left_os.value == 1
-            self.is_right_vos_actuated = self.vertical_right_os.value == 1
-            time.sleep(self.timer_interval)
-
-    def shared_list_handler(self):
-        while self.server.connected:
-            if not len(self.shared_list) > 0:
-                time.sleep(self.timer_interval)
-                continue
+        while self.server.running:
+            # Without edge callbacks, the sensors are polled here.
+            if not self.is_edge_triggered:
+                for pin, device in self.sensors.items():
+                    self.sensor_levels[pin] = device.value
+
+            self.update_flags()
+            self.clock.sleep(self.timer_interval)
+
+    def update_flags(self) -> None:
+        """Sets the sensor flags from the latest sensor levels, the halt
+        and the link."""
+
+        levels = self.sensor_levels
+        self.is_obstructed = (
+            levels[Pin.horizontal_os.value] == 1
+            or self.is_halted
+            or self.is_link_lost
+        )
+        self.is_left_vos_actuated = levels[Pin.left_vertical_os.value] == 1
+        self.is_right_vos_actuated = levels[Pin.right_vertical_os.value] == 1
+
+    def on_sensor_edge(self, gpio: int, level: int, tick: int) -> None:
+        """Called from pigpiod's callback thread on each sensor edge that
+        outlasts the glitch filter. An obstacle stops the steps at once,
+        and the motion loop then handles it as it would a polled one, from
+        the pulse tally.
+
+        Args:
+            gpio (int): BCM number of the sensor.
+            level (int): The new level, or pigpio.TIMEOUT.
+            tick (int): pigpiod's microsecond tick of the edge.
+        """
+
+        if level == pigpio.TIMEOUT:
+            return
 
-            self.mutex_shared_list.acquire()
-            message = self.shared_list.pop(0)
-            self.mutex_shared_list.release()
+        was_obstructed = self.is_obstructed
+        self.sensor_levels[gpio] = level
+        self.update_flags()
+        if was_obstructed or not self.is_obstructed:
+            return
 
-            instruction = self.parse_message(message)
-            if instruction is None:
+        self.stop_steps()
+
+        # pigpiod timestamps the edge once the glitch filter has passed.
+        micros = pigpio.tickDiff(tick, self.pi.get_current_tick())
+        latency = (micros + self.glitch_filter) / 1000
+        self.obstacle_latency.add(latency)
+        self.log.warning("obstacle stop", latency_ms=round(latency, 1))
+
+    def stop_steps(self) -> None:
+        """Stops transmitting steps at once, keeping the tallies the motion
+        loop resumes from."""
+
+        self.streamer.stop()
+        self.pi.wave_tx_stop()
+
+    def message_queue_handler(self):
+        while self.server.running:
+            # Wakes as soon as a message arrives. The timeout only bounds
+            # how long stopping the server takes to be noticed.
+            try:
+                message = self.message_queue.get(timeout=self.timer_interval)
+            except queue.Empty:
                 continue
 
-            self.add_instruction(instruction)
+            seq, message = split_sequence(message)
+
+            instruction = self.parse_message(message, seq)
+            if instruction is not None:
+                instruction.seq = seq
+                self.add_instruction(instruction)
+
+            if seq:
+                self.server.send_message(ack_message(ACCEPTED, seq))
 
     def add_instruction(self, inst: Instruction) -> None:
-        self.mutex_instruction.acquire()
-        self.instructions.append(inst)
-        self.mutex_instruction.release()
+        self.add_instructions([inst])
 
         # self.server.send_message(str(self.instructions))
 
+    def add_instructions(self, insts: list[Instruction]) -> None:
+        # Read before the e-stop flag, which is set before the queue is
+        # cleared, so an e-stop arriving while the queue is full still
+        # discards these.
+        generation = self.instructions.generation
+
+        # Instructions received while e-stopped are discarded.
+        if self.is_e_stopped:
+            return
+
+        self.instructions.put_many(insts, generation)
+
     def consume_instruction(self) -> Instruction:
-        self.mutex_instruction.acquire()
-        inst = self.instructions.pop(0)
-        self.mutex_instruction.release()
+        return self.instructions.get()
 
-        return inst
+    def update_motion_allowed(self) -> None:
+        if self.is_e_stopped or self.is_halted or self.is_link_lost:
+            self.motion_allowed.clear()
+            return
 
-    def parse_message(self, msg: str) -> Instruction:
-        msg = msg.split()
-        msg = [n.upper() for n in msg]
+        self.motion_allowed.set()
+
+    def handle_control_message(self, msg: "str | CommandFrame") -> None:
+        """Toggles the e-stop or halt. Called directly from the socket's
+        receiving thread, ahead of any queued messages.
+
+        Args:
+            msg (str | CommandFrame): The e-stop or halt message.
+        """
+
+        _, msg = split_sequence(msg)
+        if isinstance(msg, CommandFrame):
+            msg = msg.to_message()
 
-        if msg[0] == AgvCommand.e_stop.value:
+        command = msg.split()[0].upper()
+
+        if command == AgvCommand.e_stop.value:
             if not self.is_e_stopped:
+                # Stop the wave before anything else, including the reply.
+                self.is_e_stopped = True
+                self.update_motion_allowed()
+                self.emergency_stop()
+                self.instructions.clear()
+
                 em = "[EMERGENCY STOP] E-Stopping AGV..."
                 self.server.send_message(em)
-                self.is_e_stopped = True
                 return
 
             em = "[EMERGENCY STOP] Removing E-Stop..."
             self.server.send_message(em)
             self.is_e_stopped = False
+            self.update_motion_allowed()
             return
 
-        if msg[0] == AgvCommand.halt.value:
+        if command == AgvCommand.halt.value:
             if not self.is_halted:
+                # The motion loop stops and keeps the remaining pulses.
+                self.is_halted = True
+                self.is_obstructed = True
+                self.update_motion_allowed()
+
                 em = "[HALT] Halting AGV..."
                 self.server.send_message(em)
-                self.is_halted = True
                 return
 
             em = "[HALT] Removing AGV Halt..."
             self.server.send_message(em)
             self.is_halted = False
+            self.update_motion_allowed()
+            return
+
+    def handle_link_change(self, is_up: bool) -> None:
+        """Halts the AGV while the stationary controller's heartbeats are
+        missing, and lets it continue once they resume. Called from the
+        heartbeat thread.
+
+        Args:
+            is_up (bool): Whether the link was restored or lost.
+        """
+
+        if not is_up:
+            # As with a halt, the motion loop stops the wave and keeps the
+            # remaining pulses.
+            self.log.warning("link lost, halting")
+            self.is_link_lost = True
+            self.is_obstructed = True
+            self.update_motion_allowed()
+            return
+
+        self.log.info("link restored")
+        self.is_link_lost = False
+        self.update_motion_allowed()
+
+    def parse_message(
+        self, msg: "str | CommandFrame", seq: int = 0
+    ) -> Instruction:
+        # Binary protocol commands arrive already validated.
+        if isinstance(msg, CommandFrame):
+            if msg.command in MOTION_COMMANDS:
+                return Instruction(command=msg.command.value, value=msg.value)
+
+            msg = msg.to_message()
+
+        if msg.startswith(AgvCommand.upload_route.value):
+            self.load_route(msg, seq)
+            return
+
+        msg = msg.split()
+        msg = [n.upper() for n in msg]
+
+        if msg[0] in [AgvCommand.e_stop.value, AgvCommand.halt.value]:
+            self.handle_control_message(msg[0])
             return
 
         if msg[0] == AgvCommand.traverse_route.value:
@@ -242,89 +542,152 @@ class Controller:
         inst = Instruction(command=msg[0], value=float(msg[1]))
         return inst
 
-    def instruction_handler(self):
-        was_e_stopped = False
-        while self.server.connected:
-            if not len(self.instructions) > 0:
-                time.sleep(self.timer_interval)
-                continue
+    def load_route(self, msg: str, seq: int = 0) -> None:
+        try:
+            route = RouteUpload.from_message(msg)
+        except ValueError as e:
+            em = f"[INVALID ROUTE] {e}"
+            self.server.send_message(em)
+            return
 
-            if self.is_halted:
-                time.sleep(self.timer_interval)
-                continue
+        # Station names are compared against upper-cased QR code text.
+        self.start_station_name = route.start_name.upper()
+        self.end_station_name = route.end_name.upper()
 
-            self.mutex_shared_list.acquire()
-            if self.is_e_stopped:
-                self.instructions = []
-                was_e_stopped = True
-            else:
-                inst = self.instructions.pop(0)
-            self.mutex_shared_list.release()
+        if self.is_e_stopped:
+            em = "[INVALID ROUTE] AGV is e-stopped."
+            self.server.send_message(em)
+            return
+
+        # The route counts as executed once its last instruction is.
+        if route.instructions:
+            route.instructions[-1].seq = seq
+
+        plan = self.plan_route(route.instructions)
+
+        # Build every wave of the route before its first move.
+        for inst in plan:
+            if isinstance(inst, DifferentialMove):
+                for block, _ in inst.blocks:
+                    self.waves.get_block(
+                        self.MOTORS_GPIO_BCM, self.RIGHT_MOTOR_GPIO_BCM, block
+                    )
+            elif isinstance(inst, CompiledMove):
+                for frequency, _ in inst.ramp:
+                    self.waves.get(self.MOTORS_GPIO_BCM, frequency)
+
+        # Enqueue the whole route at once so nothing can land mid-route.
+        self.add_instructions(plan)
+
+        em = (
+            f"[ROUTE LOADED] {route.route_name}: "
+            f"{len(route.instructions)} instructions in {len(plan)} moves, "
+            f"checksum {route.checksum()}."
+        )
+        self.server.send_message(em)
+
+    def plan_route(self, instructions: list[Instruction]) -> list[Instruction]:
+        """Compiles instructions for the drive_mode option's drive."""
+
+        return plan_route(
+            instructions,
+            self.motion_profile,
+            self.server.config.drive_mode,
+            self.corner_radius,
+        )
 
-            while self.is_agv_busy and self.server.connected:
-                time.sleep(self.timer_interval)
+    def instruction_handler(self):
+        while self.server.running:
+            # Halting pauses execution but keeps the queued instructions.
+            if not self.motion_allowed.wait(timeout=self.timer_interval):
                 continue
 
-            while self.is_e_stopped and self.server.connected:
-                time.sleep(self.timer_interval)
+            inst = self.instructions.get(timeout=self.timer_interval)
+            if inst is None:
                 continue
 
-            if was_e_stopped:
-                was_e_stopped = False
+            # The AGV may have been e-stopped or halted while waiting.
+            if not self.motion_allowed.is_set():
+                if not self.is_e_stopped:
+                    self.instructions.put_front(inst)
                 continue
 
-            self.execute_instruction(inst)
+            # Single moves need both wheels' step trains as well.
+            if self.is_differential and not isinstance(inst, CompiledMove):
+                if inst.command in MOVE_PINS:
+                    plan = self.plan_route([inst])
+                    inst = plan[0] if plan else inst
+
+            if isinstance(inst, DifferentialMove):
+                is_finished = self.execute_path(inst)
+            elif isinstance(inst, CompiledMove):
+                is_finished = self.execute_move(inst)
+            else:
+                is_finished = self.execute_instruction(inst)
+
+            # Moves cut short are not acknowledged as executed.
+            if inst.seq:
+                kind = EXECUTED if is_finished else ABORTED
+                self.server.send_message(ack_message(kind, inst.seq))
 
     def execute_instruction(
         self,
         instruction: Instruction,
         remain_pulse: int = -1,
         is_orienting=False,
-    ):
-        if not is_orienting:
-            self.is_agv_busy = True
+    ) -> bool:
+        """Executes a single instruction outside of a compiled route.
+
+        Returns:
+            bool: Whether the instruction was carried out in full, rather
+                than cut short by an e-stop or the server stopping.
+        """
 
         command = instruction.command
         value = instruction.value
 
+        # With differential drive each wheel has its own step train, so the
+        # moves of a search are compiled as single moves are.
+        if self.is_differential and command in MOVE_PINS:
+            if remain_pulse != -1:
+                value = remain_pulse / STEPS_PER_INCH
+
+            plan = self.plan_route([Instruction(command, value)])
+            if not plan:
+                return True
+
+            return self.execute_path(plan[0], is_orienting)
+
+        is_finished = True
+        if not is_orienting:
+            self.is_agv_busy = True
+            self.current_instruction = instruction
+
         expected_pulse_count = (
             AgvTools.calc_pulse_num_from_dist(inches=value)
             if remain_pulse == -1
             else remain_pulse
         )
+        self.current_expected_pulses = expected_pulse_count
 
         if command in [
             AgvCommand.forward.value,
             AgvCommand.backward.value,
         ]:
-            if command == AgvCommand.forward.value:
-                for dir in self.backward_directions:
-                    dir.off()
-                    time.sleep(0.050)
-            else:
-                for dir in self.backward_directions:
-                    dir.on()
-                    time.sleep(0.050)
+            self.apply_pins(MOVE_PINS[command])
 
-            self.right_motor_kill_switch.off()
-            self.left_motor_kill_switch.off()
+            ramp_inputs = self.motion_profile.ramp(expected_pulse_count)
+            self.streamer.start(pin=self.MOTORS_GPIO_BCM, ramp=ramp_inputs)
+
+            is_finished = False
+            while self.is_agv_busy and self.server.running:
+                cur_pulse_count = self.motors_edge_counter.tally()
 
-            ramp_inputs = (
-                AgvTools.create_ramp_inputs(inches=value)
-                if remain_pulse == -1
-                else AgvTools.create_ramp_inputs(
-                    inches=0, remain_pulse=remain_pulse
+                # Stopped by a sensor edge that may already have cleared.
+                is_interrupted = (
+                    not self.streamer.is_busy and not self.streamer.is_finished
                 )
-            )
-            AgvTools.generate_ramp(
-                pi=self.pi,
-                ramp=ramp_inputs,
-                motor_pin=self.MOTORS_GPIO_BCM,
-                clear_waves=True,
-            )
 
-            while self.is_agv_busy and self.server.connected:
-                cur_pulse_count = self.motors_edge_counter.tally()
                 if self.is_e_stopped:
                     self.emergency_stop()
                     break
@@ -335,124 +698,377 @@ class Controller:
                     is_found = self.simple_search()
                     if is_found:
                         self.is_userful_qr_code_scanned = False
-                    print("FOUND THE MARKERS. Resuming now...")
+                    self.log.info("found markers, resuming")
                     inst = Instruction(command=command, value=0)
-                    self.execute_instruction(
+                    is_finished = self.execute_instruction(
                         inst, remaining_pulses, is_orienting=True
                     )
                     break
 
-                elif self.is_obstructed and not is_orienting:
+                elif self.is_obstructed or is_interrupted:
+                    # Orienting moves resume as well, so a search is not cut
+                    # short. Stop first so the tally is final.
+                    self.stop_steps()
+                    cur_pulse_count = self.motors_edge_counter.tally()
                     self.emergency_stop()
                     remaining_pulses = expected_pulse_count - cur_pulse_count
 
                     while self.is_obstructed or self.is_e_stopped:
-                        time.sleep(self.timer_interval)
+                        self.clock.sleep(self.timer_interval)
                         continue
 
                     inst = Instruction(command=command, value=0)
 
-                    self.execute_instruction(inst, remaining_pulses)
+                    is_finished = self.execute_instruction(
+                        inst, remaining_pulses, is_orienting
+                    )
                     break
 
-                diff = abs(expected_pulse_count - cur_pulse_count)
-                if not self.is_e_stopped and diff > 11:
-                    time.sleep(self.timer_interval)
-                    continue
-                break
+                if self.streamer.is_finished:
+                    self.report_pulse_error(
+                        expected_pulse_count, self.motors_edge_counter.tally()
+                    )
+                    is_finished = True
+                    break
+
+                # Wakes the moment the last chunk finishes or is stopped.
+                self.clock.wait(self.streamer.done, self.timer_interval)
 
             if not is_orienting:
                 self.is_agv_busy = False
 
             self.motors_edge_counter.reset_tally()
-            return
+            return is_finished
 
         elif command in [
             AgvCommand.rotate_cw.value,
             AgvCommand.rotate_ccw.value,
         ]:
-            if not is_orienting:
-                if command == AgvCommand.rotate_cw.value:
-                    self.right_motor_kill_switch.on()
-                    self.left_motor_kill_switch.off()
+            dist = AgvTools.calc_arc_length(angle=value)
+            pulse_num = AgvTools.calc_pulse_num_from_dist(inches=dist)
+            self.current_expected_pulses = pulse_num
+
+            remaining_pulses = pulse_num
+            counted = 0
+            is_finished = False
+            while self.server.running:
+                self.pin_state = None
+                if not is_orienting:
+                    if command == AgvCommand.rotate_cw.value:
+                        self.right_motor_kill_switch.on()
+                        self.left_motor_kill_switch.off()
+                    else:
+                        self.right_motor_kill_switch.off()
+                        self.left_motor_kill_switch.on()
+
+                    for dir in self.backward_directions:
+                        dir.off()
+                        self.clock.sleep(0.050)
                 else:
                     self.right_motor_kill_switch.off()
-                    self.left_motor_kill_switch.on()
+                    self.left_motor_kill_switch.off()
 
-                for dir in self.backward_directions:
-                    dir.off()
-                    time.sleep(0.050)
-            else:
-                self.right_motor_kill_switch.off()
-                self.left_motor_kill_switch.off()
+                    if command == AgvCommand.rotate_cw.value:
+                        self.backward_directions[0].off()
+                        self.backward_directions[1].on()
+                    else:
+                        self.backward_directions[0].on()
+                        self.backward_directions[1].off()
 
-                if command == AgvCommand.rotate_cw.value:
-                    self.backward_directions[0].off()
-                    self.backward_directions[1].on()
-                else:
-                    self.backward_directions[0].on()
-                    self.backward_directions[1].off()
+                ramp_inputs = self.motion_profile.ramp(remaining_pulses)
+                self.motors_edge_counter.reset_tally()
+                self.streamer.start(pin=self.MOTORS_GPIO_BCM, ramp=ramp_inputs)
 
-            dist = AgvTools.calc_arc_length(angle=value)
-            ramp_inputs = AgvTools.create_ramp_inputs(inches=dist)
+                if self.wait_for_move():
+                    counted += self.motors_edge_counter.tally()
+                    is_finished = True
+                    break
 
-            AgvTools.generate_ramp(
-                pi=self.pi,
-                ramp=ramp_inputs,
-                motor_pin=self.MOTORS_GPIO_BCM,
-                clear_waves=True,
-            )
+                # Stop first so the tally is final.
+                self.stop_steps()
+                steps = self.motors_edge_counter.tally()
+                counted += steps
+                if self.is_e_stopped or not self.server.running:
+                    break
 
-            wait_time = 0
-            for ri in ramp_inputs:
-                frequency = ri[0]
-                steps = ri[1]
+                # Stopped by an obstacle, so turn the rest of the way once
+                # it clears.
+                self.emergency_stop()
+                while self.is_obstructed or self.is_e_stopped:
+                    self.clock.sleep(self.timer_interval)
 
-                wait_time += steps * (1 / frequency)
+                remaining_pulses -= steps
+                if remaining_pulses <= 0:
+                    is_finished = True
+                    break
 
-            time.sleep(wait_time + 0.050)
+            self.report_pulse_error(pulse_num, counted)
+            if is_finished:
+                # Released as soon as the ramp has finished and settled.
+                self.clock.sleep(ROTATE_SETTLE_TIME)
+            else:
+                self.log.warning(
+                    "rotation aborted", counted=counted, commanded=pulse_num
+                )
+                if self.is_e_stopped:
+                    self.emergency_stop()
 
             self.right_motor_kill_switch.off()
             self.left_motor_kill_switch.off()
             self.motors_edge_counter.reset_tally()
             if not is_orienting:
                 self.is_agv_busy = False
-            return
+            return is_finished
 
         elif command == AgvCommand.calibrate_home.value:
             pass
 
+        return is_finished
+
+    def execute_move(self, move: CompiledMove) -> bool:
+        """Executes a move of a compiled route. The outputs are only changed
+        where they differ from the previous move, and the precomputed ramp
+        is transmitted at once. An obstruction stops the move until it
+        clears, after which the remaining steps are ramped again.
+
+        Args:
+            move (CompiledMove): The move.
+
+        Returns:
+            bool: Whether the move was finished, rather than cut short by an
+                e-stop or the server stopping.
+        """
+
+        self.is_agv_busy = True
+        self.current_instruction = move
+        self.current_expected_pulses = move.pulse_num
+
+        pulse_num = move.pulse_num
+        ramp = move.ramp
+        counted = 0
+        is_finished = False
+        while self.server.running:
+            self.apply_pins(move.pins)
+            self.motors_edge_counter.reset_tally()
+            self.streamer.start(pin=self.MOTORS_GPIO_BCM, ramp=ramp)
+
+            if self.wait_for_move():
+                counted += self.motors_edge_counter.tally()
+                self.report_pulse_error(move.pulse_num, counted)
+                is_finished = True
+                break
+
+            if self.is_e_stopped or not self.server.running:
+                break
+
+            # Stop first so the tally is final.
+            self.stop_steps()
+            steps = self.motors_edge_counter.tally()
+            counted += steps
+            self.emergency_stop()
+            while self.is_obstructed or self.is_e_stopped:
+                self.clock.sleep(self.timer_interval)
+
+            pulse_num -= steps
+            if pulse_num <= 0:
+                is_finished = True
+                break
+
+            ramp = self.motion_profile.ramp(pulse_num)
+
+        if self.is_e_stopped:
+            self.emergency_stop()
+        elif move.release:
+            self.apply_pins(
+                dataclasses.replace(
+                    move.pins, right_kill=False, left_kill=False
+                )
+            )
+
+        self.motors_edge_counter.reset_tally()
+        self.is_agv_busy = False
+        return is_finished
+
+    def execute_path(
+        self, move: DifferentialMove, is_orienting: bool = False
+    ) -> bool:
+        """Executes a differential drive move, transmitting the steps of
+        both wheels together. An obstruction stops the move until it
+        clears, after which the rest of the path is ramped again.
+
+        Args:
+            move (DifferentialMove): The move.
+            is_orienting (bool, optional): Whether the move is part of a
+                search for markers, which leaves the instruction being
+                executed as it is. Defaults to False.
+
+        Returns:
+            bool: Whether the move was finished, rather than cut short by an
+                e-stop or the server stopping.
+        """
+
+        if not is_orienting:
+            self.is_agv_busy = True
+            self.current_instruction = move
+        self.current_expected_pulses = move.left_steps
+
+        path = move
+        counted = 0
+        is_finished = False
+        while self.server.running and path is not None:
+            self.apply_pins(path.pins)
+            self.motors_edge_counter.reset_tally()
+            self.right_edge_counter.reset_tally()
+            self.streamer.start_blocks(
+                left_pin=self.MOTORS_GPIO_BCM,
+                right_pin=self.RIGHT_MOTOR_GPIO_BCM,
+                plan=path.blocks,
+            )
+
+            is_finished = self.wait_for_move()
+            if not is_finished:
+                # Stop first so the tallies are final.
+                self.stop_steps()
+
+            wheel_steps = (
+                self.motors_edge_counter.tally()
+                + self.right_edge_counter.tally()
+            )
+            counted += wheel_steps
+            if is_finished:
+                commanded = move.left_steps + move.right_steps
+                self.report_pulse_error(commanded, counted)
+                break
+
+            if self.is_e_stopped or not self.server.running:
+                break
+
+            self.emergency_stop()
+            while self.is_obstructed or self.is_e_stopped:
+                self.clock.sleep(self.timer_interval)
+
+            path = path.resume(wheel_steps, self.motion_profile)
+            is_finished = path is None
+
+        if self.is_e_stopped:
+            self.emergency_stop()
+
+        self.motors_edge_counter.reset_tally()
+        if not is_orienting:
+            self.is_agv_busy = False
+        return is_finished
+
+    def wait_for_move(self) -> bool:
+        """Waits until the ramp finishes, or is stopped, or the AGV is
+        e-stopped or obstructed. Wakes as soon as the streamer finishes
+        its last chunk, so the next move follows without a gap.
+
+        Returns:
+            bool: Whether the whole ramp was transmitted.
+        """
+
+        while self.server.running:
+            if self.streamer.is_finished:
+                return True
+
+            if self.is_e_stopped or self.is_obstructed:
+                break
+
+            if not self.streamer.is_busy:
+                break
+
+            self.clock.wait(self.streamer.done, self.timer_interval)
+
+        return self.streamer.is_finished
+
+    def report_pulse_error(self, commanded: int, counted: int) -> None:
+        """Records the pulses counted for a finished move against those
+        commanded. The error is published through telemetry.
+
+        Args:
+            commanded (int): Pulses the move was to transmit.
+            counted (int): Rising edges counted on the step pins.
+        """
+
+        self.pulse_error = counted - commanded
+        self.pulse_errors.add(abs(self.pulse_error))
+        self.log.info(
+            "pulse error",
+            commanded=commanded,
+            counted=counted,
+            error=self.pulse_error,
+        )
+
+    def apply_pins(self, pins: PinState) -> None:
+        """Drives the direction and kill switch outputs, waiting for the
+        drivers only if a direction changed.
+
+        Args:
+            pins (PinState): The output levels.
+        """
+
+        if pins == self.pin_state:
+            return
+
+        left_direction, right_direction = self.backward_directions
+        for device, is_on in [
+            (left_direction, pins.left_backward),
+            (right_direction, pins.right_backward),
+            (self.right_motor_kill_switch, pins.right_kill),
+            (self.left_motor_kill_switch, pins.left_kill),
+        ]:
+            if is_on:
+                device.on()
+            else:
+                device.off()
+
+        previous = self.pin_state
+        if previous is None or pins.directions != previous.directions:
+            self.clock.sleep(DIRECTION_SETTLE_TIME)
+
+        self.pin_state = pins
+
     def emergency_stop(self):
         # stop everything, then clear instruction list.
-        AgvTools.wave_clear(pi=self.pi, motor=self.MOTORS_GPIO_BCM)
+        self.streamer.stop()
+        AgvTools.wave_clear(
+            pi=self.pi, motor=self.MOTORS_GPIO_BCM, waves=self.waves
+        )
         self.motors_edge_counter.reset_tally()
         self.left_motor_kill_switch.off()
         self.right_motor_kill_switch.off()
         for dir in self.backward_directions:
             dir.off()
+        self.pin_state = None
         return
 
     def run_auto(self):
         pass
 
-    def get_string_from_qr_code(self):
-        cap = cv2.VideoCapture(0)
-        cap.set(3, 640)  # Set horizontal resolution
-        cap.set(4, 640)  # Set vertical resolution
-        # initialize the cv2 QRCode detector
-        detector = cv2.QRCodeDetector()
-        while self.server.connected:
-            _, img = cap.read()
-            data, bbox, _ = detector.detectAndDecode(img)
-            if data:
-                a = data
-                break
-            if cv2.waitKey(1) == ord("q"):
-                break
-        text = str(a)
-        cap.release()
-        cv2.destroyAllWindows()
-        return text.upper()
+    def get_string_from_qr_code(self) -> str:
+        """Decodes the QR code in the camera's next frame, or takes the
+        next result of the QR worker process.
+
+        Returns:
+            str: The upper-cased text, or an empty string if the frame has
+                no code or none arrived within the timer interval.
+        """
+
+        if self.qr_worker is not None:
+            result = self.qr_worker.result(timeout=self.timer_interval)
+            return result.text if result is not None else ""
+
+        frame_id, frame = self.frame_grabber.read(
+            after=self.qr_frame_id,
+            out=self.qr_frame,
+            timeout=self.timer_interval,
+        )
+        if frame is None:
+            return ""
+
+        self.qr_frame_id, self.qr_frame = frame_id, frame
+        data, _, _ = self.qr_detector.detectAndDecode(frame)
+        return data.upper()
 
     def simple_search(self):
         if (
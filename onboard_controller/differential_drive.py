@@ -0,0 +1,373 @@
+"""
+File:       onboard_controller/differential_drive.py
+Author:     Ali Karimiafshar
+"""
+
+import dataclasses
+import math
+from dataclasses import dataclass, field
+from fractions import Fraction
+
+from tools.agv_tools import TURN_RADIUS
+from tools.motion_profile import STEPS_PER_INCH, MotionProfile
+
+from onboard_controller.agv_command import AgvCommand
+from onboard_controller.instructions import Instruction
+from onboard_controller.route_compiler import (
+    MOVE_PINS,
+    CompiledMove,
+    PinState,
+    compile_route,
+)
+
+# unit: inches
+# The shared drive pivots about one wheel at the turn radius, so that is
+# the distance between the wheels.
+WHEEL_TRACK = TURN_RADIUS
+
+# Most centre steps per block. Arc radii are rounded so that both wheels
+# take a whole number of steps per block, which keeps every arc exact.
+MAX_BLOCK_STEPS = 16
+
+# Spins turn the wheels in opposite directions about the centre.
+SPIN_PINS: dict[str, PinState] = {
+    AgvCommand.rotate_cw.value: PinState(right_backward=True),
+    AgvCommand.rotate_ccw.value: PinState(left_backward=True),
+}
+
+
+@dataclass(frozen=True)
+class Piece:
+    """Part of a path: a straight if turn is 0, a spin in place if length
+    is 0, and otherwise an arc.
+
+    Attributes:
+        length (float): Distance travelled by the centre, in inches.
+        turn (float): Change of heading in degrees, positive counter
+            clockwise.
+        ratio (Fraction): How much faster the left wheel and slower the
+            right wheel turn than the centre moves, as a fraction of its
+            speed. Positive for clockwise arcs.
+    """
+
+    length: float
+    turn: float = 0.0
+    ratio: Fraction = Fraction(0)
+
+    @property
+    def travel(self) -> float:
+        """Inches the piece's steps are counted in: of the centre, or of
+        each wheel for a spin."""
+
+        if self.length:
+            return self.length
+
+        return WHEEL_TRACK / 2 * math.radians(abs(self.turn))
+
+    @property
+    def block_steps(self) -> int:
+        return self.ratio.denominator
+
+    @property
+    def blocks(self) -> int:
+        return round(self.travel * STEPS_PER_INCH / self.block_steps)
+
+    @property
+    def steps(self) -> int:
+        return self.blocks * self.block_steps
+
+    def block(self, frequency: int) -> tuple[int, int, int, int]:
+        """The frequency, steps, left steps and right steps of a block of
+        the piece, as in wave_cache.block_wave."""
+
+        steps = self.block_steps
+        left = (1 + self.ratio) * steps
+        right = (1 - self.ratio) * steps
+        return frequency, steps, int(left), int(right)
+
+    def trimmed(self, fraction: float) -> "Piece":
+        """The last fraction of the piece, on the same circle."""
+
+        return Piece(self.length * fraction, self.turn * fraction, self.ratio)
+
+
+@dataclass
+class DifferentialMove(CompiledMove):
+    """A path of straights, arcs or a spin driven with separate step trains
+    for each wheel, as one continuous ramp of the path's centre.
+
+    Attributes:
+        pieces (list[Piece]): The path.
+        plan (list[tuple[int, tuple[int, int, int, int], int]]): Index of
+            the piece, block and repeat count of each chain segment.
+        left_steps (int): Steps of the left wheel.
+        right_steps (int): Steps of the right wheel.
+    """
+
+    pieces: list[Piece] = field(default_factory=list)
+    plan: list = field(default_factory=list)
+    left_steps: int = 0
+    right_steps: int = 0
+
+    @property
+    def blocks(self) -> list[tuple[tuple[int, int, int, int], int]]:
+        """Each block of the plan and its repeat count, for
+        ChainStreamer.start_blocks."""
+
+        return [(block, count) for _, block, count in self.plan]
+
+    def resume(
+        self, wheel_steps: int, profile: MotionProfile
+    ) -> "DifferentialMove | None":
+        """The rest of the path after an interruption, ramped from rest.
+
+        Args:
+            wheel_steps (int): Steps of both wheels together so far.
+            profile (MotionProfile): Profile of the AGV's moves.
+
+        Returns:
+            DifferentialMove | None: The remaining move, or None if the
+                path is finished.
+        """
+
+        done = [0] * len(self.pieces)
+        for index, (_, steps, left, right), count in self.plan:
+            blocks = min(count, wheel_steps // (left + right))
+            done[index] += blocks * steps
+            wheel_steps -= blocks * (left + right)
+            if blocks < count:
+                break
+
+        pieces = []
+        for piece, steps in zip(self.pieces, done):
+            if steps < piece.steps:
+                pieces.append(piece.trimmed(1 - steps / piece.steps))
+
+        if not pieces:
+            return None
+
+        move = dataclasses.replace(self, pieces=pieces)
+        plan_path(move, profile)
+        return move
+
+
+def fillet(
+    before: float, after: float, turn: float, radius: float
+) -> "tuple[Piece, float] | None":
+    """The arc of a rounded corner between two straights.
+
+    Args:
+        before (float): Length of the straight before the corner.
+        after (float): Length of the straight after the corner.
+        turn (float): Change of heading in degrees, positive counter
+            clockwise.
+        radius (float): Largest radius of the arc. Shortened to fit the
+            straights, and to a block of at most MAX_BLOCK_STEPS.
+
+    Returns:
+        tuple[Piece, float] | None: The arc and the length it takes from
+            each straight, or None if the corner is too sharp to round
+            without a wheel turning backward.
+    """
+
+    angle = math.radians(abs(turn))
+    if angle >= math.pi:
+        return None
+
+    tangent = math.tan(angle / 2)
+    radius = min(radius, before / tangent, after / tangent)
+    if radius < WHEEL_TRACK / 2:
+        return None
+
+    # Round the wheel speed offset up, so the radius only shrinks.
+    offset = WHEEL_TRACK / (2 * radius)
+    ratio = min(
+        Fraction(math.ceil(offset * steps - 1e-9), steps)
+        for steps in range(1, MAX_BLOCK_STEPS + 1)
+    )
+    radius = WHEEL_TRACK / (2 * ratio)
+
+    arc = Piece(radius * angle, turn, ratio if turn < 0 else -ratio)
+    return arc, radius * tangent
+
+
+def plan_path(move: DifferentialMove, profile: MotionProfile) -> None:
+    """Ramps a move's path and splits the ramp into blocks of its pieces.
+    Arcs are slowed so that the outer wheel stays within the profile's
+    maximum velocity.
+
+    Args:
+        move (DifferentialMove): The move, whose pieces are planned.
+        profile (MotionProfile): Profile of the AGV's moves.
+    """
+
+    move.pulse_num = sum(piece.steps for piece in move.pieces)
+    move.ramp = profile.ramp(move.pulse_num)
+    max_frequency = profile.max_velocity * STEPS_PER_INCH
+
+    levels = iter(move.ramp)
+    frequency, remaining = 0, 0
+    plan = []
+    for index, piece in enumerate(move.pieces):
+        steps = piece.block_steps
+        blocks = piece.blocks
+        limit = int(max_frequency / (1 + abs(piece.ratio)))
+        while blocks > 0:
+            # A block straddling two levels is borrowed from the next one.
+            while remaining <= 0:
+                frequency, level_steps = next(levels, (frequency, math.inf))
+                remaining += level_steps
+
+            count = min(blocks, max(1, int(remaining // steps)))
+            block = piece.block(min(frequency, limit))
+            if plan and plan[-1][:2] == (index, block):
+                plan[-1] = (index, block, plan[-1][2] + count)
+            else:
+                plan.append((index, block, count))
+
+            blocks -= count
+            remaining -= count * steps
+
+    move.plan = plan
+    move.left_steps = sum(block[2] * count for _, block, count in plan)
+    move.right_steps = sum(block[3] * count for _, block, count in plan)
+
+
+def compile_differential_route(
+    instructions: list[Instruction],
+    profile: MotionProfile,
+    corner_radius: float,
+) -> list[Instruction]:
+    """Compiles a route for differential drive. Forward moves joined by
+    rotations become a single path whose corners are rounded into arcs, so
+    the AGV drives through them without stopping. Rotations that cannot be
+    rounded spin in place. Instructions that do not move are kept as they
+    are.
+
+    Args:
+        instructions (list[Instruction]): The route.
+        profile (MotionProfile): Profile of the AGV's moves.
+        corner_radius (float): Largest radius of a rounded corner, in
+            inches.
+
+    Returns:
+        list[Instruction]: The DifferentialMove and other instructions to
+            execute in order. Each keeps the sequence number of the last
+            instruction it covers.
+    """
+
+    # Consecutive instructions moving the same way are merged first.
+    merged: list[Instruction] = []
+    for inst in instructions:
+        last = merged[-1] if merged else None
+        if inst.command not in MOVE_PINS:
+            merged.append(inst)
+        elif inst.value <= 0:
+            # Nothing to move, but its acknowledgement is still owed.
+            if inst.seq and last is not None:
+                last.seq = inst.seq
+            elif inst.seq:
+                merged.append(inst)
+        elif isinstance(last, DifferentialMove) and (
+            last.command == inst.command
+        ):
+            last.value += inst.value
+            last.seq = inst.seq or last.seq
+            last.sources.append(inst)
+        else:
+            merged.append(
+                DifferentialMove(
+                    command=inst.command,
+                    value=inst.value,
+                    seq=inst.seq,
+                    sources=[inst],
+                )
+            )
+
+    output: list[Instruction] = []
+    trim = 0.0
+    for i, inst in enumerate(merged):
+        if not isinstance(inst, DifferentialMove):
+            output.append(inst)
+            continue
+
+        last = output[-1] if output else None
+        is_path = (
+            isinstance(last, DifferentialMove)
+            and last.command == AgvCommand.forward.value
+        )
+
+        if inst.command in SPIN_PINS:
+            turn = inst.value
+            if inst.command == AgvCommand.rotate_cw.value:
+                turn = -turn
+
+            after = merged[i + 1] if i + 1 < len(merged) else None
+            arc = None
+            if (
+                is_path
+                and isinstance(after, DifferentialMove)
+                and after.command == AgvCommand.forward.value
+            ):
+                before = last.pieces[-1].length
+                arc = fillet(before, after.value, turn, corner_radius)
+
+            if arc is not None:
+                piece, trim = arc
+                last.pieces[-1] = Piece(last.pieces[-1].length - trim)
+                last.pieces.append(piece)
+                last.seq = inst.seq or last.seq
+                last.sources += inst.sources
+                continue
+
+            inst.pins = SPIN_PINS[inst.command]
+            inst.pieces = [Piece(0.0, turn)]
+            output.append(inst)
+            continue
+
+        if inst.command == AgvCommand.forward.value and is_path and trim:
+            # Continue the path after its rounded corner.
+            last.pieces.append(Piece(inst.value - trim))
+            last.value += inst.value
+            last.seq = inst.seq or last.seq
+            last.sources += inst.sources
+            trim = 0.0
+            continue
+
+        inst.pins = MOVE_PINS[inst.command]
+        inst.pieces = [Piece(inst.value)]
+        output.append(inst)
+
+    moves = [inst for inst in output if isinstance(inst, DifferentialMove)]
+    for move in moves:
+        move.pieces = [piece for piece in move.pieces if piece.steps]
+        plan_path(move, profile)
+
+    return output
+
+
+def plan_route(
+    instructions: list[Instruction],
+    profile: MotionProfile,
+    drive_mode: str,
+    corner_radius: float,
+) -> list[Instruction]:
+    """Compiles a route for the drive_mode option's drive, "shared" or
+    "differential", as the Controller executes it.
+
+    Args:
+        instructions (list[Instruction]): The route.
+        profile (MotionProfile): Profile of the AGV's moves.
+        drive_mode (str): The drive_mode option.
+        corner_radius (float): Largest radius of a rounded corner, in
+            inches, with differential drive.
+
+    Returns:
+        list[Instruction]: The compiled moves and other instructions to
+            execute in order.
+    """
+
+    if drive_mode == "differential":
+        return compile_differential_route(instructions, profile, corner_radius)
+
+    return compile_route(instructions, profile)
@@ -0,0 +1,137 @@
+"""
+File:       onboard_controller/frame_grabber.py
+Author:     Ali Karimiafshar
+"""
+
+import threading
+
+import cv2
+import numpy as np
+
+# unit: seconds
+# Wait before retrying after the camera fails to deliver a frame.
+RETRY_DELAY = 0.1
+
+
+class FrameGrabber:
+    def __init__(
+        self,
+        capture,
+        width: int = 640,
+        height: int = 480,
+        roi: "tuple[int, int, int, int] | None" = None,
+    ) -> None:
+        """Keeps a camera open and reads its frames on a thread of its own,
+        so a reader always gets the latest frame without opening the camera
+        or waiting through frames queued by the driver. Frames are read
+        into two buffers, allocated with the first frames and swapped as
+        each one arrives, and readers copy out only the region of interest.
+
+        Args:
+            capture: An opened cv2.VideoCapture, or an object with the same
+                read, set and release methods.
+            width (int, optional): Requested frame width. Defaults to 640.
+            height (int, optional): Requested frame height. Defaults to 480.
+            roi (tuple[int, int, int, int] | None, optional): x, y, width
+                and height of the part of each frame returned. Defaults to
+                None, the whole frame.
+        """
+
+        self.capture = capture
+        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+        # Keep the driver from queueing stale frames where it can.
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        self.roi = roi
+
+        # The latest frame, and the buffer the next one is read into. Their
+        # size is that of the first frame, as cameras may not support the
+        # requested resolution.
+        self.front: np.ndarray = None
+        self.back: np.ndarray = None
+
+        # Frames read so far, and failed reads.
+        self.frame_id = 0
+        self.failures = 0
+
+        self.thread: threading.Thread = None
+        self.stopped = threading.Event()
+        self.mutex = threading.Lock()
+        self.condition = threading.Condition(self.mutex)
+
+    def start(self) -> None:
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.grab, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stops reading frames and releases the camera."""
+
+        self.stopped.set()
+        with self.condition:
+            self.condition.notify_all()
+
+        if self.thread is not None:
+            self.thread.join()
+
+        self.capture.release()
+
+    def grab(self) -> None:
+        while not self.stopped.is_set():
+            ok, frame = self.capture.read(self.back)
+            if not ok:
+                self.failures += 1
+                self.stopped.wait(RETRY_DELAY)
+                continue
+
+            # read allocates a new array until both buffers exist, or if
+            # the buffer does not fit the frame.
+            with self.condition:
+                self.back = self.front
+                self.front = frame
+                self.frame_id += 1
+                self.condition.notify_all()
+
+    def crop(self, frame: np.ndarray) -> np.ndarray:
+        if self.roi is None:
+            return frame
+
+        x, y, w, h = self.roi
+        return frame[y : y + h, x : x + w]
+
+    def read(
+        self, after: int = 0, out: np.ndarray = None, timeout: float = None
+    ) -> tuple[int, "np.ndarray | None"]:
+        """Waits for a frame newer than after and copies its region of
+        interest.
+
+        Args:
+            after (int, optional): Id of the last frame the caller has
+                seen. Defaults to 0, any frame.
+            out (np.ndarray, optional): Buffer reused for the copy, which
+                must match the region of interest. Defaults to None, a new
+                array.
+            timeout (float, optional): Most seconds to wait. Defaults to
+                None, until a frame arrives or the grabber stops.
+
+        Returns:
+            tuple[int, np.ndarray | None]: The frame's id and its region
+                of interest, or after and None if no newer frame arrived.
+        """
+
+        with self.condition:
+            is_ready = self.condition.wait_for(
+                lambda: self.frame_id > after or self.stopped.is_set(),
+                timeout,
+            )
+            if not is_ready or self.frame_id <= after:
+                return after, None
+
+            roi = self.crop(self.front)
+            if out is None or out.shape != roi.shape:
+                return self.frame_id, roi.copy()
+
+            np.copyto(out, roi)
+            return self.frame_id, out
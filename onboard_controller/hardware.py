@@ -0,0 +1,690 @@
+"""
+File:       onboard_controller/hardware.py
+Author:     Ali Karimiafshar
+"""
+
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+import pigpio
+from tools.agv_tools import TURN_RADIUS
+from tools.motion_profile import STEPS_PER_INCH
+
+from onboard_controller.pi_bcm_pin_assignment import Pin
+
+# pigpiod limits the simulated pigpio shares.
+MAX_WAVE_IDS = 250
+MAX_PULSES = 12000
+
+# unit: seconds
+# How often the simulated pigpiod samples inputs with edge callbacks.
+SENSOR_SAMPLE_TIME = 0.0002
+
+
+class Clock:
+    """Real time, used on the AGV."""
+
+    def time(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    def wait(self, event: threading.Event, timeout: float = None) -> bool:
+        """Waits for an event as Event.wait does, timed by the clock."""
+
+        return event.wait(timeout)
+
+
+class VirtualClock(Clock):
+    def __init__(self, speed: float = 1.0) -> None:
+        """Time running speed times faster than real time, so the threads
+        of the Controller keep their relative timing while whole routes
+        run in a fraction of the time.
+
+        Args:
+            speed (float, optional): Virtual seconds per real second.
+                Defaults to 1.0.
+        """
+
+        self.speed = speed
+        self.start = time.monotonic()
+
+    def time(self) -> float:
+        return (time.monotonic() - self.start) * self.speed
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds / self.speed)
+
+    def wait(self, event: threading.Event, timeout: float = None) -> bool:
+        if timeout is None:
+            return event.wait()
+
+        return event.wait(timeout / self.speed)
+
+
+class Hardware(ABC):
+    """GPIO and pigpio access of the Controller. Devices follow the
+    gpiozero OutputDevice and InputDevice interfaces, and pi the pigpio.pi
+    interface."""
+
+    clock: Clock
+    pi: pigpio.pi
+
+    @abstractmethod
+    def output(self, pin: int, active_high: bool = True):
+        """Returns an output device with on(), off() and value."""
+
+    @abstractmethod
+    def input(self, pin: int):
+        """Returns an input device with value."""
+
+    @abstractmethod
+    def camera(self, index: int = 0):
+        """Returns an opened camera with the cv2.VideoCapture interface."""
+
+
+class PiHardware(Hardware):
+    def __init__(self) -> None:
+        """The AGV's Raspberry Pi, through gpiozero and pigpiod.
+
+        Note: must first run "sudo pigpiod -t 0 -s 4" in pi terminal. \\
+        The -s 4 option selects sample rate of 4 (rows of the freq table)
+        """
+
+        import gpiozero
+
+        self.gpiozero = gpiozero
+        self.clock = Clock()
+        self.pi = pigpio.pi()
+
+    def output(self, pin: int, active_high: bool = True):
+        return self.gpiozero.OutputDevice(pin=pin, active_high=active_high)
+
+    def input(self, pin: int):
+        return self.gpiozero.InputDevice(pin=pin)
+
+    def camera(self, index: int = 0):
+        import cv2
+
+        return cv2.VideoCapture(index)
+
+
+@dataclass
+class Pose:
+    """Position of the AGV in inches and heading in degrees, matching the
+    waypoints of the stationary controller."""
+
+    x: float = 0.0
+    y: float = 0.0
+    heading: float = 90.0
+
+
+class SimulatedOutput:
+    def __init__(self, hardware: "SimulatedHardware", pin: int) -> None:
+        self.hardware = hardware
+        self.pin = pin
+        self.value = 0
+
+    def on(self) -> None:
+        self.hardware.set_output(self, 1)
+
+    def off(self) -> None:
+        self.hardware.set_output(self, 0)
+
+
+class SimulatedInput:
+    def __init__(self, hardware: "SimulatedHardware", pin: int) -> None:
+        self.hardware = hardware
+        self.pin = pin
+
+    @property
+    def value(self) -> int:
+        return self.hardware.read_input(self.pin)
+
+
+class SimulatedCallback:
+    def __init__(self, pi: "SimulatedPi", gpio: int) -> None:
+        """Counts the rising edges of a pin, as pigpio.pi.callback does."""
+
+        self.pi = pi
+        self.gpio = gpio
+        self.offset = pi.edges(gpio)
+
+    def tally(self) -> int:
+        return self.pi.edges(self.gpio) - self.offset
+
+    def reset_tally(self) -> None:
+        self.offset = self.pi.edges(self.gpio)
+
+    def cancel(self) -> None:
+        return
+
+
+class SimulatedEdgeCallback:
+    def __init__(
+        self,
+        pi: "SimulatedPi",
+        gpio: int,
+        edge: int,
+        func: Callable[[int, int, int], None],
+    ) -> None:
+        """Calls func(gpio, level, tick) on the edges of an input, as
+        pigpio.pi.callback does, from the simulated pi's sampling thread."""
+
+        self.pi = pi
+        self.gpio = gpio
+        self.edge = edge
+        self.func = func
+
+    def cancel(self) -> None:
+        with self.pi.mutex:
+            if self in self.pi.edge_callbacks:
+                self.pi.edge_callbacks.remove(self)
+
+
+class SimulatedCamera:
+    def __init__(self, hardware: "SimulatedHardware", fps: float = 30):
+        """A camera delivering frames at a fixed rate in virtual time. Each
+        frame is blank, apart from the QR code of the hardware's marker
+        when one is in view at the time the frame is taken.
+
+        Args:
+            hardware (SimulatedHardware): Sets the marker and the clock.
+            fps (float, optional): Frames per second. Defaults to 30.
+        """
+
+        self.hardware = hardware
+        self.fps = fps
+        self.width = 640
+        self.height = 480
+        self.is_open = True
+
+        # QR code images by text.
+        self.codes: dict[str, np.ndarray] = {}
+
+    def isOpened(self) -> bool:
+        return self.is_open
+
+    def set(self, prop: int, value: float) -> bool:
+        import cv2
+
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.width = int(value)
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.height = int(value)
+        return True
+
+    def release(self) -> None:
+        self.is_open = False
+
+    def read(self, image: np.ndarray = None) -> tuple[bool, np.ndarray]:
+        """Waits for the next frame and draws it into image if it fits."""
+
+        if not self.is_open:
+            return False, None
+
+        clock = self.hardware.clock
+        period = 1 / self.fps
+        clock.sleep(period - clock.time() % period)
+
+        shape = (self.height, self.width, 3)
+        if image is None or image.shape != shape:
+            image = np.empty(shape, dtype=np.uint8)
+
+        image.fill(255)
+        text = self.hardware.read_marker()
+        if text:
+            code = self.code(text)
+            h = min(code.shape[0], self.height)
+            w = min(code.shape[1], self.width)
+            y = (self.height - h) // 2
+            x = (self.width - w) // 2
+            image[y : y + h, x : x + w] = code[:h, :w]
+
+        return True, image
+
+    def code(self, text: str) -> np.ndarray:
+        import cv2
+
+        if text not in self.codes:
+            code = cv2.QRCodeEncoder.create().encode(text)
+            scale = max(1, min(self.width, self.height) // 2 // len(code))
+            code = cv2.resize(
+                code,
+                None,
+                fx=scale,
+                fy=scale,
+                interpolation=cv2.INTER_NEAREST,
+            )
+            code = cv2.copyMakeBorder(
+                code, 16, 16, 16, 16, cv2.BORDER_CONSTANT, value=255
+            )
+            self.codes[text] = cv2.cvtColor(code, cv2.COLOR_GRAY2BGR)
+
+        return self.codes[text]
+
+
+@dataclass
+class Segment:
+    """A wave transmitted count times in a row, or a delay if wid is None."""
+
+    wid: int
+    count: int
+    seconds: float
+
+
+class SimulatedPi:
+    def __init__(self, clock: Clock, mutex: threading.RLock = None) -> None:
+        """The subset of pigpio.pi used by the Controller. Waves are timed
+        by the clock instead of being transmitted, and rising edges are
+        counted from the chain's progress.
+
+        Args:
+            clock (Clock): Times the wave chains.
+            mutex (threading.RLock, optional): Lock shared with the
+                simulated hardware. Defaults to None, a new lock.
+        """
+
+        self.clock = clock
+        self.mutex = mutex or threading.RLock()
+
+        # Called before a chain is stopped or replaced.
+        self.on_change: Callable[[], None] = None
+
+        # Pulses of each wave, and those added since the last wave_create.
+        self.waves: dict[int, list[pigpio.pulse]] = {}
+        self.pending: list[pigpio.pulse] = []
+
+        # The chain being transmitted and when it started.
+        self.segments: list[Segment] = []
+        self.started = 0.0
+
+        # Rising edges by pin of the chains before the current one.
+        self.finished_edges: dict[int, int] = {}
+        self.modes: dict[int, int] = {}
+
+        # When a chain was last stopped before it finished.
+        self.interrupted_at: float = None
+
+        # Level of an input, set by the simulated hardware.
+        self.read_level: Callable[[int], int] = lambda gpio: 0
+
+        # Edge callbacks of inputs, sampled by the watcher thread, and the
+        # glitch filter of each input in microseconds.
+        self.edge_callbacks: list[SimulatedEdgeCallback] = []
+        self.glitch_filters: dict[int, int] = {}
+        self.watcher: threading.Thread = None
+
+    def set_mode(self, gpio: int, mode: int) -> None:
+        self.modes[gpio] = mode
+
+    def set_pull_up_down(self, gpio: int, pud: int) -> None:
+        return
+
+    def read(self, gpio: int) -> int:
+        return self.read_level(gpio)
+
+    def get_current_tick(self) -> int:
+        return int(self.clock.time() * 1e6) & 0xFFFFFFFF
+
+    def set_glitch_filter(self, user_gpio: int, steady: int) -> None:
+        self.glitch_filters[user_gpio] = steady
+
+    def callback(
+        self,
+        user_gpio: int,
+        edge: int = pigpio.RISING_EDGE,
+        func: Callable[[int, int, int], None] = None,
+    ) -> "SimulatedCallback | SimulatedEdgeCallback":
+        """Counts the rising edges of an output, or calls func on the edges
+        of an input."""
+
+        if func is None:
+            return SimulatedCallback(self, user_gpio)
+
+        with self.mutex:
+            cb = SimulatedEdgeCallback(self, user_gpio, edge, func)
+            self.edge_callbacks.append(cb)
+            if self.watcher is None:
+                self.watcher = threading.Thread(
+                    target=self.watch_inputs, daemon=True
+                )
+                self.watcher.start()
+
+            return cb
+
+    def watch_inputs(self) -> None:
+        """Samples the inputs that have callbacks. A new level is reported
+        once it has been steady for the input's glitch filter, timestamped
+        that long after it was first seen, as pigpiod does."""
+
+        # Reported level, latest level and when it was first seen, by pin.
+        states: dict[int, list] = {}
+        while True:
+            now = self.clock.time()
+            for gpio in {cb.gpio for cb in self.edge_callbacks}:
+                level = self.read_level(gpio)
+                state = states.setdefault(gpio, [level, level, now])
+                if level != state[1]:
+                    state[1:] = [level, now]
+
+                steady = self.glitch_filters.get(gpio, 0) / 1e6
+                if level == state[0] or now - state[2] < steady:
+                    continue
+
+                state[0] = level
+                tick = int((state[2] + steady) * 1e6) & 0xFFFFFFFF
+                edge = pigpio.RISING_EDGE if level else pigpio.FALLING_EDGE
+                for cb in list(self.edge_callbacks):
+                    if cb.gpio == gpio and cb.edge in [
+                        edge,
+                        pigpio.EITHER_EDGE,
+                    ]:
+                        cb.func(gpio, level, tick)
+
+            self.clock.sleep(SENSOR_SAMPLE_TIME)
+
+    def wave_get_max_pulses(self) -> int:
+        return MAX_PULSES
+
+    def wave_add_new(self) -> None:
+        self.pending = []
+
+    def wave_add_generic(self, pulses: list[pigpio.pulse]) -> int:
+        self.pending += pulses
+        return len(self.pending)
+
+    def wave_create(self) -> int:
+        with self.mutex:
+            used = sum(len(pulses) for pulses in self.waves.values())
+            if len(self.waves) >= MAX_WAVE_IDS:
+                raise pigpio.error("'no more waveform ids'")
+            if used + len(self.pending) > MAX_PULSES:
+                raise pigpio.error("'too many pulses'")
+
+            wid = min(set(range(MAX_WAVE_IDS)) - set(self.waves))
+            self.waves[wid] = self.pending
+            self.pending = []
+            return wid
+
+    def wave_delete(self, wave_id: int) -> None:
+        with self.mutex:
+            del self.waves[wave_id]
+
+    def wave_clear(self) -> None:
+        with self.mutex:
+            self.wave_tx_stop()
+            self.waves.clear()
+
+    def wave_tx_busy(self) -> int:
+        with self.mutex:
+            return int(self.clock.time() < self.started + self.duration())
+
+    def wave_tx_stop(self) -> None:
+        """Stops the chain, keeping the edges already transmitted."""
+
+        with self.mutex:
+            if self.on_change is not None:
+                self.on_change()
+
+            if self.segments and self.wave_tx_busy():
+                self.interrupted_at = self.clock.time()
+
+            wids = {s.wid for s in self.segments if s.wid is not None}
+            pins = {pin for wid in wids for pin in self.wave_pins(wid)}
+            for gpio in pins:
+                self.finished_edges[gpio] = self.edges(gpio)
+
+            self.segments = []
+
+    def wave_chain(self, data: list[int]) -> None:
+        with self.mutex:
+            segments = self.parse_chain(data)
+            self.wave_tx_stop()
+            self.segments = segments
+            self.started = self.clock.time()
+
+    def parse_chain(self, data: list[int]) -> list[Segment]:
+        """Expands the loops and delays of a chain into segments."""
+
+        stack: list[list[Segment]] = [[]]
+        i = 0
+        while i < len(data):
+            if data[i] != 255:
+                wid = data[i]
+                if wid not in self.waves:
+                    raise pigpio.error("'non existent wave id'")
+                stack[-1].append(Segment(wid, 1, self.wave_time(wid)))
+                i += 1
+                continue
+
+            command = data[i + 1]
+            if command == 0:
+                stack.append([])
+                i += 2
+                continue
+
+            count = data[i + 2] + (data[i + 3] << 8)
+            if command == 1:
+                body = stack.pop()
+                if len(body) == 1:
+                    body[0].count *= count
+                    stack[-1] += body
+                else:
+                    for _ in range(count):
+                        stack[-1] += [
+                            Segment(s.wid, s.count, s.seconds) for s in body
+                        ]
+            elif command == 2:
+                stack[-1].append(Segment(None, 1, count / 1e6))
+            else:
+                raise pigpio.error("'unsupported chain command'")
+            i += 4
+
+        return stack[0]
+
+    def wave_time(self, wid: int) -> float:
+        return sum(pulse.delay for pulse in self.waves[wid]) / 1e6
+
+    def wave_pins(self, wid: int) -> list[int]:
+        on = 0
+        for pulse in self.waves.get(wid, []):
+            on |= pulse.gpio_on
+        return [gpio for gpio in range(32) if on >> gpio & 1]
+
+    def wave_rising_edges(self, wid: int, gpio: int) -> int:
+        return sum(
+            1 for pulse in self.waves.get(wid, []) if pulse.gpio_on >> gpio & 1
+        )
+
+    def duration(self) -> float:
+        return sum(s.count * s.seconds for s in self.segments)
+
+    def edges(self, gpio: int, at: float = None) -> int:
+        """Rising edges transmitted on a pin so far, or by a time during the
+        current chain. Each wave's edges are counted as it starts."""
+
+        with self.mutex:
+            if at is None:
+                at = self.clock.time()
+
+            total = self.finished_edges.get(gpio, 0)
+            elapsed = at - self.started
+            for s in self.segments:
+                if elapsed < 0:
+                    break
+
+                started = min(s.count, math.floor(elapsed / s.seconds) + 1)
+                if s.wid is not None:
+                    total += started * self.wave_rising_edges(s.wid, gpio)
+                elapsed -= s.count * s.seconds
+
+            return total
+
+    def boundaries(self, start: float, end: float) -> list[float]:
+        """Times between start and end at which a segment of the current
+        chain ends, just before the next segment's first wave starts."""
+
+        with self.mutex:
+            times = []
+            time = self.started
+            for s in self.segments:
+                time += s.count * s.seconds
+                if start < time - 1e-9 < end:
+                    times.append(time - 1e-9)
+
+            return times
+
+
+class SimulatedHardware(Hardware):
+    def __init__(self, speed: float = 1.0, differential: bool = False) -> None:
+        """The AGV's motors and sensors simulated in virtual time. The pose
+        follows the steps transmitted on the motors pin, depending on the
+        direction and kill switch outputs: both wheels turning moves the
+        AGV straight, one killed pivots it about that wheel. With
+        differential drive, the right wheel follows its own step pin.
+
+        Args:
+            speed (float, optional): Virtual seconds per real second.
+                Defaults to 1.0.
+            differential (bool, optional): Whether the wheels have separate
+                step pins. Defaults to False.
+        """
+
+        self.clock = VirtualClock(speed)
+        self.mutex = threading.RLock()
+        self.pi = SimulatedPi(self.clock, self.mutex)
+        self.pi.on_change = self.update_pose
+        self.pi.read_level = self.read_input
+        self.pose = Pose()
+
+        # Step pins of the left and right wheels.
+        self.step_pins = [Pin.motors.value, Pin.motors.value]
+        if differential:
+            self.step_pins[1] = Pin.right_motor_step.value
+
+        self.outputs: dict[int, SimulatedOutput] = {}
+
+        # Levels, or functions of the pose, of the sensors by pin.
+        self.inputs: dict[int, "int | Callable[[Pose], int]"] = {}
+
+        # Text of the QR code in view of the camera, or a function of the
+        # pose giving it.
+        self.marker: "str | Callable[[Pose], str] | None" = None
+
+        # Time up to which the pose follows the steps.
+        self.pose_time = self.clock.time()
+
+    def output(self, pin: int, active_high: bool = True) -> SimulatedOutput:
+        self.outputs[pin] = SimulatedOutput(self, pin)
+        return self.outputs[pin]
+
+    def input(self, pin: int) -> SimulatedInput:
+        return SimulatedInput(self, pin)
+
+    def camera(self, index: int = 0) -> SimulatedCamera:
+        return SimulatedCamera(self)
+
+    def set_marker(self, text: "str | Callable[[Pose], str] | None"):
+        """Puts a QR code in view of the camera, such as at a station, or
+        removes it with None."""
+
+        self.marker = text
+
+    def read_marker(self) -> "str | None":
+        marker = self.marker
+        if callable(marker):
+            return marker(self.get_pose())
+
+        return marker
+
+    def set_input(self, pin: int, level: "int | Callable[[Pose], int]"):
+        """Sets a sensor to a level, or to a function of the pose such as
+        an obstacle or floor marker at a position."""
+
+        self.inputs[pin] = level
+
+    def read_input(self, pin: int) -> int:
+        level = self.inputs.get(pin, 0)
+        if callable(level):
+            return level(self.get_pose())
+
+        return level
+
+    def set_output(self, device: SimulatedOutput, value: int) -> None:
+        # Steps so far were taken with the previous outputs.
+        with self.mutex:
+            self.update_pose()
+            device.value = value
+
+    def is_on(self, pin: Pin) -> bool:
+        device = self.outputs.get(pin.value)
+        return device is not None and device.value == 1
+
+    def get_pose(self) -> Pose:
+        with self.mutex:
+            self.update_pose()
+            return Pose(self.pose.x, self.pose.y, self.pose.heading)
+
+    def update_pose(self) -> None:
+        with self.mutex:
+            # Both wheels keep a constant speed ratio within a segment.
+            now = self.clock.time()
+            times = [self.pose_time]
+            times += self.pi.boundaries(self.pose_time, now)
+            times.append(now)
+            for start, end in zip(times, times[1:]):
+                left, right = [
+                    self.pi.edges(pin, end) - self.pi.edges(pin, start)
+                    for pin in self.step_pins
+                ]
+                self.move_wheels(left, right)
+
+            self.pose_time = now
+
+    def move_wheels(self, left_steps: int, right_steps: int) -> None:
+        """Moves the pose along the arc of the wheels' steps."""
+
+        left = left_steps / STEPS_PER_INCH
+        right = right_steps / STEPS_PER_INCH
+        if self.is_on(Pin.left_motor_kill_switch):
+            left = 0.0
+        if self.is_on(Pin.right_motor_kill_switch):
+            right = 0.0
+        if self.is_on(Pin.left_motor_backward_direction):
+            left = -left
+        if self.is_on(Pin.right_motor_backward_direction):
+            right = -right
+        if not left and not right:
+            return
+
+        # The wheels are a turn radius apart.
+        heading = math.radians(self.pose.heading)
+        dist = (left + right) / 2
+        turn = (right - left) / TURN_RADIUS
+        chord = dist
+        if turn:
+            chord = dist * math.sin(turn / 2) / (turn / 2)
+
+        self.pose.x += chord * math.cos(heading + turn / 2)
+        self.pose.y += chord * math.sin(heading + turn / 2)
+        self.pose.heading = (self.pose.heading + math.degrees(turn)) % 360
+
+
+def create_hardware(config) -> Hardware:
+    """The backend selected by the hardware_backend option, "pigpio" or
+    "simulated"."""
+
+    if config.hardware_backend == "simulated":
+        return SimulatedHardware(
+            speed=config.simulation_speed,
+            differential=config.drive_mode == "differential",
+        )
+
+    return PiHardware()
@@ -0,0 +1,135 @@
+"""
+File:       onboard_controller/instruction_queue.py
+Author:     Ali Karimiafshar
+"""
+
+import threading
+from collections import deque
+
+from onboard_controller.instructions import Instruction
+
+
+class InstructionQueue:
+    def __init__(self, maxsize: int = 0) -> None:
+        """Thread-safe FIFO of instructions. Consumers block on a condition
+        variable and are woken the moment an instruction is added.
+
+        Args:
+            maxsize (int, optional): Number of queued instructions at which
+                producers block until the executor catches up. Defaults to
+                0, which never blocks.
+        """
+
+        self.instructions: deque[Instruction] = deque()
+        self.maxsize = maxsize
+
+        # Bumped by every clear, so producers that were waiting for room
+        # can tell their instructions were meant for a queue since cleared.
+        self.generation = 0
+
+        mutex = threading.Lock()
+        self.not_empty = threading.Condition(mutex)
+        self.not_full = threading.Condition(mutex)
+
+    def __len__(self) -> int:
+        return len(self.instructions)
+
+    def has_room(self, count: int) -> bool:
+        # An empty queue always accepts, so long routes cannot deadlock.
+        if self.maxsize <= 0 or not self.instructions:
+            return True
+
+        return len(self.instructions) + count <= self.maxsize
+
+    def put(self, inst: Instruction, generation: int = None) -> bool:
+        """Appends an instruction and wakes a waiting consumer. Blocks while
+        the queue is full.
+
+        Args:
+            inst (Instruction): The instruction to be executed.
+            generation (int, optional): See put_many. Defaults to None.
+
+        Returns:
+            bool: False if the instruction was dropped.
+        """
+
+        return self.put_many([inst], generation)
+
+    def put_many(
+        self, insts: list[Instruction], generation: int = None
+    ) -> bool:
+        """Appends every instruction atomically, so no other instruction can
+        be interleaved with them. Blocks until there is room for all of them.
+
+        Args:
+            insts (list[Instruction]): The instructions to be executed.
+            generation (int, optional): The queue's generation when the
+                caller decided to add them. If the queue is cleared before
+                they are added, they are dropped. Defaults to None, which
+                always adds them.
+
+        Returns:
+            bool: False if the instructions were dropped.
+        """
+
+        def is_stale() -> bool:
+            return generation is not None and generation != self.generation
+
+        with self.not_full:
+            self.not_full.wait_for(
+                lambda: is_stale() or self.has_room(len(insts))
+            )
+            if is_stale():
+                return False
+
+            self.instructions.extend(insts)
+            self.not_empty.notify()
+            return True
+
+    def put_front(self, inst: Instruction) -> None:
+        """Returns an instruction to the front of the queue, such as one
+        taken just before the AGV was halted.
+
+        Args:
+            inst (Instruction): The instruction to be executed next.
+        """
+
+        with self.not_empty:
+            self.instructions.appendleft(inst)
+            self.not_empty.notify()
+
+    def get(self, timeout: float = None) -> Instruction:
+        """Removes and returns the oldest instruction, blocking until one is
+        available.
+
+        Args:
+            timeout (float, optional): The maximum number of seconds to wait.
+                Defaults to None, which waits indefinitely.
+
+        Returns:
+            Instruction | None: The instruction, or None if the timeout
+                expired first.
+        """
+
+        with self.not_empty:
+            if not self.not_empty.wait_for(lambda: self.instructions, timeout):
+                return
+
+            inst = self.instructions.popleft()
+            self.not_full.notify()
+            return inst
+
+    def clear(self) -> int:
+        """Removes every queued instruction, and drops those of producers
+        still waiting for room.
+
+        Returns:
+            int: The number of instructions removed.
+        """
+
+        with self.not_full:
+            count = len(self.instructions)
+            self.instructions.clear()
+            self.generation += 1
+            self.not_full.notify_all()
+            return count
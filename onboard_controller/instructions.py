@@ -10,3 +10,6 @@ from dataclasses import dataclass
 class Instruction:
     command: str
     value: float
+
+    # Sequence number of the message it came from, or 0 if unsequenced.
+    seq: int = 0
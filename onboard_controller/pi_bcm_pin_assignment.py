@@ -16,3 +16,4 @@ class Pin(Enum):
     left_vertical_os = 20
     right_vertical_os = 21
     rear_horizontal_os_power = 24
+    right_motor_step = 25  # differential drive only, motors is then left
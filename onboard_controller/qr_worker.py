@@ -0,0 +1,200 @@
+"""
+File:       onboard_controller/qr_worker.py
+Author:     Ali Karimiafshar
+"""
+
+import multiprocessing
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from onboard_controller.frame_grabber import FrameGrabber
+
+# Frames in shared memory, so that one is filled while another is decoded.
+SLOTS = 2
+
+# unit: seconds
+# Longest wait for a free slot before checking whether to stop, and for the
+# worker to exit once asked.
+POLL_INTERVAL = 0.1
+JOIN_TIMEOUT = 2.0
+
+
+@dataclass
+class QrResult:
+    """The QR code decoded from a frame, if any."""
+
+    frame_id: int
+    # When the frame was handed to the worker, from time.time().
+    timestamp: float
+    text: str
+    # Corners of the code in the frame, or None if none was found.
+    points: "list[list[float]] | None"
+
+
+def decode_frames(
+    name: str,
+    shape: tuple[int, ...],
+    frames: multiprocessing.Queue,
+    free: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+) -> None:
+    """Decodes each frame placed in a slot of the shared memory, hands the
+    slot back and reports the result, until sent None. Runs in the worker
+    process.
+
+    Args:
+        name (str): Name of the shared memory holding the slots.
+        shape (tuple[int, ...]): Shape of a frame.
+        frames (multiprocessing.Queue): Slot, frame id and timestamp of
+            each frame to decode.
+        free (multiprocessing.Queue): Slots that may be filled again.
+        results (multiprocessing.Queue): QrResult of each frame.
+    """
+
+    memory = shared_memory.SharedMemory(name=name)
+    slots = np.ndarray((SLOTS, *shape), dtype=np.uint8, buffer=memory.buf)
+    detector = cv2.QRCodeDetector()
+    try:
+        while True:
+            item = frames.get()
+            if item is None:
+                break
+
+            slot, frame_id, timestamp = item
+            text, points, _ = detector.detectAndDecode(slots[slot])
+            free.put(slot)
+
+            if points is not None:
+                points = points.reshape(-1, 2).tolist()
+            results.put(QrResult(frame_id, timestamp, text.upper(), points))
+    finally:
+        del slots
+        memory.close()
+
+
+class QrWorker:
+    def __init__(self, grabber: FrameGrabber) -> None:
+        """Decodes QR codes in a separate process, so that the decoding
+        does not compete for the GIL with the Controller's threads. A
+        thread copies each new frame from the grabber straight into a free
+        slot of shared memory and the worker process returns the slot once
+        the frame is decoded. Frames arriving while every slot is in use
+        are skipped.
+
+        Args:
+            grabber (FrameGrabber): A started grabber supplying the frames.
+        """
+
+        self.grabber = grabber
+
+        # Created by start, once the size of a frame is known.
+        self.memory: shared_memory.SharedMemory = None
+        self.slots: np.ndarray = None
+        self.process: multiprocessing.Process = None
+        self.thread: threading.Thread = None
+
+        # A fresh interpreter rather than a fork of one running threads.
+        context = multiprocessing.get_context("spawn")
+        self.frames = context.Queue()
+        self.free = context.Queue()
+        self.results = context.Queue()
+        self.context = context
+
+        self.frame_id = 0
+        self.stopped = threading.Event()
+
+    def start(self) -> None:
+        """Waits for the first frame, then starts the worker process and
+        the thread feeding it."""
+
+        self.stopped.clear()
+        self.frame_id, frame = self.grabber.read()
+        if frame is None:
+            return
+
+        self.memory = shared_memory.SharedMemory(
+            create=True, size=SLOTS * frame.nbytes
+        )
+        self.slots = np.ndarray(
+            (SLOTS, *frame.shape), dtype=np.uint8, buffer=self.memory.buf
+        )
+
+        self.process = self.context.Process(
+            target=decode_frames,
+            args=(
+                self.memory.name,
+                frame.shape,
+                self.frames,
+                self.free,
+                self.results,
+            ),
+            daemon=True,
+        )
+        self.process.start()
+
+        for slot in range(SLOTS):
+            self.free.put(slot)
+
+        self.thread = threading.Thread(target=self.feed, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stops the worker process and frees the shared memory."""
+
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+        if self.process is not None:
+            self.frames.put(None)
+            self.process.join(JOIN_TIMEOUT)
+            if self.process.is_alive():
+                self.process.terminate()
+
+        if self.memory is not None:
+            del self.slots
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def feed(self) -> None:
+        while not self.stopped.is_set():
+            try:
+                slot = self.free.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+            buffer = self.slots[slot]
+            frame_id, frame = self.grabber.read(
+                after=self.frame_id, out=buffer, timeout=POLL_INTERVAL
+            )
+
+            # read returns a new array if none arrived or its size changed.
+            if frame is not buffer:
+                self.free.put(slot)
+                continue
+
+            self.frame_id = frame_id
+            self.frames.put((slot, frame_id, time.time()))
+
+    def result(self, timeout: float = None) -> "QrResult | None":
+        """Waits for the next decoded frame.
+
+        Args:
+            timeout (float, optional): Most seconds to wait. Defaults to
+                None, until a frame is decoded.
+
+        Returns:
+            QrResult | None: The result, or None if none arrived in time.
+        """
+
+        try:
+            return self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
@@ -0,0 +1,142 @@
+"""
+File:       onboard_controller/route_compiler.py
+Author:     Ali Karimiafshar
+"""
+
+from dataclasses import dataclass, field
+
+from tools.agv_tools import AgvTools
+from tools.motion_estimator import read_route
+from tools.motion_profile import MotionProfile
+
+from onboard_controller.agv_command import AgvCommand
+from onboard_controller.instructions import Instruction
+
+
+@dataclass(frozen=True)
+class PinState:
+    """Levels of the direction and kill switch outputs during a move."""
+
+    left_backward: bool = False
+    right_backward: bool = False
+    right_kill: bool = False
+    left_kill: bool = False
+
+    @property
+    def directions(self) -> tuple[bool, bool]:
+        return self.left_backward, self.right_backward
+
+
+# Rotations pivot about the wheel whose motor is killed.
+MOVE_PINS: dict[str, PinState] = {
+    AgvCommand.forward.value: PinState(),
+    AgvCommand.backward.value: PinState(
+        left_backward=True, right_backward=True
+    ),
+    AgvCommand.rotate_cw.value: PinState(right_kill=True),
+    AgvCommand.rotate_ccw.value: PinState(left_kill=True),
+}
+
+
+@dataclass
+class CompiledMove(Instruction):
+    """One continuous ramp, covering one or more consecutive route
+    instructions that move the same way.
+
+    Attributes:
+        pins (PinState): Output levels for the whole move.
+        pulse_num (int): Steps in the move.
+        ramp (tuple[tuple[int, int], ...]): [frequency, steps] levels.
+        release (bool): Whether the kill switches are released after the
+            move, as the last move of a route.
+        sources (list[Instruction]): The route instructions blended into
+            the move.
+    """
+
+    pins: PinState = PinState()
+    pulse_num: int = 0
+    ramp: tuple = ()
+    release: bool = False
+    sources: list[Instruction] = field(default_factory=list)
+
+
+def move_pulses(inst: Instruction) -> int:
+    """Steps of a forward, backward or rotate instruction."""
+
+    if inst.command in [
+        AgvCommand.rotate_cw.value,
+        AgvCommand.rotate_ccw.value,
+    ]:
+        dist = AgvTools.calc_arc_length(angle=inst.value)
+        return AgvTools.calc_pulse_num_from_dist(inches=dist)
+
+    return AgvTools.calc_pulse_num_from_dist(inches=inst.value)
+
+
+def compile_route(
+    instructions: list[Instruction], profile: MotionProfile
+) -> list[Instruction]:
+    """Precomputes the output levels and ramp of every move in a route.
+    Consecutive instructions moving the same way are blended into a single
+    ramp, so the AGV does not slow down between them. Instructions that do
+    not move are kept as they are.
+
+    Args:
+        instructions (list[Instruction]): The route.
+        profile (MotionProfile): Profile of the AGV's moves.
+
+    Returns:
+        list[Instruction]: The CompiledMove and other instructions to
+            execute in order. Each keeps the sequence number of the last
+            instruction it covers.
+    """
+
+    output: list[Instruction] = []
+    for inst in instructions:
+        if inst.command not in MOVE_PINS:
+            output.append(inst)
+            continue
+
+        pulse_num = move_pulses(inst)
+        if pulse_num <= 0:
+            # Nothing to move, but its acknowledgement is still owed.
+            if inst.seq and output:
+                output[-1].seq = inst.seq
+            elif inst.seq:
+                output.append(inst)
+            continue
+
+        last = output[-1] if output else None
+        if isinstance(last, CompiledMove) and last.command == inst.command:
+            last.value += inst.value
+            last.pulse_num += pulse_num
+            last.seq = inst.seq or last.seq
+            last.sources.append(inst)
+            continue
+
+        move = CompiledMove(
+            command=inst.command,
+            value=inst.value,
+            seq=inst.seq,
+            pins=MOVE_PINS[inst.command],
+            pulse_num=pulse_num,
+            sources=[inst],
+        )
+        output.append(move)
+
+    moves = [inst for inst in output if isinstance(inst, CompiledMove)]
+    for move in moves:
+        move.ramp = profile.ramp(move.pulse_num)
+
+    if moves:
+        moves[-1].release = True
+
+    return output
+
+
+def compile_route_file(
+    file_path: str, profile: MotionProfile
+) -> list[Instruction]:
+    """Compiles a saved route, e.g. "routes/start_to_end.txt"."""
+
+    return compile_route(read_route(file_path), profile)
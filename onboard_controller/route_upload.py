@@ -0,0 +1,92 @@
+"""
+File:       onboard_controller/route_upload.py
+Author:     Ali Karimiafshar
+"""
+
+import shlex
+import zlib
+from dataclasses import dataclass
+
+from tools.wire_protocol import MOTION_COMMANDS
+
+from onboard_controller.agv_command import AgvCommand
+from onboard_controller.instructions import Instruction
+
+
+@dataclass
+class RouteUpload:
+    start_name: str
+    end_name: str
+    instructions: list[Instruction]
+
+    @property
+    def route_name(self) -> str:
+        return f"{self.start_name}_to_{self.end_name}"
+
+    def body(self) -> str:
+        """Returns the instruction list, one "COMMAND VALUE" per line."""
+
+        return "\n".join(
+            f"{inst.command} {inst.value}" for inst in self.instructions
+        )
+
+    def checksum(self) -> str:
+        """Returns the CRC-32 of the instruction list as 8 hex digits."""
+
+        return f"{zlib.crc32(self.body().encode()):08X}"
+
+    def to_message(self) -> str:
+        """Encodes the whole route as a single message.
+
+        Returns:
+            str: "!ROUTE START END CHECKSUM" followed by one instruction
+                per line. Station names with spaces are shell-quoted.
+        """
+
+        header = (
+            f"{AgvCommand.upload_route.value} {shlex.quote(self.start_name)} "
+            f"{shlex.quote(self.end_name)} {self.checksum()}"
+        )
+        return f"{header}\n{self.body()}"
+
+    @classmethod
+    def from_message(cls, msg: str) -> "RouteUpload":
+        """Decodes and verifies a route upload message.
+
+        Args:
+            msg (str): The message created by to_message.
+
+        Raises:
+            ValueError: The message is malformed, has an instruction other
+                than a motion command, or the checksum does not match its
+                instructions.
+
+        Returns:
+            RouteUpload: The uploaded route.
+        """
+
+        lines = msg.strip().split("\n")
+        header = shlex.split(lines[0])
+        if len(header) != 4 or header[0] != AgvCommand.upload_route.value:
+            raise ValueError("Expected a route name and checksum.")
+
+        instructions: list[Instruction] = []
+        for line in lines[1:]:
+            words = line.split()
+            if len(words) != 2:
+                raise ValueError(f'Malformed instruction "{line}".')
+
+            cmd = AgvCommand(words[0].upper())
+            if cmd not in MOTION_COMMANDS:
+                raise ValueError(f'"{cmd.value}" is not a motion command.')
+
+            instructions.append(Instruction(cmd.value, float(words[1])))
+
+        route = cls(header[1], header[2], instructions)
+        if route.checksum() != header[3].upper():
+            raise ValueError(
+                f"Checksum mismatch, expected {header[3]} but the "
+                f"instructions hash to {route.checksum()}."
+            )
+
+        return route
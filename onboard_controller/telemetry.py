@@ -0,0 +1,113 @@
+"""
+File:       onboard_controller/telemetry.py
+Author:     Ali Karimiafshar
+"""
+
+import json
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+from onboard_controller.agv_command import AgvCommand
+
+
+@dataclass
+class TelemetrySnapshot:
+    timestamp: float
+    mode: str
+    command: str
+    value: float
+    pulse_count: int
+    expected_pulses: int
+    queue_depth: int
+    is_agv_busy: bool
+    is_obstructed: bool
+    is_halted: bool
+    is_e_stopped: bool
+    is_left_vos_actuated: bool
+    is_right_vos_actuated: bool
+
+    # Counted minus commanded pulses of the last finished move.
+    pulse_error: int = 0
+
+    @property
+    def progress(self) -> float:
+        """Fraction of the current instruction's pulses already sent."""
+
+        if not self.expected_pulses:
+            return 0.0
+
+        return min(self.pulse_count / self.expected_pulses, 1.0)
+
+    def to_message(self) -> str:
+        data = json.dumps(asdict(self), separators=(",", ":"))
+        return f"{AgvCommand.telemetry.value} {data}"
+
+    @classmethod
+    def from_message(cls, msg: str) -> "TelemetrySnapshot":
+        """Decodes a message created by to_message.
+
+        Args:
+            msg (str): The telemetry message.
+
+        Raises:
+            ValueError: The message is not a telemetry snapshot.
+
+        Returns:
+            TelemetrySnapshot: The decoded snapshot.
+        """
+
+        command, _, data = msg.partition(" ")
+        if command != AgvCommand.telemetry.value:
+            raise ValueError("Not a telemetry message.")
+
+        try:
+            return cls(**json.loads(data))
+        except TypeError as e:
+            raise ValueError(f"Malformed telemetry: {e}")
+
+
+class TelemetryPublisher:
+    def __init__(
+        self,
+        server,
+        sample: Callable[[], TelemetrySnapshot],
+        rate_hz: float,
+    ) -> None:
+        """Publishes state snapshots to the connected clients at a fixed
+        rate from its own thread. Snapshots are taken right before sending
+        and skipped while the link is backed up, so a slow client only ever
+        receives the latest state and the control threads never wait on it.
+
+        Args:
+            server (AgvSocket | AsyncAgvServer): The server to publish on.
+            sample (Callable[[], TelemetrySnapshot]): Returns the current
+                state.
+            rate_hz (float): Snapshots per second.
+        """
+
+        self.server = server
+        self.sample = sample
+        self.period = 1 / rate_hz
+
+        # Snapshots skipped because the link was backed up.
+        self.skipped = 0
+
+    def start(self) -> None:
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+
+    def run(self) -> None:
+        while self.server.running:
+            start = time.monotonic()
+
+            # Sent without blocking, so that the e-stop reply and other
+            # messages never wait behind a snapshot.
+            is_sent = self.server.can_send() and self.server.try_send_message(
+                self.sample().to_message()
+            )
+            if not is_sent:
+                self.skipped += 1
+
+            time.sleep(max(self.period - (time.monotonic() - start), 0))
@@ -0,0 +1,510 @@
+"""
+File:       stationary_controller/fleet_manager.py
+Author:     Ali Karimiafshar
+"""
+
+import os
+import selectors
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from enum import Enum, auto
+from typing import Callable
+
+from onboard_controller.agv_command import AgvCommand
+from onboard_controller.telemetry import TelemetrySnapshot
+from tools import wire_protocol
+from tools.agv_logger import get_logger
+from tools.config import read_config
+from tools.flow_control import (
+    ACKED,
+    SESSION,
+    SendWindow,
+    parse_ack,
+    parse_options,
+)
+from tools.frame_reader import FrameReader
+from tools.heartbeat import HEARTBEAT, LinkMonitor
+from tools.wire_protocol import CommandFrame
+
+
+class AgvState(Enum):
+    Disconnected = auto()
+    Connecting = auto()
+    Handshaking = auto()
+    Negotiating = auto()
+    Connected = auto()
+
+
+class AgvConnection:
+    def __init__(
+        self, fleet: "FleetManager", name: str, ip: str, port: int
+    ) -> None:
+        """Connection to one AGV in the fleet. Holds the AGV's command
+        queue, send window and latest telemetry. The socket itself is only
+        used from the fleet manager's thread.
+
+        Args:
+            fleet (FleetManager): The fleet manager serving the connection.
+            name (str): Name of the AGV shown to the operator.
+            ip (str): The IP address of the AGV's server.
+            port (int): The Port number of the AGV's server.
+        """
+
+        self.fleet = fleet
+        self.name = name
+        self.ip = ip
+        self.port = port
+
+        self.state = AgvState.Disconnected
+        self.sock: socket.socket = None
+        self.reader: FrameReader = None
+        self.is_binary = False
+
+        # Messages waiting for the fleet manager's thread to send them.
+        self.outbox: deque[str] = deque()
+
+        # Encoded bytes not yet accepted by the socket.
+        self.out_buffer = bytearray()
+
+        # Sequence numbers and acknowledgements of sent commands. The
+        # session lets the AGV deduplicate commands replayed after a drop.
+        self.window = SendWindow(fleet.config.socket_ack_window)
+        self.session_id = uuid.uuid4().hex[:8]
+
+        # Latest state reported by the AGV
+        self.telemetry: TelemetrySnapshot = None
+
+        # Whether this AGV is e-stopped or halted, as the commands toggle
+        # them. Corrected by every telemetry snapshot.
+        self.is_e_stopped = False
+        self.is_halted = False
+
+        # Heartbeats and round-trip times. Polled by the fleet manager's
+        # thread, which drops the connection if the AGV falls silent.
+        self.monitor = LinkMonitor(
+            send=self.send_message,
+            interval=fleet.config.heartbeat_interval,
+            timeout=fleet.config.heartbeat_timeout,
+        )
+        self.monitor.on_lost = lambda: fleet.disconnect(
+            self, reason="heartbeat lost"
+        )
+
+        # When to try connecting next, and how long to wait after that.
+        self.reconnect_at = 0.0
+        self.reconnect_delay = fleet.RECONNECT_DELAY
+
+    @property
+    def connected(self) -> bool:
+        return self.state is AgvState.Connected
+
+    def send_message(self, msg: str) -> bool:
+        """Queues the message for the AGV. Safe to call from any thread.
+        Messages sent while disconnected are dropped.
+
+        Args:
+            msg (str): The message to be transmitted.
+
+        Returns:
+            bool: Whether the message was queued.
+        """
+
+        if not self.connected:
+            self.fleet.log.warning(
+                "not connected, message dropped", agv=self.name, msg=msg
+            )
+            return False
+
+        self.outbox.append(msg)
+        self.fleet.wake()
+        return True
+
+    def send_command(self, msg: str, timeout: float = None) -> int:
+        """Queues the message with a sequence number, blocking while the
+        AGV's window of unaccepted commands is full. Commands sent while
+        disconnected are sent once the connection is resumed.
+
+        Args:
+            msg (str): The message to be transmitted.
+            timeout (float, optional): The maximum number of seconds to wait
+                for room in the window. Defaults to None, which waits
+                indefinitely.
+
+        Raises:
+            TimeoutError: The window stayed full until the timeout.
+
+        Returns:
+            int: The sequence number, or 0 for e-stop and halt messages,
+                which are never queued and so are sent unsequenced.
+        """
+
+        if wire_protocol.is_control_message(msg):
+            self.send_message(msg)
+            return 0
+
+        seq = self.window.acquire(msg, timeout)
+        if seq is None:
+            raise TimeoutError(
+                f"{self.name} has not accepted earlier commands."
+            )
+
+        # Replayed from the window instead once reconnected.
+        if self.connected:
+            self.outbox.append(f"{wire_protocol.SEQUENCE_PREFIX}{seq} {msg}")
+            self.fleet.wake()
+
+        return seq
+
+    def encode_message(self, msg: str) -> bytes:
+        """Encodes the message as a frame in the protocol agreed upon.
+
+        Args:
+            msg (str): The message to be transmitted.
+
+        Returns:
+            bytes: The frame to be sent.
+        """
+
+        if self.is_binary:
+            return wire_protocol.encode_message(msg, self.fleet.FORMAT)
+
+        payload = msg.encode(self.fleet.FORMAT)
+        header = f"{len(payload):<{self.fleet.HEADERSIZE}}"
+        return header.encode(self.fleet.FORMAT) + payload
+
+
+class FleetManager:
+    def __init__(
+        self,
+        on_message: Callable[[str, "str | CommandFrame"], None] = None,
+    ) -> None:
+        """Keeps a connection to every AGV in the configured fleet, each
+        running ob_controller.py. All connections are served by a single
+        thread waiting on a selector, and reconnect on their own after the
+        link drops.
+
+        Args:
+            on_message (Callable[[str, str | CommandFrame], None], optional):
+                Called from the fleet manager's thread with the name of the
+                AGV and every message it sends, other than acknowledgements
+                and telemetry. Defaults to None.
+        """
+
+        # Configuration values
+        self.config = read_config()
+        self.FORMAT = self.config.socket_encoding_format
+        self.HEADERSIZE = self.config.socket_message_header_size
+        self.HANDSHAKE = self.config.socket_establish_connection_message
+        self.WIRE_FORMAT = self.config.socket_wire_format
+        self.RECONNECT_DELAY = 0.5
+        self.RECONNECT_MAX_DELAY = self.config.socket_reconnect_max_delay
+        self.HEARTBEAT_PERIOD = (
+            min(self.config.heartbeat_interval, self.config.heartbeat_timeout)
+            / 5
+        )
+
+        self.log = get_logger("fleet_manager")
+        self.on_message = on_message
+
+        self.agvs: dict[str, AgvConnection] = {
+            agv["name"]: AgvConnection(
+                self, agv["name"], agv["ip"], agv["port"]
+            )
+            for agv in self.config.fleet
+        }
+
+        self.selector = selectors.DefaultSelector()
+
+        # Written to by other threads to wake the selector when there are
+        # messages to send.
+        self.wake_reader, self.wake_writer = socket.socketpair()
+        self.wake_reader.setblocking(False)
+        self.wake_writer.setblocking(False)
+        self.selector.register(self.wake_reader, selectors.EVENT_READ)
+
+        self.running = False
+
+    def agv(self, name: str) -> AgvConnection:
+        return self.agvs[name]
+
+    def start(self) -> None:
+        """Connects to the fleet from a background thread."""
+
+        if self.running:
+            return
+
+        self.running = True
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+
+    def wake(self) -> None:
+        try:
+            self.wake_writer.send(b"\0")
+        except BlockingIOError:
+            # Already woken.
+            pass
+
+    def run(self) -> None:
+        while self.running:
+            now = time.monotonic()
+            for agv in self.agvs.values():
+                if (
+                    agv.state is AgvState.Disconnected
+                    and now >= agv.reconnect_at
+                ):
+                    self.connect(agv)
+
+            for agv in self.agvs.values():
+                # May send a heartbeat, or drop a silent AGV.
+                if agv.connected:
+                    agv.monitor.poll()
+
+                if agv.connected and agv.outbox:
+                    self.flush(agv)
+
+            # Wake up in time for the next heartbeat or reconnection attempt.
+            waiting = [
+                agv.reconnect_at - now
+                for agv in self.agvs.values()
+                if agv.state is AgvState.Disconnected
+            ]
+            timeout = max(min([self.HEARTBEAT_PERIOD, *waiting]), 0)
+
+            for key, events in self.selector.select(timeout):
+                if key.fileobj is self.wake_reader:
+                    self.wake_reader.recv(4096)
+                    continue
+
+                agv: AgvConnection = key.data
+                if (
+                    events & selectors.EVENT_WRITE
+                    or agv.state is AgvState.Connecting
+                ):
+                    self.on_writable(agv)
+                if events & selectors.EVENT_READ and agv.sock is not None:
+                    self.on_readable(agv)
+
+    def connect(self, agv: AgvConnection) -> None:
+        """Starts connecting to the AGV without blocking.
+
+        Args:
+            agv (AgvConnection): The AGV to connect to.
+        """
+
+        self.log.info("connecting", agv=agv.name, ip=agv.ip, port=agv.port)
+
+        agv.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        agv.sock.setblocking(False)
+        agv.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        agv.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        agv.sock.connect_ex((agv.ip, agv.port))
+
+        agv.reader = FrameReader(agv.sock, self.HEADERSIZE, self.FORMAT)
+        agv.is_binary = False
+        agv.out_buffer.clear()
+        agv.state = AgvState.Connecting
+
+        self.selector.register(
+            agv.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, agv
+        )
+
+    def disconnect(self, agv: AgvConnection, reason: str) -> None:
+        """Closes the connection and schedules the next attempt.
+
+        Args:
+            agv (AgvConnection): The AGV that was disconnected.
+            reason (str): Why the connection was closed.
+        """
+
+        self.log.warning(
+            "connection lost",
+            agv=agv.name,
+            reason=reason,
+            retry_in=agv.reconnect_delay,
+        )
+
+        self.selector.unregister(agv.sock)
+        agv.sock.close()
+        agv.sock = None
+        agv.state = AgvState.Disconnected
+
+        # Sequenced commands are replayed from the window instead.
+        agv.outbox.clear()
+        agv.out_buffer.clear()
+
+        agv.reconnect_at = time.monotonic() + agv.reconnect_delay
+        agv.reconnect_delay = min(
+            agv.reconnect_delay * 2, self.RECONNECT_MAX_DELAY
+        )
+
+    def on_writable(self, agv: AgvConnection) -> None:
+        if agv.state is AgvState.Connecting:
+            error = agv.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                self.disconnect(agv, reason=os.strerror(error))
+                return
+
+            # The AGV's server speaks first.
+            agv.state = AgvState.Handshaking
+
+        self.write(agv)
+
+    def on_readable(self, agv: AgvConnection) -> None:
+        try:
+            agv.reader.fill_buffer()
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.disconnect(agv, reason=str(e))
+            return
+
+        try:
+            # The framing may change with the handshake reply, so frames are
+            # parsed one at a time until it has been received.
+            while agv.state in [AgvState.Handshaking, AgvState.Negotiating]:
+                frames = agv.reader.parse_frames(limit=1)
+                if not frames:
+                    break
+
+                self.on_handshake(agv, frames[0])
+
+            frames = agv.reader.parse_frames() if agv.connected else []
+        except ValueError as e:
+            self.disconnect(agv, reason=str(e))
+            return
+
+        for msg in frames:
+            self.on_frame(agv, msg)
+
+        if agv.reader.closed and agv.sock is not None:
+            self.disconnect(agv, reason="closed by peer")
+
+    def on_handshake(self, agv: AgvConnection, msg: "str | CommandFrame"):
+        """Completes the handshake, one message at a time.
+
+        Args:
+            agv (AgvConnection): The AGV being connected to.
+            msg (str | CommandFrame): The received handshake message.
+        """
+
+        words = msg.split() if isinstance(msg, str) else []
+        if not words or words[0] != self.HANDSHAKE:
+            self.disconnect(agv, reason="handshake failed")
+            return
+
+        # The server's greeting, answered with the options offered.
+        if agv.state is AgvState.Handshaking:
+            agv.state = AgvState.Negotiating
+            offers = [
+                f"{SESSION}={agv.session_id}",
+                f"{ACKED}={agv.window.last_accepted}",
+                HEARTBEAT,
+            ]
+            if self.WIRE_FORMAT == "binary":
+                offers.append(wire_protocol.WIRE_BINARY)
+
+            self.queue_frame(agv, " ".join([self.HANDSHAKE, *offers]))
+            return
+
+        # The server's reply with the options it accepted.
+        accepted = words[1:]
+        if wire_protocol.WIRE_BINARY in accepted:
+            agv.is_binary = True
+            agv.reader.set_binary()
+
+        # Servers that do not resume sessions omit the option.
+        resumed = parse_options(accepted)
+        if SESSION in resumed:
+            for seq, command in agv.window.unaccepted(
+                int(resumed[ACKED] or 0)
+            ):
+                self.log.info("replaying", agv=agv.name, seq=seq)
+                self.queue_frame(
+                    agv, f"{wire_protocol.SEQUENCE_PREFIX}{seq} {command}"
+                )
+        else:
+            agv.window.reset()
+
+        agv.state = AgvState.Connected
+        agv.reconnect_delay = self.RECONNECT_DELAY
+        agv.monitor.reset()
+        agv.monitor.is_enabled = HEARTBEAT in accepted
+        self.log.info("connected", agv=agv.name, options=accepted)
+
+    def on_frame(self, agv: AgvConnection, msg: "str | CommandFrame") -> None:
+        """Dispatches a message received from a connected AGV.
+
+        Args:
+            agv (AgvConnection): The AGV that sent the message.
+            msg (str | CommandFrame): The received message.
+        """
+
+        if agv.monitor.on_message(msg):
+            return
+
+        if isinstance(msg, str):
+            # Acknowledgements are consumed by the send window.
+            ack = parse_ack(msg)
+            if ack is not None:
+                agv.window.on_ack(*ack)
+                return
+
+            if msg.startswith(AgvCommand.telemetry.value):
+                try:
+                    agv.telemetry = TelemetrySnapshot.from_message(msg)
+                except ValueError as e:
+                    self.log.warning("bad telemetry", agv=agv.name, error=e)
+                    return
+
+                agv.is_e_stopped = agv.telemetry.is_e_stopped
+                agv.is_halted = agv.telemetry.is_halted
+                return
+
+        self.log.debug("received", agv=agv.name, msg=msg)
+        if self.on_message is not None:
+            self.on_message(agv.name, msg)
+
+    def flush(self, agv: AgvConnection) -> None:
+        """Encodes the AGV's queued messages and sends what the socket
+        accepts.
+
+        Args:
+            agv (AgvConnection): The AGV with queued messages.
+        """
+
+        while agv.outbox:
+            self.queue_frame(agv, agv.outbox.popleft())
+
+    def queue_frame(self, agv: AgvConnection, msg: str) -> None:
+        self.log.debug("sending", agv=agv.name, msg=msg)
+        agv.out_buffer += agv.encode_message(msg)
+        self.write(agv)
+
+    def write(self, agv: AgvConnection) -> None:
+        """Sends as much of the AGV's pending bytes as the socket accepts,
+        and waits for it to become writable if any are left.
+
+        Args:
+            agv (AgvConnection): The AGV to send to.
+        """
+
+        if agv.sock is None:
+            return
+
+        if agv.out_buffer:
+            try:
+                sent = agv.sock.send(agv.out_buffer)
+                del agv.out_buffer[:sent]
+            except BlockingIOError:
+                pass
+            except OSError as e:
+                self.disconnect(agv, reason=str(e))
+                return
+
+        events = selectors.EVENT_READ
+        if agv.out_buffer:
+            events |= selectors.EVENT_WRITE
+        self.selector.modify(agv.sock, events, agv)
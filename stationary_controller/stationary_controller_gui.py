@@ -4,28 +4,31 @@ Author:     Ali Karimiafshar
 """
 
 import os
-import socket
 import sys
 import threading
 import tkinter as tk
 import turtle
 from os.path import isfile, join
-from time import sleep
+from time import monotonic, sleep
 from tkinter import ttk
 
 import numpy as np
 from onboard_controller.agv_command import AgvCommand
 from onboard_controller.instructions import Instruction
-from tools.agv_socket import AgvSocket
+from onboard_controller.route_upload import RouteUpload
 
+from stationary_controller.fleet_manager import AgvConnection, FleetManager
 from stationary_controller.mode import Mode
 from stationary_controller.styles import AgvStyles
 from stationary_controller.waypoint import Waypoint
+from tools.motion_estimator import MotionEstimator, read_route
+from tools.motion_profile import MotionProfile
 
-# Global Constants
-SERVER_IP = socket.gethostbyname(socket.gethostname() + ".local")
-SERVER_IP = "192.168.0.160"
-SERVER_PORT = 1234
+# unit: seconds
+# Longest the GUI waits for room in an AGV's window of unaccepted commands,
+# and how long a notice stays in the metrics textbox.
+SEND_TIMEOUT = 0.2
+NOTICE_TIME = 5.0
 
 
 class GUI(ttk.Frame):
@@ -52,9 +55,30 @@ class GUI(ttk.Frame):
         # self.mode = Mode.Teach
         # self.mode = Mode.Production
 
-        # Flags
-        self.is_e_stopped = False
-        self.is_halted = False
+        # Connections to every configured AGV, and the one being targeted
+        self.fleet = FleetManager(on_message=self.on_server_message)
+        if not self.fleet.agvs:
+            raise ValueError("The fleet option lists no AGVs to control.")
+
+        self.selected_agv = tk.StringVar(value=next(iter(self.fleet.agvs)))
+
+        # The e-stop and halt buttons show the selected AGV's state
+        self.selected_agv.trace_add(
+            "write", lambda *args: self.update_stop_buttons()
+        )
+
+        # Predicts how long routes take, and when the loaded one finishes
+        config = self.fleet.config
+        self.estimator = MotionEstimator(
+            MotionProfile.from_config(config),
+            drive_mode=config.drive_mode,
+            corner_radius=config.corner_radius,
+        )
+        self.route_finish: float = None
+
+        # Latest notice for the operator, and when it was shown
+        self.notice: str = None
+        self.notice_time = 0.0
 
         # Create Paness
         self.create_panes()
@@ -75,6 +99,12 @@ class GUI(ttk.Frame):
         th = threading.Thread(target=self.show_metrics_on_canvas, daemon=True)
         th.start()
 
+    @property
+    def client(self) -> AgvConnection:
+        """The connection to the AGV selected by the operator."""
+
+        return self.fleet.agv(self.selected_agv.get())
+
     def show_metrics_on_canvas(self) -> None:
         """Creates the metrics textbox. Updates every 250 milliseconds."""
         sleep(0.5)
@@ -93,12 +123,130 @@ class GUI(ttk.Frame):
 
             # Compose the content of the textbox
             text = f"X:\t{x_cor:.3f}\nY:\t{Y_cor:.3f}\nAngle:\t{angle:.1f}"
+            text += self.format_telemetry()
+            text += self.format_eta()
+            text += self.format_notice()
 
             # Set the textbox content
             self.canvas.itemconfigure(tag, text=text)
 
+            # The AGV's telemetry may have changed its e-stop or halt
+            self.update_stop_buttons()
+
             sleep(0.25)
 
+    def format_telemetry(self) -> str:
+        """Formats the latest AGV telemetry for the metrics textbox.
+
+        Returns:
+            str: The telemetry lines, or an empty string if none received.
+        """
+
+        agv = self.client
+        if not agv.connected:
+            return f"\n\nAGV:\t{agv.name} (disconnected)"
+
+        # Link quality from the heartbeat round-trip times
+        rtt = agv.monitor.rtt
+        link = (
+            f"\nLink:\t{rtt.percentile(0.5):.1f} ms "
+            f"(p99 {rtt.percentile(0.99):.1f} ms)"
+            if len(rtt)
+            else ""
+        )
+
+        t = agv.telemetry
+        if t is None:
+            return f"\n\nAGV:\t{agv.name}{link}"
+
+        command = f"{t.command} {t.value:g}" if t.command else "Idle"
+        flags = [
+            name
+            for name, is_set in [
+                ("E-STOP", t.is_e_stopped),
+                ("HALT", t.is_halted),
+                ("OBSTRUCTED", t.is_obstructed),
+                ("LVOS", t.is_left_vos_actuated),
+                ("RVOS", t.is_right_vos_actuated),
+            ]
+            if is_set
+        ]
+
+        return (
+            f"\n\nAGV:\t{agv.name} ({t.mode}){link}\n"
+            f"Command:\t{command} ({t.progress:.0%})\n"
+            f"Pulse error:\t{t.pulse_error:+d}\n"
+            f"Queued:\t{t.queue_depth}\n"
+            f"Flags:\t{' '.join(flags) or '-'}"
+        )
+
+    def format_eta(self) -> str:
+        """Formats the time left on the loaded route for the metrics
+        textbox.
+
+        Returns:
+            str: The ETA line, or an empty string if no route is running.
+        """
+
+        if self.route_finish is None:
+            return ""
+
+        remaining = self.route_finish - monotonic()
+        if remaining <= 0:
+            return ""
+
+        return f"\nETA:\t{remaining:.0f} s"
+
+    def format_notice(self) -> str:
+        """Formats the latest notice for the metrics textbox.
+
+        Returns:
+            str: The notice line, or an empty string once it has expired.
+        """
+
+        if self.notice is None or monotonic() - self.notice_time > NOTICE_TIME:
+            return ""
+
+        return f"\n\n{self.notice}"
+
+    def show_notice(self, notice: str) -> None:
+        print(notice)
+        self.notice = notice
+        self.notice_time = monotonic()
+
+    def send_command(self, msg: str) -> int:
+        """Sends a command to the selected AGV. Gives up if the AGV has not
+        accepted its earlier commands, so a busy or disconnected AGV does
+        not freeze the GUI.
+
+        Args:
+            msg (str): The command to be transmitted.
+
+        Returns:
+            int: The sequence number, or 0 if the command was not sent.
+        """
+
+        agv = self.client
+        try:
+            return agv.send_command(msg, timeout=SEND_TIMEOUT)
+        except TimeoutError:
+            command = msg.split()[0]
+            self.show_notice(
+                f"{agv.name} busy or disconnected, {command} not sent."
+            )
+            return 0
+
+    def on_server_message(self, name: str, msg) -> None:
+        """Handles a message received from an AGV. Telemetry is kept by the
+        fleet manager.
+
+        Args:
+            name (str): Name of the AGV that sent the message.
+            msg (str | CommandFrame): The received message.
+        """
+
+        print(f"[{name}] {msg}")
+
     def create_panes(self) -> None:
         """Creates the different panes and store them as instance variables"""
 
@@ -210,6 +358,16 @@ class GUI(ttk.Frame):
             row=1, column=1, sticky=tk.EW, padx=AgvStyles.PADDING
         )
 
+        # Pick which AGV the commands are sent to
+        ttk.Combobox(
+            self.mode_selection_pane,
+            textvariable=self.selected_agv,
+            values=list(self.fleet.agvs),
+            state="readonly",
+            font=(None, AgvStyles.FONT_SIZE),
+            width=10,
+        ).grid(row=0, column=2, sticky=tk.EW, padx=AgvStyles.PADDING)
+
         if self.connected_to_server:
             return
 
@@ -224,9 +382,7 @@ class GUI(ttk.Frame):
         )
 
     def connect_to_server(self):
-        self.client = AgvSocket(
-            ip=SERVER_IP, port=SERVER_PORT, isServer=False
-        )
+        self.fleet.start()
         self.btn_connect_to_server.state(["disabled"])
         self.style.map(
             "serverconn.TButton", background=[("disabled", "white")]
@@ -248,7 +404,7 @@ class GUI(ttk.Frame):
         self.style.map("teach.TButton", background=[("disabled", "green")])
 
         # Send to server
-        self.client.send_message(msg=f"{AgvCommand.set_mode.value} TEACH")
+        self.send_command(f"{AgvCommand.set_mode.value} TEACH")
 
         # Grid the appropriate pane
         self.update_and_grid_panes()
@@ -268,7 +424,7 @@ class GUI(ttk.Frame):
         self.style.map("prod.TButton", background=[("disabled", "green")])
 
         # Send to server
-        self.client.send_message(msg=f"{AgvCommand.set_mode.value} AUTO")
+        self.send_command(f"{AgvCommand.set_mode.value} AUTO")
 
         # Grid the appropriate pane
         self.update_and_grid_panes()
@@ -373,9 +529,6 @@ class GUI(ttk.Frame):
         file_name = f"{starting_name}_to_{destination_name}_coord.txt"
         self.route_name = f"{starting_name}_to_{destination_name}.txt"
 
-        self.client.send_message(f"STARTNAME {starting_name}")
-        self.client.send_message(f"ENDNAME {destination_name}")
-
         files: list[str] = self.get_route_files()
         if file_name not in files:
             print("Selected route not found in the saved routes.")
@@ -424,20 +577,16 @@ class GUI(ttk.Frame):
 
                     self.draw_station(station=wp, name=destination_name)
 
-        with open(file=f"./routes/{self.route_name}", mode="r") as file:
-            file.readline()
-
-            inst_list = file.readlines()
+        self.inst_list = read_route(f"./routes/{self.route_name}")
 
-            inst_list = [inst.strip().split() for inst in inst_list]
-            self.inst_list = []
-            for inst in inst_list:
-                cmd = AgvCommand(inst[0]).value
-                value = float(inst[1])
+        # Send the stations and every instruction in a single message.
+        route = RouteUpload(starting_name, destination_name, self.inst_list)
+        if not self.send_command(route.to_message()):
+            return
 
-                self.inst_list.append(Instruction(cmd, value))
-                msg = f"{cmd} {value}"
-                self.client.send_message(msg)
+        duration = self.estimator.route_time(self.inst_list)
+        self.route_finish = monotonic() + duration
+        print(f"Route estimated to take {duration:.1f} s.")
 
         self.traverse_waypoints(waypoints=waypoints, set_waypoints=True)
         print(
@@ -471,44 +620,48 @@ class GUI(ttk.Frame):
 
     def move_forward(self, dist: int = 10) -> None:
         dist = self.txt_intensity_value.get()
+        text = f"{AgvCommand.forward.value} {dist}"
+        if not self.send_command(text):
+            return
+
         self.turtle.forward(dist)
 
         inst = Instruction(command=AgvCommand.forward.value, value=dist)
         self.inst_list.append(inst)
 
-        text = f"{AgvCommand.forward.value} {dist}"
-        self.client.send_message(text)
-
     def move_backward(self, dist: int = 10):
         dist = self.txt_intensity_value.get()
+        text = f"{AgvCommand.backward.value} {dist}"
+        if not self.send_command(text):
+            return
+
         self.turtle.backward(dist)
 
         inst = Instruction(command=AgvCommand.backward.value, value=dist)
         self.inst_list.append(inst)
 
-        text = f"{AgvCommand.backward.value} {dist}"
-        self.client.send_message(text)
-
     def rotate_left(self, angle: int = 10):
         angle = self.txt_intensity_value.get()
+        text = f"{AgvCommand.rotate_ccw.value} {angle}"
+        if not self.send_command(text):
+            return
+
         self.turtle.left(angle)
 
         inst = Instruction(command=AgvCommand.rotate_ccw.value, value=angle)
         self.inst_list.append(inst)
 
-        text = f"{AgvCommand.rotate_ccw.value} {angle}"
-        self.client.send_message(text)
-
     def rotate_right(self, angle: int = 10):
         angle = self.txt_intensity_value.get()
+        text = f"{AgvCommand.rotate_cw.value} {angle}"
+        if not self.send_command(text):
+            return
+
         self.turtle.right(angle)
 
         inst = Instruction(command=AgvCommand.rotate_cw.value, value=angle)
         self.inst_list.append(inst)
 
-        text = f"{AgvCommand.rotate_cw.value} {angle}"
-        self.client.send_message(text)
-
     def store_waypoint(self):
         x = self.turtle.xcor()
         y = self.turtle.ycor()
@@ -679,9 +832,7 @@ class GUI(ttk.Frame):
             text="Calibrate Home",
             command=lambda: (
                 self.traverse_waypoints(self.waypoints),
-                self.client.send_message(
-                    f"{AgvCommand.calibrate_home.value} {0}"
-                ),
+                self.send_command(f"{AgvCommand.calibrate_home.value} {0}"),
             ),
         )
         self.btn_add_waypoint = ttk.Button(
@@ -765,40 +916,40 @@ class GUI(ttk.Frame):
         btn_save_route.grid(row=6, column=1)
 
     def halt(self):
-        self.client.send_message(AgvCommand.halt.value)
-        if not self.is_halted:
-            self.style.configure(
-                "halt.TButton",
-                background="red",
-                foreground="white",
-            )
-            self.is_halted = True
+        agv = self.client
+        if not agv.send_message(AgvCommand.halt.value):
+            self.show_notice(f"{agv.name} disconnected, HALT not sent.")
             return
 
-        self.style.configure(
-            "halt.TButton",
-            background="#fcc200",
-            foreground="black",
-        )
-        self.is_halted = False
+        agv.is_halted = not agv.is_halted
+        self.update_stop_buttons()
 
     def emergency_stop(self):
-        self.client.send_message(AgvCommand.e_stop.value)
-        if not self.is_e_stopped:
-            self.style.configure(
-                "estop.TButton",
-                background="red",
-                foreground="white",
-            )
-            self.is_e_stopped = True
+        agv = self.client
+        if not agv.send_message(AgvCommand.e_stop.value):
+            self.show_notice(f"{agv.name} disconnected, E-STOP not sent.")
             return
 
-        self.style.configure(
-            "estop.TButton",
-            background="#fcc200",
-            foreground="black",
-        )
-        self.is_e_stopped = False
+        agv.is_e_stopped = not agv.is_e_stopped
+        self.update_stop_buttons()
+
+    def update_stop_buttons(self) -> None:
+        """Colors the halt and e-stop buttons red while the selected AGV is
+        halted or e-stopped."""
+
+        agv = self.client
+        for style, is_set in [
+            ("halt.TButton", agv.is_halted),
+            ("estop.TButton", agv.is_e_stopped),
+        ]:
+            if is_set:
+                self.style.configure(
+                    style, background="red", foreground="white"
+                )
+            else:
+                self.style.configure(
+                    style, background="#fcc200", foreground="black"
+                )
 
     def on_click_txt_station_name(self, event):
         self.txt_var_station_name.set("")
@@ -0,0 +1,151 @@
+"""
+File:       tests/test_flow_control.py
+Author:     Ali Karimiafshar
+
+Drives the send window with the acknowledgements the AGV sends.
+Run from the repository root: python -m pytest tests
+"""
+
+import threading
+
+import pytest
+
+from tools.flow_control import (
+    ABORTED,
+    ACCEPTED,
+    EXECUTED,
+    SendWindow,
+    ack_message,
+    parse_ack,
+    parse_options,
+)
+
+MESSAGES = ["FORWARD 12.0", "ROTATECW 90.0", "FORWARD 6.0", "BACKWARD 3.0"]
+
+
+def fill(window: SendWindow) -> list[int]:
+    return [window.acquire(msg) for msg in MESSAGES]
+
+
+@pytest.mark.parametrize("kind", [ACCEPTED, EXECUTED, ABORTED])
+def test_ack_round_trip(kind: str) -> None:
+    assert parse_ack(ack_message(kind, 42)) == (kind, 42)
+
+
+@pytest.mark.parametrize(
+    "msg",
+    ["!ACK", "!ACK DONE 3", "!ACK EXECUTED x", "!ACK EXECUTED -1", "!HALT"],
+)
+def test_parse_ack_rejects(msg: str) -> None:
+    assert parse_ack(msg) is None
+
+
+def test_parse_options() -> None:
+    options = parse_options(["SESSION=1f2e", "ACKED=7", "WIRE"])
+
+    assert options == {"SESSION": "1f2e", "ACKED": "7", "WIRE": ""}
+
+
+def test_sequence_numbers_start_at_one() -> None:
+    window = SendWindow(len(MESSAGES))
+
+    assert fill(window) == [1, 2, 3, 4]
+    assert window.in_flight == len(MESSAGES)
+
+
+def test_accepted_is_cumulative() -> None:
+    window = SendWindow(len(MESSAGES))
+    fill(window)
+    window.on_ack(ACCEPTED, 3)
+
+    assert window.in_flight == 1
+    assert window.unaccepted(0) == [(4, MESSAGES[3])]
+
+    # Late or duplicate acknowledgements never move the window back.
+    window.on_ack(ACCEPTED, 1)
+    assert window.last_accepted == 3
+
+
+def test_ack_beyond_sent_is_clamped() -> None:
+    window = SendWindow(len(MESSAGES))
+    fill(window)
+    window.on_ack(ACCEPTED, 99)
+    window.on_ack(EXECUTED, 99)
+
+    assert window.last_accepted == len(MESSAGES)
+    assert window.last_executed == len(MESSAGES)
+
+
+def test_unaccepted_replayed_in_order() -> None:
+    window = SendWindow(len(MESSAGES))
+    fill(window)
+    window.on_ack(ACCEPTED, 1)
+
+    # After reconnecting, the AGV reports it had accepted up to 2.
+    assert window.unaccepted(2) == [(3, MESSAGES[2]), (4, MESSAGES[3])]
+
+
+def test_full_window_times_out() -> None:
+    window = SendWindow(2)
+    window.acquire(MESSAGES[0])
+    window.acquire(MESSAGES[1])
+
+    assert window.acquire(MESSAGES[2], timeout=0.01) is None
+    assert window.next_seq == 3
+
+
+def test_accept_unblocks_sender() -> None:
+    window = SendWindow(1)
+    window.acquire(MESSAGES[0])
+
+    timer = threading.Timer(0.05, window.on_ack, (ACCEPTED, 1))
+    timer.start()
+    assert window.acquire(MESSAGES[1], timeout=1.0) == 2
+    timer.join()
+
+
+def test_reset_gives_up_on_unaccepted() -> None:
+    window = SendWindow(len(MESSAGES))
+    fill(window)
+    window.reset()
+
+    assert window.in_flight == 0
+    assert window.unaccepted(0) == []
+    assert window.acquire(MESSAGES[0], timeout=0) == len(MESSAGES) + 1
+
+
+def test_executed_is_cumulative() -> None:
+    window = SendWindow(len(MESSAGES))
+    fill(window)
+    window.on_ack(EXECUTED, 3)
+
+    assert window.wait_executed(2, timeout=0)
+    assert window.wait_executed(3, timeout=0)
+    assert not window.wait_executed(4, timeout=0)
+
+
+def test_aborted_is_not_cumulative() -> None:
+    window = SendWindow(len(MESSAGES))
+    fill(window)
+    window.on_ack(EXECUTED, 1)
+    window.on_ack(ABORTED, 2)
+
+    assert window.wait_executed(1, timeout=0)
+    assert not window.wait_executed(2, timeout=0)
+    assert window.aborted == {2}
+
+    # Later messages still run after the aborted one.
+    window.on_ack(EXECUTED, 3)
+    assert window.wait_executed(3, timeout=0)
+    assert not window.wait_executed(2, timeout=0)
+
+
+def test_abort_wakes_waiter() -> None:
+    window = SendWindow(len(MESSAGES))
+    fill(window)
+
+    timer = threading.Timer(0.05, window.on_ack, (ABORTED, 1))
+    timer.start()
+    assert not window.wait_executed(1, timeout=5.0)
+    assert window.aborted == {1}
+    timer.join()
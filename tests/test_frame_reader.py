@@ -0,0 +1,141 @@
+"""
+File:       tests/test_frame_reader.py
+Author:     Ali Karimiafshar
+
+Feeds text and binary frames through a socket pair in awkward pieces.
+Run from the repository root: python -m pytest tests
+"""
+
+import socket
+
+import pytest
+
+from onboard_controller.agv_command import AgvCommand
+from tools import wire_protocol
+from tools.config import read_config
+from tools.frame_reader import FrameReader
+from tools.wire_protocol import CommandFrame
+
+CONFIG = read_config()
+HEADER_SIZE = CONFIG.socket_message_header_size
+ENCODING = CONFIG.socket_encoding_format
+
+MESSAGES = ["FORWARD 30.0", "#7 ROTATECW 90.0", "!HALT", "!TELEMETRY"]
+
+
+def encode_text(msg: str) -> bytes:
+    return f"{len(msg):<{HEADER_SIZE}}{msg}".encode(ENCODING)
+
+
+@pytest.fixture
+def pair():
+    sender, receiver = socket.socketpair()
+    yield sender, receiver
+    sender.close()
+    receiver.close()
+
+
+def test_many_frames_in_one_read(pair) -> None:
+    sender, receiver = pair
+    reader = FrameReader(receiver, HEADER_SIZE, ENCODING)
+    sender.sendall(b"".join(encode_text(msg) for msg in MESSAGES))
+
+    assert reader.read_frames() == MESSAGES
+    assert reader.start == reader.end == 0
+
+
+@pytest.mark.parametrize("split", [1, HEADER_SIZE - 1, HEADER_SIZE + 3])
+def test_partial_frame_waits_for_rest(pair, split: int) -> None:
+    sender, receiver = pair
+    reader = FrameReader(receiver, HEADER_SIZE, ENCODING)
+    frame = encode_text(MESSAGES[0])
+
+    sender.sendall(frame[:split])
+    reader.fill_buffer()
+    assert reader.parse_frames() == []
+
+    sender.sendall(frame[split:])
+    assert reader.read_frames() == [MESSAGES[0]]
+
+
+def test_limit_leaves_following_frames(pair) -> None:
+    sender, receiver = pair
+    reader = FrameReader(receiver, HEADER_SIZE, ENCODING)
+    sender.sendall(b"".join(encode_text(msg) for msg in MESSAGES))
+
+    assert reader.read_frame() == MESSAGES[0]
+    assert reader.parse_frames() == MESSAGES[1:]
+
+
+def test_oversized_frame_grows_buffer(pair) -> None:
+    sender, receiver = pair
+    reader = FrameReader(receiver, HEADER_SIZE, ENCODING, buffer_size=32)
+    msg = "\n".join(["FORWARD 12.0"] * 500)
+    sender.sendall(encode_text(msg) + encode_text(MESSAGES[2]))
+
+    frames = []
+    while len(frames) < 2:
+        frames += reader.read_frames()
+
+    assert frames == [msg, MESSAGES[2]]
+    assert len(reader.buffer) >= HEADER_SIZE + len(msg)
+
+
+def test_wrapped_frames_are_compacted(pair) -> None:
+    sender, receiver = pair
+    reader = FrameReader(receiver, HEADER_SIZE, ENCODING, buffer_size=100)
+    frame = encode_text(MESSAGES[1])
+
+    # Leave a partial frame near the end of the buffer on every read.
+    for _ in range(20):
+        sender.sendall(frame + frame[:5])
+        assert reader.read_frames() == [MESSAGES[1]]
+        sender.sendall(frame[5:])
+        assert reader.read_frames() == [MESSAGES[1]]
+
+    assert len(reader.buffer) == 100
+
+
+def test_malformed_header_raises(pair) -> None:
+    sender, receiver = pair
+    reader = FrameReader(receiver, HEADER_SIZE, ENCODING)
+    sender.sendall(b"x" * HEADER_SIZE)
+
+    with pytest.raises(ValueError):
+        reader.read_frames()
+
+
+def test_closed_peer_returns_no_frames(pair) -> None:
+    sender, receiver = pair
+    reader = FrameReader(receiver, HEADER_SIZE, ENCODING)
+    sender.sendall(encode_text(MESSAGES[0])[:5])
+    sender.close()
+
+    assert reader.read_frames() == []
+    assert reader.closed
+    assert reader.read_frame() is None
+
+
+def test_binary_frames_after_handshake(pair) -> None:
+    sender, receiver = pair
+    reader = FrameReader(receiver, HEADER_SIZE, ENCODING)
+    frames = [wire_protocol.encode_message(msg, ENCODING) for msg in MESSAGES]
+    data = encode_text(wire_protocol.WIRE_BINARY) + b"".join(frames)
+
+    # The handshake is read alone, then the framing changes.
+    sender.sendall(data[: HEADER_SIZE + 20])
+    assert reader.read_frame() == wire_protocol.WIRE_BINARY
+    reader.set_binary()
+
+    received = reader.parse_frames()
+    for i in range(HEADER_SIZE + 20, len(data)):
+        sender.sendall(data[i : i + 1])
+        reader.fill_buffer()
+        received += reader.parse_frames()
+
+    assert received == [
+        CommandFrame(AgvCommand.forward, 30.0),
+        CommandFrame(AgvCommand.rotate_cw, 90.0, seq=7),
+        CommandFrame(AgvCommand.halt),
+        CommandFrame(AgvCommand.telemetry),
+    ]
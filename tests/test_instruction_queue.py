@@ -0,0 +1,56 @@
+"""
+File:       tests/test_instruction_queue.py
+Author:     Ali Karimiafshar
+
+Checks that clearing the queue drops instructions still waiting for room.
+Run from the repository root: python -m pytest tests
+"""
+
+import threading
+import time
+
+from onboard_controller.instruction_queue import InstructionQueue
+from onboard_controller.instructions import Instruction
+
+ROUTE = [Instruction("FORWARD", 12.0), Instruction("ROTATECW", 90.0)]
+
+
+def test_fifo_order() -> None:
+    queue = InstructionQueue()
+    queue.put_many(ROUTE)
+    queue.put_front(Instruction("BACKWARD", 1.0))
+
+    assert queue.get(timeout=0) == Instruction("BACKWARD", 1.0)
+    assert queue.get(timeout=0) == ROUTE[0]
+    assert queue.get(timeout=0) == ROUTE[1]
+    assert queue.get(timeout=0) is None
+
+
+def test_stale_generation_dropped() -> None:
+    queue = InstructionQueue()
+    generation = queue.generation
+
+    assert queue.clear() == 0
+    assert not queue.put_many(ROUTE, generation)
+    assert len(queue) == 0
+    assert queue.put_many(ROUTE, queue.generation)
+
+
+def test_clear_releases_blocked_producer() -> None:
+    queue = InstructionQueue(maxsize=2)
+    queue.put_many(ROUTE)
+    generation = queue.generation
+    results = []
+
+    thread = threading.Thread(
+        target=lambda: results.append(queue.put_many(ROUTE, generation))
+    )
+    thread.start()
+    time.sleep(0.05)
+
+    assert thread.is_alive()
+    assert queue.clear() == len(ROUTE)
+    thread.join(timeout=1.0)
+
+    assert results == [False]
+    assert len(queue) == 0
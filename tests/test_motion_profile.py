@@ -0,0 +1,62 @@
+"""
+File:       tests/test_motion_profile.py
+Author:     Ali Karimiafshar
+
+Compares the motion profiles against the fixed stair ramp they replace.
+Run from the repository root: python -m pytest tests
+"""
+
+import pytest
+
+from tools.agv_tools import AgvTools
+from tools.config import read_config
+from tools.motion_profile import (
+    MotionProfile,
+    peak_acceleration,
+    ramp_duration,
+)
+
+# unit: inch
+DISTANCES = [1, 3, 6, 12, 24, 36.5, 60, 120]
+
+# Levels hold whole steps, so the measured acceleration overshoots the
+# limit slightly; the stair ramp reaches 2.62 in/s² on long moves.
+TOLERANCE = 1.05
+
+CONFIG = read_config()
+PROFILES = {
+    "trapezoid": MotionProfile(
+        max_velocity=CONFIG.motion_max_velocity,
+        acceleration=CONFIG.motion_acceleration,
+        levels=CONFIG.motion_profile_levels,
+    ),
+    "s_curve": MotionProfile(
+        max_velocity=CONFIG.motion_max_velocity,
+        acceleration=CONFIG.motion_acceleration,
+        jerk=4 * CONFIG.motion_acceleration,
+        levels=CONFIG.motion_profile_levels,
+    ),
+}
+
+
+@pytest.mark.parametrize("name", PROFILES)
+@pytest.mark.parametrize("inches", DISTANCES)
+def test_faster_than_stair_ramp(name: str, inches: float) -> None:
+    profile = PROFILES[name]
+    pulse_num = AgvTools.calc_pulse_num_from_dist(inches=inches)
+    stair = AgvTools.create_ramp_inputs(inches=inches)
+    ramp = profile.ramp(pulse_num)
+
+    assert sum(steps for _, steps in ramp) == pulse_num
+    assert ramp_duration(ramp) < ramp_duration(stair)
+    assert peak_acceleration(ramp) <= profile.acceleration * TOLERANCE
+
+
+@pytest.mark.parametrize("name", PROFILES)
+def test_short_moves_within_acceleration(name: str) -> None:
+    profile = PROFILES[name]
+    for pulse_num in range(1, 2000):
+        ramp = profile.ramp(pulse_num)
+
+        assert sum(steps for _, steps in ramp) == pulse_num
+        assert peak_acceleration(ramp) <= profile.acceleration * TOLERANCE
@@ -0,0 +1,79 @@
+"""
+File:       tests/test_route_upload.py
+Author:     Ali Karimiafshar
+
+Encodes routes as upload messages and verifies them on the way back.
+Run from the repository root: python -m pytest tests
+"""
+
+import pytest
+
+from onboard_controller.instructions import Instruction
+from onboard_controller.route_upload import RouteUpload
+
+INSTRUCTIONS = [
+    Instruction("FORWARD", 24.0),
+    Instruction("ROTATECW", 90.0),
+    Instruction("BACKWARD", 3.5),
+    Instruction("ROTATECCW", 45.0),
+]
+
+STATIONS = [
+    ("Home", "Station_1"),
+    ("Loading Dock", "Bay 2"),
+    ("Bob's Bench", 'The "Shelf"'),
+]
+
+
+@pytest.mark.parametrize("start_name, end_name", STATIONS)
+def test_round_trip(start_name: str, end_name: str) -> None:
+    route = RouteUpload(start_name, end_name, INSTRUCTIONS)
+    decoded = RouteUpload.from_message(route.to_message())
+
+    assert decoded == route
+    assert decoded.route_name == f"{start_name}_to_{end_name}"
+
+
+def test_empty_route() -> None:
+    route = RouteUpload("Home", "Home", [])
+
+    assert RouteUpload.from_message(route.to_message()) == route
+
+
+def test_lowercase_checksum_accepted() -> None:
+    route = RouteUpload("Home", "Station_1", INSTRUCTIONS)
+    header, body = route.to_message().split("\n", 1)
+    msg = f"{header[:-8]}{route.checksum().lower()}\n{body}"
+
+    assert RouteUpload.from_message(msg) == route
+
+
+def test_altered_instruction_rejected() -> None:
+    msg = RouteUpload("Home", "Station_1", INSTRUCTIONS).to_message()
+
+    with pytest.raises(ValueError, match="Checksum"):
+        RouteUpload.from_message(msg.replace("24.0", "42.0"))
+
+
+def test_dropped_instruction_rejected() -> None:
+    msg = RouteUpload("Home", "Station_1", INSTRUCTIONS).to_message()
+
+    with pytest.raises(ValueError, match="Checksum"):
+        RouteUpload.from_message(msg.rsplit("\n", 1)[0])
+
+
+@pytest.mark.parametrize(
+    "msg",
+    [
+        "!ROUTE Home Station_1",
+        "!ROUTE Loading Dock Bay 2 00000000",
+        "!TRAVERSE Home Station_1 00000000",
+        "!ROUTE Home Station_1 00000000\nFORWARD",
+        "!ROUTE Home Station_1 00000000\nFORWARD 1.0 2.0",
+        "!ROUTE Home Station_1 00000000\nSIDEWAYS 1.0",
+        "!ROUTE Home Station_1 00000000\n!HALT 1.0",
+    ],
+)
+def test_malformed_rejected(msg: str) -> None:
+    with pytest.raises(ValueError):
+        RouteUpload.from_message(msg)
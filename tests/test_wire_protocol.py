@@ -0,0 +1,100 @@
+"""
+File:       tests/test_wire_protocol.py
+Author:     Ali Karimiafshar
+
+Round-trips text protocol messages through the binary wire format.
+Run from the repository root: python -m pytest tests
+"""
+
+import pytest
+
+from onboard_controller.agv_command import AgvCommand
+from tools import wire_protocol
+from tools.wire_protocol import HEADER, CommandFrame
+
+ENCODING = "utf-8"
+
+# Messages with a compact command encoding, and the decoded command.
+COMMAND_MESSAGES = {
+    "FORWARD 30.0": CommandFrame(AgvCommand.forward, 30.0),
+    "BACKWARD 0.5": CommandFrame(AgvCommand.backward, 0.5),
+    "ROTATECW 90": CommandFrame(AgvCommand.rotate_cw, 90.0),
+    "rotateccw 45.25": CommandFrame(AgvCommand.rotate_ccw, 45.25),
+    "CALIBRATEHOME": CommandFrame(AgvCommand.calibrate_home),
+    "!ESTOP": CommandFrame(AgvCommand.e_stop),
+    "!HALT": CommandFrame(AgvCommand.halt),
+    "!TELEMETRY": CommandFrame(AgvCommand.telemetry),
+    "#12 FORWARD 6.0": CommandFrame(AgvCommand.forward, 6.0, seq=12),
+    "#4294967295 !HALT": CommandFrame(AgvCommand.halt, seq=4294967295),
+}
+
+# Messages that must fall back to a text frame.
+TEXT_MESSAGES = [
+    "!TRAVERSE Home Station_1",
+    "!SETMODE TEACH",
+    "!ROUTE Home Station_1 1A2B3C4D\nFORWARD 12.0",
+    "!ACK EXECUTED 3",
+    "!PING",
+    "FORWARD far",
+    "!HALT now",
+    "#x FORWARD 1.0",
+    "",
+]
+
+
+def decode(frame: bytes) -> "str | CommandFrame":
+    kind, length = HEADER.unpack_from(frame)
+    payload = memoryview(frame)[HEADER.size :]
+
+    assert len(payload) == length
+    return wire_protocol.decode_payload(kind, payload, ENCODING)
+
+
+@pytest.mark.parametrize("msg", COMMAND_MESSAGES)
+def test_command_round_trip(msg: str) -> None:
+    frame = decode(wire_protocol.encode_message(msg, ENCODING))
+
+    assert frame == COMMAND_MESSAGES[msg]
+
+
+@pytest.mark.parametrize("msg", TEXT_MESSAGES)
+def test_text_round_trip(msg: str) -> None:
+    assert decode(wire_protocol.encode_message(msg, ENCODING)) == msg
+
+
+def test_every_opcode_round_trips() -> None:
+    for command, opcode in wire_protocol.OPCODES.items():
+        frame = CommandFrame(command, 1.5, seq=opcode, flags=1)
+
+        assert decode(wire_protocol.encode_command(frame)) == frame
+
+
+def test_unknown_opcode_raises() -> None:
+    payload = wire_protocol.COMMAND.pack(255, 0, 1, 0.0)
+
+    with pytest.raises(ValueError):
+        wire_protocol.decode_payload(
+            wire_protocol.KIND_COMMAND, memoryview(payload), ENCODING
+        )
+
+
+def test_unknown_kind_raises() -> None:
+    with pytest.raises(ValueError):
+        wire_protocol.decode_payload(9, memoryview(b""), ENCODING)
+
+
+@pytest.mark.parametrize(
+    "msg, is_control",
+    [
+        ("!ESTOP", True),
+        ("#3 !halt", True),
+        (CommandFrame(AgvCommand.e_stop), True),
+        ("FORWARD 1.0", False),
+        (CommandFrame(AgvCommand.forward, 1.0), False),
+        ("", False),
+    ],
+)
+def test_is_control_message(
+    msg: "str | CommandFrame", is_control: bool
+) -> None:
+    assert wire_protocol.is_control_message(msg) == is_control
@@ -0,0 +1,551 @@
+"""
+File:       tools/agv_async_socket.py
+Author:     Ali Karimiafshar
+"""
+
+import asyncio
+import functools
+import queue
+import threading
+from typing import Callable
+
+from tools import wire_protocol
+from tools.agv_logger import get_logger
+from tools.config import read_config
+from tools.flow_control import ABORTED, EXECUTED, ack_message, parse_ack
+from tools.heartbeat import HEARTBEAT, LinkMonitor
+
+
+class AsyncAgvServer:
+    def __init__(self, ip: str, port: int) -> None:
+        """Asyncio server for transmitting messages between the AGV and any
+        number of Controllers or monitoring tools. Uses the same framing and
+        handshake as AgvSocket, but serves every client from one event loop.
+
+        Args:
+            ip (str): The IP address of the server
+            port (int): The Port number of the server
+        """
+
+        # Configuration values
+        self.config = read_config()
+        self.FORMAT = self.config.socket_encoding_format
+        self.HEADERSIZE = self.config.socket_message_header_size
+        self.DISCONNECT_MESSAGE = self.config.socket_disconnect_message
+        self.HANDSHAKE = self.config.socket_establish_connection_message
+
+        self.log = get_logger("agv_async_socket")
+
+        # Unsent bytes above which a client is considered backed up.
+        self.WRITE_BUFFER_LIMIT = 65536
+
+        # Instance variables passed
+        self.ip = ip
+        self.port = port
+        self.isServer = True
+
+        self.loop: asyncio.AbstractEventLoop = None
+        self.server: asyncio.Server = None
+        self.clients: dict[tuple[str, int], asyncio.StreamWriter] = {}
+
+        # True while the server is accepting clients.
+        self.connected = False
+        self.running = False
+
+        # Heartbeats are broadcast, so the link is only lost once every
+        # client has fallen silent.
+        self.monitor = LinkMonitor(
+            send=self.send_message,
+            interval=self.config.heartbeat_interval,
+            timeout=self.config.heartbeat_timeout,
+            is_connected=lambda: bool(self.clients),
+        )
+
+        # Heartbeats start once a client agrees to them.
+        self.monitor.is_enabled = False
+
+        # Each client numbers its commands from 1, so they are renumbered
+        # on arrival. The sender and its own sequence number are kept, by
+        # the server's number, until the command is executed, so that
+        # acknowledgements reach only the client that sent the command.
+        self.next_seq = 1
+        self.senders: dict[int, tuple[tuple[str, int], int]] = {}
+        self.mutex = threading.Lock()
+
+    def start_server(
+        self,
+        message_queue: queue.Queue,
+        control_handler: Callable[[str], None] = None,
+        link_handler: Callable[[bool], None] = None,
+    ) -> None:
+        """Starts the event loop in a background thread. Messages received
+        from any client are put on the message queue.
+
+        Args:
+            message_queue (queue.Queue): Queue the received messages are
+                put on.
+            control_handler (Callable[[str], None], optional): Called
+                directly from the event loop with e-stop and halt messages.
+                Defaults to None, which queues them like any other message.
+            link_handler (Callable[[bool], None], optional): Called with
+                False when every client's heartbeats stop, and with True
+                once they resume. Defaults to None.
+        """
+
+        if link_handler is not None:
+            self.monitor.on_lost = lambda: link_handler(False)
+            self.monitor.on_restored = lambda: link_handler(True)
+
+        def on_message(msg: str, addr: tuple[str, int]) -> None:
+            reply = functools.partial(self.send_message, addr=addr)
+            if self.monitor.on_message(msg, reply):
+                return
+
+            # Safety commands skip the queue and are acted on first.
+            if control_handler and wire_protocol.is_control_message(msg):
+                control_handler(msg)
+                return
+
+            message_queue.put(self.renumber(msg, addr))
+
+        started = threading.Event()
+        thread = threading.Thread(
+            target=asyncio.run,
+            args=(self.serve(on_message, started),),
+            daemon=True,
+        )
+        thread.start()
+        started.wait()
+        self.monitor.start()
+
+    async def serve(
+        self,
+        on_message: Callable[[str, tuple[str, int]], None],
+        started: threading.Event = None,
+    ) -> None:
+        """Accepts clients until the server is closed.
+
+        Args:
+            on_message (Callable[[str, tuple[str, int]], None]): Called with
+                every message received and the address of its sender.
+            started (threading.Event, optional): Set once the server is
+                listening. Defaults to None.
+        """
+
+        self.loop = asyncio.get_running_loop()
+        self.on_message = on_message
+
+        self.server = await asyncio.start_server(
+            self.handle_client, self.ip, self.port, reuse_address=True
+        )
+
+        self.log.info("server starting")
+        self.log.info("listening", ip=self.ip, port=self.port)
+        self.connected = True
+        self.running = True
+        if started is not None:
+            started.set()
+
+        async with self.server:
+            try:
+                await self.server.serve_forever()
+            except asyncio.CancelledError:
+                # Closed by cleanup_server.
+                pass
+
+    def cleanup_server(self) -> None:
+        """Stops the heartbeats, disconnects every client and stops
+        accepting new ones. Safe to call from any thread."""
+
+        self.log.info("program ended, starting cleanup")
+        self.monitor.stop()
+        self.running = False
+        self.connected = False
+
+        if self.loop is None:
+            return
+
+        def close() -> None:
+            self.server.close()
+            for writer in list(self.clients.values()):
+                writer.close()
+
+        self.loop.call_soon_threadsafe(close)
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Performs the handshake, then receives messages from the client
+        until it disconnects.
+
+        Args:
+            reader (asyncio.StreamReader): Stream of the client's messages.
+            writer (asyncio.StreamWriter): Stream to the client.
+        """
+
+        addr = writer.get_extra_info("peername")
+
+        try:
+            writer.write(self.encode_message(self.HANDSHAKE))
+            response = await read_frame(reader, self.HEADERSIZE, self.FORMAT)
+            words = response.split()
+            if not words or words[0] != self.HANDSHAKE:
+                self.log.error("client handshake failed", addr=addr)
+                return
+
+            # Decline any handshake options other than heartbeats, such as
+            # the binary protocol.
+            if len(words) > 1:
+                accepted = [o for o in words[1:] if o == HEARTBEAT]
+                reply = " ".join([self.HANDSHAKE, *accepted])
+                writer.write(self.encode_message(reply))
+                if accepted:
+                    self.monitor.is_enabled = True
+
+            self.log.info("new connection", addr=addr)
+            self.clients[addr] = writer
+
+            while True:
+                msg = await read_frame(reader, self.HEADERSIZE, self.FORMAT)
+                self.log.debug("received", addr=addr, msg=msg)
+
+                if msg == self.DISCONNECT_MESSAGE:
+                    break
+
+                self.on_message(msg, addr)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            self.log.warning("connection lost", addr=addr)
+        finally:
+            self.log.info("closing connection", addr=addr)
+            self.clients.pop(addr, None)
+            writer.close()
+
+    def encode_message(self, msg: str) -> bytes:
+        """Prepends the length header to the encoded message.
+
+        Args:
+            msg (str): The message to be transmitted.
+
+        Returns:
+            bytes: The frame to be written to the stream.
+        """
+
+        return encode_frame(msg, self.HEADERSIZE, self.FORMAT)
+
+    def renumber(self, msg: str, addr: tuple[str, int]) -> str:
+        """Replaces the sequence number of a client's command with one
+        unique across clients.
+
+        Args:
+            msg (str): The received message.
+            addr (tuple[str, int]): The address of its sender.
+
+        Returns:
+            str: The message with the server's sequence number, or as it
+                was if unsequenced.
+        """
+
+        seq, body = wire_protocol.split_sequence(msg)
+        if not seq:
+            return msg
+
+        with self.mutex:
+            server_seq = self.next_seq
+            self.next_seq += 1
+            self.senders[server_seq] = (addr, seq)
+
+        return f"{wire_protocol.SEQUENCE_PREFIX}{server_seq} {body}"
+
+    def route_ack(self, kind: str, seq: int) -> list:
+        """Translates a cumulative acknowledgement of the server's sequence
+        numbers into one for each client with commands up to seq. An abort
+        is only of seq, so goes only to its sender.
+
+        Args:
+            kind (str): ACCEPTED, EXECUTED or ABORTED.
+            seq (int): The server's sequence number acknowledged.
+
+        Returns:
+            list[tuple[str, tuple[str, int]]]: Each client's
+                acknowledgement message and address.
+        """
+
+        with self.mutex:
+            if kind == ABORTED:
+                sender = self.senders.pop(seq, None)
+                if sender is None:
+                    return []
+
+                addr, client_seq = sender
+                return [(ack_message(kind, client_seq), addr)]
+
+            acked: dict[tuple[str, int], int] = {}
+            for server_seq, (addr, client_seq) in self.senders.items():
+                if server_seq <= seq:
+                    acked[addr] = max(acked.get(addr, 0), client_seq)
+
+            # Nothing is acknowledged after being executed.
+            if kind == EXECUTED:
+                self.senders = {
+                    s: sender for s, sender in self.senders.items() if s > seq
+                }
+
+        return [
+            (ack_message(kind, client_seq), addr)
+            for addr, client_seq in acked.items()
+        ]
+
+    def send_message(self, msg: str, addr: tuple[str, int] = None) -> None:
+        """Sends the message to one client, or to every connected client.
+        Acknowledgements go only to the clients whose commands they cover.
+        Safe to call from any thread.
+
+        Args:
+            msg (str): The message to be transmitted.
+            addr (tuple[str, int], optional): The address of the recipient.
+                Defaults to None, which sends to every client.
+        """
+
+        if self.loop is None:
+            return
+
+        ack = parse_ack(msg) if addr is None else None
+        if ack is not None:
+            for client_ack, client in self.route_ack(*ack):
+                self.send_message(client_ack, client)
+            return
+
+        self.log.debug("sending", msg=msg)
+        self.loop.call_soon_threadsafe(
+            self.write_message, self.encode_message(msg), addr
+        )
+
+    def can_send(self) -> bool:
+        """Checks whether every client is keeping up with its messages.
+
+        Returns:
+            bool: True if no client has a backlog of unsent bytes.
+        """
+
+        return all(
+            writer.transport.get_write_buffer_size() < self.WRITE_BUFFER_LIMIT
+            for writer in list(self.clients.values())
+        )
+
+    def try_send_message(self, msg: str) -> bool:
+        """Sends the message to every client unless one is backed up.
+
+        Args:
+            msg (str): The message to be transmitted.
+
+        Returns:
+            bool: True if the message was sent.
+        """
+
+        if not self.can_send():
+            return False
+
+        self.send_message(msg)
+        return True
+
+    def write_message(self, frame: bytes, addr: tuple[str, int]) -> None:
+        """Writes an encoded frame to the clients. Runs on the event loop.
+
+        Args:
+            frame (bytes): The encoded frame.
+            addr (tuple[str, int]): The address of the recipient, or None
+                for every client.
+        """
+
+        if addr is None:
+            writers = list(self.clients.values())
+        else:
+            writers = [self.clients[addr]] if addr in self.clients else []
+
+        for writer in writers:
+            if not writer.is_closing():
+                writer.write(frame)
+
+
+class AsyncAgvClient:
+    def __init__(self, ip: str, port: int) -> None:
+        """Asyncio client for the AgvSocket and AsyncAgvServer servers.
+
+        Args:
+            ip (str): The IP address of the server
+            port (int): The Port number of the server
+        """
+
+        # Configuration values
+        self.config = read_config()
+        self.FORMAT = self.config.socket_encoding_format
+        self.HEADERSIZE = self.config.socket_message_header_size
+        self.DISCONNECT_MESSAGE = self.config.socket_disconnect_message
+        self.HANDSHAKE = self.config.socket_establish_connection_message
+
+        # Instance variables passed
+        self.ip = ip
+        self.port = port
+
+        self.reader: asyncio.StreamReader = None
+        self.writer: asyncio.StreamWriter = None
+        self.connected = False
+
+        self.log = get_logger("agv_async_socket")
+
+        # Heartbeats in both directions, if the server accepts them. Those
+        # of the server are answered while messages are being read.
+        self.monitor = LinkMonitor(
+            send=self.write_message,
+            interval=self.config.heartbeat_interval,
+            timeout=self.config.heartbeat_timeout,
+            is_connected=lambda: self.connected,
+        )
+        self.monitor.on_lost = self.on_link_lost
+        self.heartbeat: asyncio.Task = None
+
+    async def connect(self) -> bool:
+        """Opens the connection and exchanges the handshake.
+
+        Returns:
+            bool: True if the handshake was successful, or False otherwise.
+        """
+
+        self.reader, self.writer = await asyncio.open_connection(
+            self.ip, self.port
+        )
+
+        response = await self.read_message()
+        if response != self.HANDSHAKE:
+            self.log.error("server handshake failed")
+            return False
+
+        # The server replies with the options it accepted.
+        await self.send_message(f"{self.HANDSHAKE} {HEARTBEAT}")
+        response = await self.read_message()
+        words = response.split() if response else []
+        if not words or words[0] != self.HANDSHAKE:
+            self.log.error("server handshake failed")
+            return False
+
+        self.log.info("connected to server", options=words[1:])
+        self.connected = True
+        self.monitor.reset()
+        self.monitor.is_enabled = HEARTBEAT in words[1:]
+        if self.monitor.is_enabled:
+            self.heartbeat = asyncio.create_task(self.beat())
+
+        return True
+
+    async def beat(self) -> None:
+        """Sends heartbeats and checks for silence until disconnected."""
+
+        while self.connected:
+            self.monitor.poll()
+            await asyncio.sleep(self.monitor.period)
+
+    def on_link_lost(self) -> None:
+        """Closes the connection, which is dead even if the operating system
+        has not noticed yet."""
+
+        self.log.warning(
+            "heartbeat lost", silence=round(self.monitor.silence, 3)
+        )
+        self.connected = False
+        self.writer.close()
+
+    async def read_message(self) -> str:
+        """Receives a message from the server, answering any heartbeats
+        that arrive first.
+
+        Returns:
+            str | None: The received message, or None if the connection
+                closed.
+        """
+
+        while True:
+            try:
+                msg = await read_frame(
+                    self.reader, self.HEADERSIZE, self.FORMAT
+                )
+            except (asyncio.IncompleteReadError, ConnectionError):
+                self.log.info("connection closed")
+                self.connected = False
+                return
+
+            if not self.monitor.on_message(msg):
+                return msg
+
+    async def send_message(self, msg: str) -> None:
+        """Sends the message to the server.
+
+        Args:
+            msg (str): The message to be transmitted.
+        """
+
+        self.write_message(msg)
+        await self.writer.drain()
+
+    def write_message(self, msg: str) -> None:
+        """Writes the message without waiting for it to be sent. Must be
+        called from the event loop.
+
+        Args:
+            msg (str): The message to be transmitted.
+        """
+
+        if self.writer.is_closing():
+            return
+
+        self.writer.write(encode_frame(msg, self.HEADERSIZE, self.FORMAT))
+
+    async def close(self) -> None:
+        """Sends the disconnect message and closes the connection."""
+
+        if self.heartbeat is not None:
+            self.heartbeat.cancel()
+
+        if self.connected:
+            await self.send_message(self.DISCONNECT_MESSAGE)
+            self.connected = False
+
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+def encode_frame(msg: str, header_size: int, encoding: str) -> bytes:
+    """Prepends the space-padded length header to the encoded message.
+
+    Args:
+        msg (str): The message to be transmitted.
+        header_size (int): Size of the length header.
+        encoding (str): Encoding of the message.
+
+    Returns:
+        bytes: The frame.
+    """
+
+    payload = msg.encode(encoding)
+    return f"{len(payload):<{header_size}}".encode(encoding) + payload
+
+
+async def read_frame(
+    reader: asyncio.StreamReader, header_size: int, encoding: str
+) -> str:
+    """Reads one length-prefixed frame from the stream.
+
+    Args:
+        reader (asyncio.StreamReader): The stream to read from.
+        header_size (int): Size of the length header.
+        encoding (str): Encoding of the message.
+
+    Raises:
+        asyncio.IncompleteReadError: The stream closed mid-frame.
+
+    Returns:
+        str: The decoded message.
+    """
+
+    header = await reader.readexactly(header_size)
+    payload = await reader.readexactly(int(header))
+    return payload.decode(encoding)
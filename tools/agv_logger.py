@@ -0,0 +1,189 @@
+"""
+File:       tools/agv_logger.py
+Author:     Ali Karimiafshar
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from enum import IntEnum
+
+from tools.config import read_config
+
+
+class LogLevel(IntEnum):
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
+    ERROR = 40
+
+
+class LogSink:
+    def __init__(
+        self,
+        level: LogLevel,
+        file_path: str,
+        max_bytes: int,
+        backup_count: int,
+        ring_size: int = 4096,
+        flush_interval: float = 0.1,
+    ) -> None:
+        """Collects log records in an in-memory ring buffer that a background
+        thread drains to the console and a rotating log file, so logging
+        never waits on a slow console or disk.
+
+        Args:
+            level (LogLevel): Records below this level are discarded.
+            file_path (str): The log file. Empty to only log to the console.
+            max_bytes (int): Size at which the log file is rotated.
+            backup_count (int): Number of rotated log files kept.
+            ring_size (int, optional): Records held before the oldest are
+                overwritten. Defaults to 4096.
+            flush_interval (float, optional): Seconds between drains.
+                Defaults to 0.1.
+        """
+
+        self.level = level
+        self.file_path = file_path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+
+        # deque appends and pops are atomic, so producers take no lock.
+        self.records: deque[tuple] = deque(maxlen=ring_size)
+        self.mutex_drain = threading.Lock()
+
+        self.file = None
+        if file_path:
+            os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+            self.file = open(file_path, "a", encoding="utf-8")
+
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        atexit.register(self.drain)
+
+    def emit(
+        self, level: LogLevel, name: str, event: str, fields: dict
+    ) -> None:
+        self.records.append((time.time(), level, name, event, fields))
+
+    def run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            self.drain()
+
+    def drain(self) -> None:
+        """Writes out every buffered record."""
+
+        with self.mutex_drain:
+            while self.records:
+                timestamp, level, name, event, fields = self.records.popleft()
+
+                details = " ".join(f"{k}={v}" for k, v in fields.items())
+                print(f"[{level.name}] {name}: {event} {details}".rstrip())
+
+                if self.file is None:
+                    continue
+
+                record = {
+                    "ts": round(timestamp, 6),
+                    "level": level.name,
+                    "logger": name,
+                    "event": event,
+                    **fields,
+                }
+                self.file.write(json.dumps(record, default=str) + "\n")
+
+            if self.file is not None:
+                self.file.flush()
+                if self.file.tell() >= self.max_bytes:
+                    self.rotate()
+
+    def rotate(self) -> None:
+        """Renames agv.log to agv.log.1, agv.log.1 to agv.log.2 and so on,
+        dropping the oldest, then starts a new log file."""
+
+        self.file.close()
+
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.file_path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.file_path}.{i + 1}")
+
+        if self.backup_count > 0:
+            os.replace(self.file_path, f"{self.file_path}.1")
+        else:
+            os.remove(self.file_path)
+
+        self.file = open(self.file_path, "a", encoding="utf-8")
+
+
+class AgvLogger:
+    def __init__(self, name: str, sink: LogSink) -> None:
+        """Leveled, structured logger. Each call records an event name and
+        keyword fields, e.g. log.debug("sending", length=12, msg=msg).
+
+        Args:
+            name (str): Name of the component logging.
+            sink (LogSink): The shared sink the records are written to.
+        """
+
+        self.name = name
+        self.sink = sink
+
+    def is_enabled(self, level: LogLevel) -> bool:
+        return level >= self.sink.level
+
+    def log(self, level: LogLevel, event: str, **fields) -> None:
+        if level < self.sink.level:
+            return
+
+        self.sink.emit(level, self.name, event, fields)
+
+    def debug(self, event: str, **fields) -> None:
+        if LogLevel.DEBUG < self.sink.level:
+            return
+
+        self.sink.emit(LogLevel.DEBUG, self.name, event, fields)
+
+    def info(self, event: str, **fields) -> None:
+        self.log(LogLevel.INFO, event, **fields)
+
+    def warning(self, event: str, **fields) -> None:
+        self.log(LogLevel.WARNING, event, **fields)
+
+    def error(self, event: str, **fields) -> None:
+        self.log(LogLevel.ERROR, event, **fields)
+
+
+_sink: LogSink = None
+_mutex_sink = threading.Lock()
+
+
+def get_logger(name: str) -> AgvLogger:
+    """Returns a logger writing to the process-wide sink, creating the sink
+    from the configuration on first use.
+
+    Args:
+        name (str): Name of the component logging.
+
+    Returns:
+        AgvLogger: The logger.
+    """
+
+    global _sink
+
+    with _mutex_sink:
+        if _sink is None:
+            config = read_config()
+            _sink = LogSink(
+                level=LogLevel[config.log_level.upper()],
+                file_path=config.log_file,
+                max_bytes=config.log_max_bytes,
+                backup_count=config.log_backup_count,
+            )
+
+    return AgvLogger(name, _sink)
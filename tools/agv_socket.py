@@ -4,14 +4,41 @@ Author:     Ali Karimiafshar
 """
 
 import atexit
+import queue
 import socket
 import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable
 
+from tools import wire_protocol
+from tools.agv_logger import LogLevel, get_logger
 from tools.config import read_config
+from tools.flow_control import (
+    ACCEPTED,
+    ACKED,
+    EXECUTED,
+    SESSION,
+    SendWindow,
+    ack_message,
+    parse_ack,
+    parse_options,
+)
+from tools.frame_reader import FrameReader
+from tools.heartbeat import HEARTBEAT, LinkMonitor
+from tools.transport import TcpTransport, Transport
+from tools.wire_protocol import CommandFrame
 
 
 class AgvSocket:
-    def __init__(self, ip: str, port: int, isServer: bool = False) -> None:
+    def __init__(
+        self,
+        ip: str,
+        port: int,
+        isServer: bool = False,
+        transport: Transport = None,
+    ) -> None:
         """Server or client socket for transmitting messages between the
         AGV and Controller.
 
@@ -20,6 +47,10 @@ class AgvSocket:
             port (int): The Port number of the server/client
             isServer (bool, optional): Dictates whether this object is
                 the server or client. Defaults to False.
+            transport (Transport, optional): Carries the connection instead
+                of TCP, such as a Unix socket or an in-process pipe for
+                tools running alongside the Controller. Defaults to None,
+                which uses TCP to ip and port.
         """
 
         # Configuration values
@@ -29,114 +60,700 @@ class AgvSocket:
         self.DISCONNECT_MESSAGE = self.config.socket_disconnect_message
         self.HANDSHAKE = self.config.socket_establish_connection_message
         self.MESSAGE_RECEIVED = "!TRANSMITTED"
+        self.WIRE_FORMAT = self.config.socket_wire_format
+        self.RECONNECT_DELAY = 0.5
+        self.RECONNECT_MAX_DELAY = self.config.socket_reconnect_max_delay
+
+        # unit: seconds
+        # Longest wait for the peer's side of the handshake.
+        self.HANDSHAKE_TIMEOUT = 2.0
+
+        self.log = get_logger("agv_socket")
 
         # Instance variables passed
         self.ip = ip
         self.port = port
         self.isServer = isServer
+        self.transport = transport or TcpTransport(ip, port)
+
+        # Frames received but not yet handed out by read_message.
+        self.pending_messages: deque[str | CommandFrame] = deque()
+
+        # Whether the binary protocol was negotiated at handshake.
+        self.is_binary = False
+
+        # Serializes frames sent from several threads.
+        self.mutex_send = threading.Lock()
+
+        # Rest of a frame partly sent without blocking, which must go out
+        # before any other.
+        self.unsent = b""
+
+        # Called from the receiving thread for e-stop and halt messages.
+        self.control_handler: Callable[[str | CommandFrame], None] = None
+
+        # Sequence numbers and acknowledgements of sent commands.
+        self.window = SendWindow(self.config.socket_ack_window)
+
+        # Heartbeats in both directions, and the watchdog on the link.
+        self.monitor = LinkMonitor(
+            send=self.send_message,
+            interval=self.config.heartbeat_interval,
+            timeout=self.config.heartbeat_timeout,
+            is_connected=lambda: self.connected,
+        )
+        self.monitor.on_lost = self.on_link_lost
+        self.monitor.on_restored = self.on_link_restored
+
+        # Called with False when the link is lost, and True once restored.
+        self.link_handler: Callable[[bool], None] = None
+
+        # Identifies the client across reconnections. The server remembers
+        # the last sequence number received in the session, so commands
+        # replayed after reconnecting are not carried out twice.
+        self.session_id: str = None
+        self.last_received_seq = 0
+        self.acks_sent = {ACCEPTED: 0, EXECUTED: 0}
+
+        # Last sequence number the server received before reconnecting, or
+        # None if the session was not resumed.
+        self.resumed_seq: int = None
+
+        # True while a client is connected and has completed the handshake.
+        self.connected = False
+
+        # True while the server is accepting clients.
+        self.running = False
+
+        # Set once the client is closed on purpose, so it stays closed.
+        self.is_closing = False
 
         if isServer:
-            self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server.bind((ip, port))
+            self.handler: threading.Thread = None
+            self.transport.listen()
         else:
-            self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.client.connect((ip, port))
+            self.session_id = uuid.uuid4().hex[:8]
             atexit.register(self.cleanup_server)
-            self.connected = self.establish_connection()
+            self.connected = self.connect()
+
+    def connect(self) -> bool:
+        """Opens a connection to the server and exchanges the handshake.
+        Commands the server did not receive before a previous connection
+        dropped are sent again.
+
+        Returns:
+            bool: True if the handshake was successful, or False otherwise.
+        """
+
+        self.client = self.transport.connect()
+        self.reader = FrameReader(self.client, self.HEADERSIZE, self.FORMAT)
+        self.is_binary = False
+        self.pending_messages.clear()
+
+        # A server that never answers must not hang the reconnection.
+        self.client.settimeout(self.HANDSHAKE_TIMEOUT)
+        if not self.establish_connection():
+            return False
+        self.client.settimeout(None)
+
+        # Nothing may be sent in between the replayed commands, or they
+        # would arrive out of order and be discarded as duplicates.
+        with self.mutex_send:
+            self.unsent = b""
+            if self.resumed_seq is None:
+                self.window.reset()
+            else:
+                for seq, msg in self.window.unaccepted(self.resumed_seq):
+                    self.log.info("replaying", seq=seq)
+                    frame = self.encode_message(
+                        f"{wire_protocol.SEQUENCE_PREFIX}{seq} {msg}"
+                    )
+                    self.client.sendall(frame)
+
+            self.connected = True
+
+        return True
+
+    def reconnect(self) -> None:
+        """Tries to connect to the server again, waiting longer after each
+        failed attempt, until connected or closed."""
+
+        self.client.close()
+
+        delay = self.RECONNECT_DELAY
+        while not self.is_closing:
+            self.log.info("reconnecting", delay=delay)
+            time.sleep(delay)
+
+            try:
+                if self.connect():
+                    self.log.info("reconnected", session=self.session_id)
+                    return
+            except OSError as e:
+                self.log.warning("reconnect failed", error=e)
+
+            self.client.close()
+            delay = min(delay * 2, self.RECONNECT_MAX_DELAY)
 
     def establish_connection(self) -> bool:
-        """Exchanges a handshake message between the server and client.
+        """Exchanges a handshake message with the server. Servers greet
+        each client with greet_client instead.
 
         Returns:
             bool: True if the handshake was successful, or False otherwise.
         """
 
-        # If the current object is a server.
-        if self.isServer:
-            self.send_message(self.HANDSHAKE)
+        if self.read_handshake() is None:
+            self.log.error("server handshake failed")
+            return False
 
-            response = self.read_message()
-            if response == self.HANDSHAKE:
-                return True
+        offers = [
+            f"{SESSION}={self.session_id}",
+            f"{ACKED}={self.window.last_accepted}",
+            HEARTBEAT,
+        ]
+        if self.WIRE_FORMAT == "binary":
+            offers.append(wire_protocol.WIRE_BINARY)
 
-            print("[CONN ERROR] Client connection failed.")
+        self.write_message(" ".join([self.HANDSHAKE, *offers]))
+
+        # The server replies with the options it accepted.
+        accepted = self.read_handshake()
+        if accepted is None:
+            self.log.error("server handshake failed")
             return False
 
-        # If the current object is a client.
-        response = self.read_message()
-        if response == self.HANDSHAKE:
-            self.send_message(self.HANDSHAKE)
-            print("[CONN SUCCESS] connected to the Server.")
-            return True
+        self.apply_options(accepted)
 
-        print("[CONN ERROR] did not connect to server.")
-        return False
+        # Servers that do not resume sessions omit the option.
+        resumed = parse_options(accepted)
+        self.resumed_seq = (
+            int(resumed[ACKED] or 0) if SESSION in resumed else None
+        )
 
-    def read_message(self) -> str:
-        """Receives a message from the connected socket using a
-        header containing the length of the proceedign message.
+        self.log.info("connected to server", options=accepted)
+        return True
+
+    def greet_client(self, client, reader: FrameReader) -> "list[str] | None":
+        """Sends the handshake to a newly connected client and reads its
+        response, leaving the current client connected meanwhile.
+
+        Args:
+            client (socket.socket | InProcessConnection): The connection.
+            reader (FrameReader): Reads the connection's frames.
+
+        Raises:
+            OSError: The connection failed, or the client did not respond
+                within the handshake timeout.
+
+        Returns:
+            list[str] | None: The options appended to the client's
+                handshake, or None if it responded with anything else.
+        """
+
+        client.settimeout(self.HANDSHAKE_TIMEOUT)
+        client.sendall(self.encode_text(self.HANDSHAKE))
+        options = self.read_handshake(reader)
+        client.settimeout(None)
+        return options
+
+    def accept_options(self, options: list[str]) -> None:
+        """Replies to the options offered in the current client's
+        handshake, resuming its session if it is reconnecting.
+
+        Args:
+            options (list[str]): The options appended to the handshake.
+        """
+
+        # Legacy clients offer no options and expect no reply.
+        if not options:
+            self.apply_options(options)
+            return
+
+        accepted = [
+            o for o in options if o in [wire_protocol.WIRE_BINARY, HEARTBEAT]
+        ]
+
+        offered = parse_options(options)
+        if SESSION in offered:
+            accepted += self.resume_session(offered[SESSION])
+
+        self.write_message(" ".join([self.HANDSHAKE, *accepted]))
+        self.apply_options(accepted)
+
+        if SESSION in offered:
+            self.resend_acks(int(offered.get(ACKED) or 0))
+
+    def resume_session(self, session_id: str) -> list[str]:
+        """Continues the client's session if it is reconnecting, or starts a
+        new one.
+
+        Args:
+            session_id (str): The session offered by the client.
+
+        Returns:
+            list[str]: The handshake options telling the client the last
+                sequence number received, so it can replay the rest.
+        """
+
+        if session_id == self.session_id:
+            self.log.info(
+                "resuming session",
+                session=session_id,
+                last_received=self.last_received_seq,
+            )
+        else:
+            # A new client, so there is nothing to deduplicate.
+            self.log.info("new session", session=session_id)
+            self.session_id = session_id
+            self.last_received_seq = 0
+            self.acks_sent = {ACCEPTED: 0, EXECUTED: 0}
+
+        return [f"{SESSION}={session_id}", f"{ACKED}={self.last_received_seq}"]
+
+    def resend_acks(self, client_acked: int) -> None:
+        """Sends the latest acknowledgements again, since they may have been
+        lost with the previous connection.
+
+        Args:
+            client_acked (int): The last accepted sequence number the client
+                has been told about.
+        """
+
+        if self.acks_sent[ACCEPTED] > client_acked:
+            self.write_message(ack_message(ACCEPTED, self.acks_sent[ACCEPTED]))
+
+        # The client does not report which executions it has been told of.
+        if self.acks_sent[EXECUTED]:
+            self.write_message(ack_message(EXECUTED, self.acks_sent[EXECUTED]))
+
+    def read_handshake(self, reader: FrameReader = None) -> list[str]:
+        """Receives a single handshake message, leaving any frames that
+        follow it unread since the framing may change after it.
+
+        Args:
+            reader (FrameReader, optional): Reads the connection's frames.
+                Defaults to None, the current connection's reader.
 
         Returns:
-            str | None: The received message, if not the initial connection.
+            list[str] | None: The options appended to the handshake, or None
+                if the message was not a handshake.
         """
 
+        reader = reader or self.reader
         try:
-            msg_length = self.client.recv(self.HEADERSIZE).decode(self.FORMAT)
+            response = reader.read_frame()
+        except (ConnectionResetError, ValueError):
+            return
 
-            # If the msg_length exists:
-            if msg_length:
-                msg_length = int(msg_length)
-                msg = self.client.recv(msg_length).decode(self.FORMAT)
-                return msg
+        if not isinstance(response, str):
+            return
 
-            # If the msg_length does not exist.
+        words = response.split()
+        if not words or words[0] != self.HANDSHAKE:
             return
-        except ConnectionResetError:
-            print("Connection forcibly closed.")
-            self.connected = False
+
+        return words[1:]
+
+    def apply_options(self, options: list[str]) -> None:
+        """Applies the options agreed upon during the handshake.
+
+        Args:
+            options (list[str]): The accepted handshake options.
+        """
+
+        if wire_protocol.WIRE_BINARY in options:
+            self.is_binary = True
+            self.reader.set_binary()
+
+        # A peer that does not answer heartbeats is not dropped for silence.
+        self.monitor.is_enabled = HEARTBEAT in options
+
+    def read_message(self) -> "str | CommandFrame":
+        """Receives a message from the connected socket using a
+        header containing the length of the proceedign message.
+
+        Returns:
+            str | CommandFrame | None: The received message, if not the
+                initial connection.
+        """
+
+        if not self.pending_messages:
+            self.pending_messages.extend(self.read_messages())
+
+        if not self.pending_messages:
             return
 
-    def send_message(self, msg: str) -> None:
-        """Sends the message to the connected socket using the encoding format
-        specified.
+        return self.pending_messages.popleft()
+
+    def read_messages(self) -> "list[str | CommandFrame]":
+        """Receives every complete message available from the connected
+        socket, blocking until there is at least one.
+
+        Returns:
+            list[str | CommandFrame]: The received messages. Empty if the
+                connection closed.
+        """
+
+        # Hand out messages left over from a previous read_message call.
+        if self.pending_messages:
+            messages = list(self.pending_messages)
+            self.pending_messages.clear()
+            return messages
+
+        try:
+            messages = self.reader.read_frames()
+        except OSError as e:
+            self.log.warning("connection lost", error=e)
+            self.connected = False
+            return []
+        except ValueError as e:
+            self.log.error("malformed frame", error=e)
+            self.connected = False
+            return []
+
+        if not messages:
+            self.log.info("connection closed by peer")
+            self.connected = False
+
+        return messages
+
+    def encode_message(self, msg: str) -> bytes:
+        """Encodes the message as a frame in the protocol agreed upon.
+
+        Args:
+            msg (str): The message to be transmitted.
+
+        Returns:
+            bytes: The frame to be sent.
+        """
+
+        if self.is_binary:
+            frame = wire_protocol.encode_message(msg, self.FORMAT)
+            self.log.debug("sending", length=len(frame), msg=msg)
+            return frame
+
+        return self.encode_text(msg)
+
+    def encode_text(self, msg: str) -> bytes:
+        """Encodes the message as a frame of the text protocol, which every
+        connection uses until its handshake is complete.
 
         Args:
             msg (str): The message to be transmitted.
+
+        Returns:
+            bytes: The frame to be sent.
         """
 
         msg_length = len(msg.encode(self.FORMAT))
         send_length = f"{msg_length:<{self.HEADERSIZE}}"
 
-        print(f"[SENDING {msg_length:>3}] {msg}")
+        self.log.debug("sending", length=msg_length, msg=msg)
 
-        self.client.send(send_length.encode(self.FORMAT))
-        self.client.send(msg.encode(self.FORMAT))
+        return send_length.encode(self.FORMAT) + msg.encode(self.FORMAT)
 
-    def start_server(self, shared_list: list, mutex: threading.Lock) -> None:
-        """Starts the server and waits for client connection."""
+    def write_message(self, msg: str) -> None:
+        """Sends the message whether or not the handshake has completed.
 
-        if not self.isServer:
-            return
+        Args:
+            msg (str): The message to be transmitted.
+        """
 
-        print("[STARTING] server is starting...")
+        frame = self.encode_message(msg)
 
-        self.server.listen()
-        print(f"[LISTENNING] Server is listenning on {self.ip}")
+        with self.mutex_send:
+            self.write_frame(frame)
 
-        self.client, addr = self.server.accept()
+    def write_frame(self, frame: bytes) -> None:
+        """Sends the frame, after the rest of any frame partly sent by
+        try_send_message. Must be called holding mutex_send.
 
-        self.connected = self.establish_connection()
+        Args:
+            frame (bytes): The encoded frame.
+        """
+
+        if self.unsent:
+            frame = self.unsent + frame
+            self.unsent = b""
+
+        self.client.sendall(frame)
+
+    def send_message(self, msg: str) -> None:
+        """Sends the message to the connected socket using the encoding format
+        specified. Messages sent while disconnected are dropped; sequenced
+        commands are replayed once the client reconnects.
+
+        Args:
+            msg (str): The message to be transmitted.
+        """
+
+        frame = self.encode_message(msg)
+
+        # Remembered so they can be sent again to a reconnecting client.
+        if self.isServer:
+            # Aborts are not cumulative, so are not sent again.
+            ack = parse_ack(msg)
+            if ack is not None and ack[0] in self.acks_sent:
+                self.acks_sent[ack[0]] = max(self.acks_sent[ack[0]], ack[1])
+
+        with self.mutex_send:
+            if not self.connected:
+                self.log.warning("not connected, message dropped", msg=msg)
+                return
+
+            try:
+                self.write_frame(frame)
+            except OSError as e:
+                self.log.warning("send failed", error=e, msg=msg)
+                self.connected = False
+
+    def try_send_message(self, msg: str) -> bool:
+        """Sends the message only if that does not block, for messages such
+        as telemetry that the next one supersedes. The message is dropped
+        if another thread is sending or the send buffer is full. If only
+        part of it fits, the rest is sent ahead of the next message.
+
+        Args:
+            msg (str): The message to be transmitted.
+
+        Returns:
+            bool: True if the message was sent, at least in part.
+        """
+
+        frame = self.encode_message(msg)
+
+        if not self.mutex_send.acquire(blocking=False):
+            return False
+
+        try:
+            if not self.connected:
+                return False
+
+            if self.unsent:
+                self.unsent = self.unsent[self.send_nowait(self.unsent) :]
+                if self.unsent:
+                    return False
+
+            sent = self.send_nowait(frame)
+            self.unsent = frame[sent:]
+            return sent > 0
+        except OSError as e:
+            self.log.warning("send failed", error=e, msg=msg)
+            self.connected = False
+            return False
+        finally:
+            self.mutex_send.release()
+
+    def send_nowait(self, data: bytes) -> int:
+        """Sends as much of data as the send buffer has room for.
+
+        Returns:
+            int: The number of bytes sent, zero if the buffer is full.
+        """
+
+        try:
+            return self.client.send(data, socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            return 0
+
+    def send_command(self, msg: str, timeout: float = None) -> int:
+        """Sends the message with a sequence number, so the AGV acknowledges
+        it once accepted and once executed. Commands are pipelined until
+        the window of unaccepted messages is full, then this blocks. The
+        acknowledgements are read by the listener thread.
+
+        Args:
+            msg (str): The message to be transmitted.
+            timeout (float, optional): The maximum number of seconds to wait
+                for room in the window. Defaults to None, which waits
+                indefinitely.
+
+        Raises:
+            TimeoutError: The window stayed full until the timeout.
+
+        Returns:
+            int: The sequence number, or 0 for e-stop and halt messages,
+                which are never queued and so are sent unsequenced.
+        """
+
+        if wire_protocol.is_control_message(msg):
+            self.send_message(msg)
+            return 0
+
+        seq = self.window.acquire(msg, timeout)
+        if seq is None:
+            raise TimeoutError("The AGV has not accepted earlier commands.")
+
+        self.send_message(f"{wire_protocol.SEQUENCE_PREFIX}{seq} {msg}")
+        return seq
+
+    def can_send(self) -> bool:
+        """Checks whether a message can be sent without blocking.
+
+        Returns:
+            bool: True if the socket's send buffer has room.
+        """
 
         if not self.connected:
+            return False
+
+        return self.transport.is_writable(self.client)
+
+    def start_listener(
+        self, on_message: Callable[["str | CommandFrame"], None]
+    ) -> None:
+        """Receives messages from the server in a background thread.
+
+        Args:
+            on_message (Callable[[str | CommandFrame], None]): Called with
+                every message received.
+        """
+
+        if self.isServer:
             return
 
-        self.shared_list = shared_list
-        self.mutex_shared = mutex
+        thread = threading.Thread(
+            target=self.listen, args=(on_message,), daemon=True
+        )
+        thread.start()
+
+        # Heartbeats are answered through the listener.
+        self.monitor.start()
+
+    def listen(
+        self, on_message: Callable[["str | CommandFrame"], None]
+    ) -> None:
+        """Until closed, passes every message received to the callback,
+        reconnecting whenever the connection drops.
 
-        thread = threading.Thread(target=self.handle_client, args=(addr,))
+        Args:
+            on_message (Callable[[str | CommandFrame], None]): Called with
+                every message received.
+        """
+
+        while not self.is_closing:
+            if not self.connected:
+                self.reconnect()
+                continue
+
+            for msg in self.read_messages():
+                if self.monitor.on_message(msg):
+                    continue
+
+                # Acknowledgements are consumed by the send window.
+                ack = parse_ack(msg) if isinstance(msg, str) else None
+                if ack is not None:
+                    self.window.on_ack(*ack)
+                    continue
+
+                on_message(msg)
+
+    def start_server(
+        self,
+        message_queue: queue.Queue,
+        control_handler: Callable[["str | CommandFrame"], None] = None,
+        link_handler: Callable[[bool], None] = None,
+    ) -> None:
+        """Starts the server and waits for client connection.
+
+        Args:
+            message_queue (queue.Queue): Queue the received messages are
+                put on.
+            control_handler (Callable[[str | CommandFrame], None], optional):
+                Called directly from the receiving thread with e-stop and
+                halt messages, ahead of any queued messages. Defaults to
+                None, which queues them like any other message.
+            link_handler (Callable[[bool], None], optional): Called with
+                False when the client's heartbeats stop, and with True once
+                they resume. Defaults to None.
+        """
+
+        if not self.isServer:
+            return
+
+        self.log.info("server starting")
+
+        self.message_queue = message_queue
+        self.control_handler = control_handler
+        self.link_handler = link_handler
+
+        self.log.info("listening", address=self.transport.name)
+        self.running = True
+        self.monitor.start()
+
+        # Keep accepting after the first client, so it can reconnect.
+        self.accept_client()
+        thread = threading.Thread(target=self.accept_clients, daemon=True)
         thread.start()
 
+    def accept_clients(self) -> None:
+        """Accepts clients for as long as the server is running."""
+
+        while self.running:
+            try:
+                self.accept_client()
+            except OSError as e:
+                # The transport is closed once the server stops.
+                if not self.running:
+                    return
+
+                self.log.error("accept failed", error=e)
+                time.sleep(self.RECONNECT_DELAY)
+
+    def accept_client(self) -> None:
+        """Waits for a client to connect and starts receiving its messages.
+        A new client replaces the current one once its handshake succeeds,
+        since a client only reconnects once its previous connection is
+        dead, even if this end has not noticed yet. Connections that do not
+        complete the handshake, such as port scans, are closed without
+        disturbing the current client."""
+
+        client, addr = self.transport.accept()
+        reader = FrameReader(client, self.HEADERSIZE, self.FORMAT)
+
+        try:
+            options = self.greet_client(client, reader)
+        except OSError as e:
+            self.log.warning("handshake failed", addr=addr, error=e)
+            client.close()
+            return
+
+        if options is None:
+            self.log.error("client handshake failed", addr=addr)
+            client.close()
+            return
+
+        if self.handler is not None and self.handler.is_alive():
+            self.log.info("replacing connection")
+            try:
+                self.client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.handler.join()
+
+        with self.mutex_send:
+            self.connected = False
+            self.client = client
+            self.unsent = b""
+
+        self.reader = reader
+        self.is_binary = False
+        self.pending_messages.clear()
+
+        try:
+            self.accept_options(options)
+        except OSError as e:
+            self.log.warning("handshake failed", addr=addr, error=e)
+            self.client.close()
+            return
+
+        self.connected = True
+        self.handler = threading.Thread(
+            target=self.handle_client, args=(addr,)
+        )
+        self.handler.start()
+
     def handle_client(self, addr: tuple[str, int]) -> None:
         """While the client is connected, receives messages from the client.
 
@@ -147,37 +764,110 @@ class AgvSocket:
         if not self.isServer:
             return
 
-        print(f"[NEW CONNECTION] {addr} connected.")
+        self.log.info("new connection", addr=addr)
 
         while self.connected:
-            msg = self.read_message()
-            if msg is None:
-                continue
+            messages = self.read_messages()
 
-            print(f"[{addr}] {msg}")
+            if self.log.is_enabled(LogLevel.DEBUG):
+                for msg in messages:
+                    self.log.debug("received", addr=addr, msg=msg)
 
-            if msg == self.DISCONNECT_MESSAGE:
+            if self.DISCONNECT_MESSAGE in messages:
                 self.connected = False
-                continue
-
-            self.mutex_shared.acquire()
-            self.shared_list.append(msg)
-            self.mutex_shared.release()
+                messages = messages[: messages.index(self.DISCONNECT_MESSAGE)]
+
+            # Drop heartbeats, and commands a reconnecting client replayed
+            # but which had already arrived.
+            messages = [
+                msg
+                for msg in messages
+                if not self.monitor.on_message(msg)
+                and self.is_new_message(msg)
+            ]
+
+            # Safety commands skip the queue and are acted on first.
+            if self.control_handler is not None:
+                for msg in messages:
+                    if wire_protocol.is_control_message(msg):
+                        self.control_handler(msg)
+
+                messages = [
+                    msg
+                    for msg in messages
+                    if not wire_protocol.is_control_message(msg)
+                ]
+
+            # Each put wakes the Controller's message handler immediately.
+            for msg in messages:
+                self.message_queue.put(msg)
 
             # The controller sends back response instead.
             # self.send_message(self.MESSAGE_RECEIVED)
 
         # If not connected close the socket.
-        print("[TERMINATE] closing connection...")
+        self.log.info("closing connection", addr=addr)
         self.client.close()
 
+    def on_link_lost(self) -> None:
+        """Reports the lost link, then closes the connection, which is dead
+        even if the operating system has not noticed yet. Clients then
+        reconnect, and servers wait for the client to."""
+
+        self.log.warning(
+            "heartbeat lost", silence=round(self.monitor.silence, 3)
+        )
+
+        if self.link_handler is not None:
+            self.link_handler(False)
+
+        try:
+            self.client.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def on_link_restored(self) -> None:
+        self.log.info("heartbeat restored")
+
+        if self.link_handler is not None:
+            self.link_handler(True)
+
+    def is_new_message(self, msg: "str | CommandFrame") -> bool:
+        """Records the sequence number of a received message.
+
+        Args:
+            msg (str | CommandFrame): The received message.
+
+        Returns:
+            bool: False if a message with the same sequence number was
+                already received in this session.
+        """
+
+        seq, _ = wire_protocol.split_sequence(msg)
+        if not seq:
+            return True
+
+        if seq <= self.last_received_seq:
+            self.log.debug("duplicate dropped", seq=seq)
+            return False
+
+        self.last_received_seq = seq
+        return True
+
     def cleanup_server(self) -> None:
         """Sends disconnect message to server if client is
-        unexpectedly closed."""
+        unexpectedly closed. Servers also stop listening, freeing the
+        address."""
 
-        print("[TERMINATE] Program ended. Starting cleanup...")
+        self.log.info("program ended, starting cleanup")
+        self.is_closing = True
+        self.monitor.stop()
         self.send_message(self.DISCONNECT_MESSAGE)
 
+        if self.isServer:
+            self.running = False
+            self.transport.close()
+
 
 def main():
     return
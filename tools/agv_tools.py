@@ -7,6 +7,7 @@ import math
 
 import pigpio
 from onboard_controller.pi_bcm_pin_assignment import Pin
+from tools.wave_cache import WaveCache, encode_segment
 
 # unit: inch
 WHEEL_DIAM = 5
@@ -20,6 +21,9 @@ STEP_ANGLE = 360 / STEP_DRIVER_STEPS_PER_REV
 
 MAX_VELOCITY = 2.25
 
+# Edges per second of the single step sent to stop a move.
+STOP_FREQUENCY = 2000
+
 
 class AgvTools:
     def calc_pulse_freq(velocity: float = MAX_VELOCITY) -> int:
@@ -78,8 +82,6 @@ class AgvTools:
 
         freq_level_index = pulse_num // (steps_per_freq_level * 2)
 
-        coast_pulse_num = pulse_num - (freq_level_index * 20)
-
         if not freq_level_index < len(freq_levels):
             freq_level_index = len(freq_levels) - 1
 
@@ -103,12 +105,19 @@ class AgvTools:
         ramp: list[int, int],
         motor_pin: int,
         clear_waves: bool = True,
+        waves: WaveCache = None,
     ):
         """Generate ramp wave forms.
         ramp:  List of [Frequency, Steps]
+        waves: Reuses the waves built by earlier ramps instead of building
+            them again. clear_waves is ignored.
 
         Note: Sourced from https://www.rototron.info/raspberry-pi-stepper-motor-tutorial/
         """
+        if waves is not None:
+            waves.chain(pin=motor_pin, ramp=ramp)
+            return
+
         if clear_waves:
             pi.wave_clear()  # clear existing waves
 
@@ -128,15 +137,18 @@ class AgvTools:
         # Generate a chain of waves
         chain = []
         for i in range(length):
-            steps = ramp[i][1]
-            x = steps & 255
-            y = steps >> 8
-            chain += [255, 0, wid[i], 255, 1, x, y]
+            chain += encode_segment(wid[i], ramp[i][1])
 
         pi.wave_chain(chain)  # Transmit chain.
 
-    def wave_clear(pi: pigpio.pi, motor: Pin.motors.value):
-        f = 2000
+    def wave_clear(
+        pi: pigpio.pi, motor: Pin.motors.value, waves: WaveCache = None
+    ):
+        if waves is not None:
+            waves.chain(pin=motor, ramp=[[STOP_FREQUENCY, 1]])
+            return
+
+        f = STOP_FREQUENCY
         micros = int(500000 / f)
         wf = []
         wf.append(pigpio.pulse(1 << motor, 0, micros))  # pulse on
@@ -0,0 +1,210 @@
+"""
+File:       tools/chain_streamer.py
+Author:     Ali Karimiafshar
+"""
+
+import threading
+from dataclasses import dataclass
+
+import pigpio
+from onboard_controller.hardware import Clock
+
+from tools.wave_cache import MAX_CHAIN_BYTES, WaveCache, encode_segment
+
+# unit: seconds
+# How long before a chunk ends the streamer stops sleeping and polls
+# pigpiod for it to finish.
+LEAD_TIME = 0.005
+
+
+@dataclass
+class Chunk:
+    """Part of a ramp that fits in a single wave_chain.
+
+    Attributes:
+        chain (list[int]): The wave_chain commands.
+        steps (int): Steps transmitted by the chain.
+        seconds (float): Time taken to transmit the chain.
+    """
+
+    chain: list[int]
+    steps: int
+    seconds: float
+
+
+def step_time(frequency: int) -> float:
+    """Seconds per step of a cached wave, whose pulses are rounded down to
+    whole microseconds."""
+
+    return 2 * int(500000 / frequency) / 1e6
+
+
+def split_chain(
+    wids: list[int],
+    ramp: list[list[int, int]],
+    wave_steps: list[int] = None,
+) -> list[Chunk]:
+    """Encodes a ramp as wave_chain commands, split into chunks of at most
+    pigpio's chain length. Segments are never split across chunks.
+
+    Args:
+        wids (list[int]): The wave id of each level of the ramp.
+        ramp (list[list[int, int]]): List of [Frequency, Count], the
+            number of times each wave is transmitted.
+        wave_steps (list[int], optional): Steps covered by each wave, such
+            as a differential drive block. Defaults to None, one step per
+            wave.
+
+    Returns:
+        list[Chunk]: The chunks, in order.
+    """
+
+    if wave_steps is None:
+        wave_steps = [1] * len(ramp)
+
+    chunks = [Chunk([], 0, 0.0)]
+    for wid, (frequency, count), per_wave in zip(wids, ramp, wave_steps):
+        segment = encode_segment(wid, count)
+        if len(chunks[-1].chain) + len(segment) > MAX_CHAIN_BYTES:
+            chunks.append(Chunk([], 0, 0.0))
+
+        steps = count * per_wave
+        chunk = chunks[-1]
+        chunk.chain += segment
+        chunk.steps += steps
+        chunk.seconds += steps * step_time(frequency)
+
+    return [chunk for chunk in chunks if chunk.steps]
+
+
+class ChainStreamer:
+    def __init__(
+        self, pi: pigpio.pi, waves: WaveCache, clock: Clock = None
+    ) -> None:
+        """Transmits ramps of any length or number of levels. pigpiod only
+        transmits one chain at a time and cannot queue the next, so ramps
+        too long for a single chain are split into chunks. A thread sleeps
+        through most of each chunk, polls pigpiod for its end and sends the
+        next one straight away, leaving a gap of about one round trip to
+        pigpiod between chunks.
+
+        Args:
+            pi (pigpio.pi): Connection to pigpiod.
+            waves (WaveCache): Waves of the ramp levels.
+            clock (Clock, optional): Times the chunks. Defaults to None,
+                which uses real time.
+        """
+
+        self.pi = pi
+        self.waves = waves
+        self.clock = clock or Clock()
+
+        # Steps of the ramp being transmitted, and of its finished chunks.
+        self.total_pulses = 0
+        self.completed_pulses = 0
+
+        self.thread: threading.Thread = None
+        self.stopped = threading.Event()
+
+        # Set as soon as the last chunk finishes or the ramp is stopped,
+        # so callers can wait on it instead of polling.
+        self.done = threading.Event()
+        self.done.set()
+
+        # Held while checking for a stop and sending a chunk, so no chunk
+        # is sent once stop returns.
+        self.mutex = threading.Lock()
+
+    @property
+    def is_busy(self) -> bool:
+        """Whether the ramp is still being transmitted."""
+
+        return self.thread is not None and self.thread.is_alive()
+
+    @property
+    def is_finished(self) -> bool:
+        """Whether the whole ramp was transmitted without being stopped."""
+
+        return not self.is_busy and not self.stopped.is_set()
+
+    def start(self, pin: int, ramp: list[list[int, int]]) -> None:
+        """Starts transmitting a ramp, stopping any previous one.
+
+        Args:
+            pin (int): BCM number of the output pin.
+            ramp (list[list[int, int]]): List of [Frequency, Steps].
+        """
+
+        self.stop()
+        self.send(split_chain(self.waves.acquire(pin, ramp), ramp))
+
+    def start_blocks(
+        self,
+        left_pin: int,
+        right_pin: int,
+        plan: list[tuple[tuple[int, int, int, int], int]],
+    ) -> None:
+        """Starts transmitting differential drive blocks, stopping any
+        previous ramp. The pulse counts are of the path's centre steps.
+
+        Args:
+            left_pin (int): BCM number of the left wheel's step pin.
+            right_pin (int): BCM number of the right wheel's step pin.
+            plan (list[tuple[tuple[int, int, int, int], int]]): Each block,
+                as in wave_cache.block_wave, and the times it repeats.
+        """
+
+        self.stop()
+
+        blocks = [block for block, _ in plan]
+        wids = self.waves.acquire_blocks(left_pin, right_pin, blocks)
+        ramp = [[block[0], count] for block, count in plan]
+        self.send(split_chain(wids, ramp, [block[1] for block in blocks]))
+
+    def send(self, chunks: list[Chunk]) -> None:
+        self.total_pulses = sum(chunk.steps for chunk in chunks)
+        self.completed_pulses = 0
+        self.stopped.clear()
+        self.done.clear()
+
+        self.thread = threading.Thread(
+            target=self.feed, args=(chunks,), daemon=True
+        )
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stops sending chunks. The chunk being transmitted is left to the
+        caller to stop, such as with AgvTools.wave_clear."""
+
+        with self.mutex:
+            self.stopped.set()
+
+        if self.thread is not None:
+            self.thread.join()
+
+    def feed(self, chunks: list[Chunk]) -> None:
+        try:
+            self.transmit(chunks)
+        finally:
+            self.done.set()
+
+    def transmit(self, chunks: list[Chunk]) -> None:
+        for chunk in chunks:
+            with self.mutex:
+                if self.stopped.is_set():
+                    return
+
+                self.pi.wave_chain(chunk.chain)  # Transmit chain.
+
+            # Sleep through most of the chunk, then poll for its end.
+            seconds = max(chunk.seconds - LEAD_TIME, 0)
+            if self.clock.wait(self.stopped, seconds):
+                return
+
+            while self.pi.wave_tx_busy():
+                if self.stopped.is_set():
+                    return
+
+                self.clock.sleep(0)
+
+            self.completed_pulses += chunk.steps
@@ -18,6 +18,35 @@ class ControllerConfig:
     socket_message_header_size: int
     socket_disconnect_message: str
     socket_establish_connection_message: str
+    socket_multi_client: bool
+    socket_wire_format: str
+    socket_reconnect_max_delay: float
+    heartbeat_interval: float
+    heartbeat_timeout: float
+    fleet: list[dict]
+    telemetry_rate_hz: float
+    socket_ack_window: int
+    instruction_queue_size: int
+    wave_cache_size: int
+    motion_max_velocity: float
+    motion_acceleration: float
+    motion_jerk: float
+    motion_profile_levels: int
+    hardware_backend: str
+    simulation_speed: float
+    drive_mode: str
+    corner_radius: float
+    sensor_edge_callbacks: bool
+    sensor_glitch_filter_us: int
+    camera_index: int
+    camera_width: int
+    camera_height: int
+    camera_roi: list[int]
+    qr_worker_process: bool
+    log_level: str
+    log_file: str
+    log_max_bytes: int
+    log_backup_count: int
 
 
 def read_config(
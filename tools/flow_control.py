@@ -0,0 +1,200 @@
+"""
+File:       tools/flow_control.py
+Author:     Ali Karimiafshar
+"""
+
+import threading
+
+from onboard_controller.agv_command import AgvCommand
+
+ACCEPTED = "ACCEPTED"
+EXECUTED = "EXECUTED"
+
+# Unlike the others, acknowledges only the one message, which was cut short
+# by an e-stop or the AGV shutting down.
+ABORTED = "ABORTED"
+
+# Handshake options used to resume a session after reconnecting.
+SESSION = "SESSION"
+ACKED = "ACKED"
+
+
+def ack_message(kind: str, seq: int) -> str:
+    """Returns the acknowledgement message for a sequence number.
+
+    Args:
+        kind (str): ACCEPTED once queued, EXECUTED once carried out, or
+            ABORTED if stopped before it finished.
+        seq (int): Every message up to and including seq is acknowledged,
+            or only seq if ABORTED.
+
+    Returns:
+        str: e.g. "!ACK ACCEPTED 12"
+    """
+
+    return f"{AgvCommand.ack.value} {kind} {seq}"
+
+
+def parse_ack(msg: str) -> tuple[str, int]:
+    """Parses an acknowledgement message.
+
+    Args:
+        msg (str): The received message.
+
+    Returns:
+        tuple[str, int] | None: The kind and sequence number, or None if the
+            message is not an acknowledgement.
+    """
+
+    words = msg.split()
+    if len(words) != 3 or words[0] != AgvCommand.ack.value:
+        return
+
+    if words[1] not in [ACCEPTED, EXECUTED, ABORTED]:
+        return
+
+    if not words[2].isdigit():
+        return
+
+    return words[1], int(words[2])
+
+
+def parse_options(options: list[str]) -> dict[str, str]:
+    """Splits handshake options such as "SESSION=1f2e" into a dictionary.
+
+    Args:
+        options (list[str]): The handshake options.
+
+    Returns:
+        dict[str, str]: The value of each option, by name. Options without
+            a value are mapped to an empty string.
+    """
+
+    parsed = {}
+    for option in options:
+        name, _, value = option.partition("=")
+        parsed[name] = value
+
+    return parsed
+
+
+class SendWindow:
+    def __init__(self, size: int) -> None:
+        """Tracks sequenced messages sent to the AGV. At most size messages
+        may be unaccepted at once, so senders can pipeline commands but block
+        once the AGV's instruction queue stops accepting them.
+
+        Args:
+            size (int): Maximum number of messages in flight.
+        """
+
+        self.size = size
+        self.next_seq = 1
+        self.last_accepted = 0
+        self.last_executed = 0
+
+        # Messages the AGV stopped before they finished.
+        self.aborted: set[int] = set()
+
+        # Messages sent but not yet accepted, by sequence number.
+        self.unacked: dict[int, str] = {}
+
+        self.condition = threading.Condition()
+
+    @property
+    def in_flight(self) -> int:
+        return self.next_seq - 1 - self.last_accepted
+
+    def acquire(self, msg: str, timeout: float = None) -> int:
+        """Assigns the next sequence number to a message, blocking while the
+        window is full.
+
+        Args:
+            msg (str): The message about to be sent.
+            timeout (float, optional): The maximum number of seconds to wait.
+                Defaults to None, which waits indefinitely.
+
+        Returns:
+            int | None: The sequence number, or None if the window stayed
+                full until the timeout.
+        """
+
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: self.in_flight < self.size, timeout
+            ):
+                return
+
+            seq = self.next_seq
+            self.next_seq += 1
+            self.unacked[seq] = msg
+            return seq
+
+    def on_ack(self, kind: str, seq: int) -> None:
+        """Records an acknowledgement and wakes blocked senders.
+
+        Args:
+            kind (str): ACCEPTED, EXECUTED or ABORTED.
+            seq (int): The acknowledged sequence number.
+        """
+
+        with self.condition:
+            # Ignore acknowledgements for messages never sent.
+            seq = min(seq, self.next_seq - 1)
+
+            if kind == ACCEPTED and seq > self.last_accepted:
+                for s in range(self.last_accepted + 1, seq + 1):
+                    self.unacked.pop(s, None)
+                self.last_accepted = seq
+            elif kind == EXECUTED and seq > self.last_executed:
+                self.last_executed = seq
+            elif kind == ABORTED:
+                self.aborted.add(seq)
+
+            self.condition.notify_all()
+
+    def unaccepted(self, after: int) -> list[tuple[int, str]]:
+        """Returns the messages not yet accepted that were sent after a
+        sequence number, oldest first.
+
+        Args:
+            after (int): Messages up to and including this are excluded.
+
+        Returns:
+            list[tuple[int, str]]: The sequence numbers and messages.
+        """
+
+        with self.condition:
+            return sorted(
+                (seq, msg) for seq, msg in self.unacked.items() if seq > after
+            )
+
+    def reset(self) -> None:
+        """Gives up on every message not yet accepted, such as when the
+        connection was lost and the session could not be resumed, so their
+        acknowledgements will never arrive."""
+
+        with self.condition:
+            self.last_accepted = self.next_seq - 1
+            self.unacked.clear()
+            self.condition.notify_all()
+
+    def wait_executed(self, seq: int, timeout: float = None) -> bool:
+        """Blocks until the AGV has executed or aborted the given message.
+
+        Args:
+            seq (int): The sequence number returned by acquire.
+            timeout (float, optional): The maximum number of seconds to wait.
+                Defaults to None, which waits indefinitely.
+
+        Returns:
+            bool: True if the message was executed in full before the
+                timeout.
+        """
+
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.last_executed >= seq or seq in self.aborted,
+                timeout,
+            )
+            return self.last_executed >= seq and seq not in self.aborted
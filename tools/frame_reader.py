@@ -0,0 +1,230 @@
+"""
+File:       tools/frame_reader.py
+Author:     Ali Karimiafshar
+"""
+
+import socket
+
+from tools import wire_protocol
+from tools.wire_protocol import CommandFrame
+
+
+class FrameReader:
+    def __init__(
+        self,
+        sock: socket.socket,
+        header_size: int,
+        encoding: str = "utf-8",
+        buffer_size: int = 65536,
+    ) -> None:
+        """Buffered reader for length-prefixed frames. Bytes are received
+        with recv_into into a reusable buffer, so short reads never split
+        or corrupt a frame and a single syscall can yield many frames.
+
+        Args:
+            sock (socket.socket): The connected socket to read from.
+            header_size (int): Size of the space-padded ASCII length header.
+            encoding (str, optional): Encoding of the frame payloads.
+                Defaults to "utf-8".
+            buffer_size (int, optional): Initial size of the receive buffer
+                in bytes. Grows if a single frame does not fit.
+                Defaults to 65536.
+        """
+
+        self.sock = sock
+        self.header_size = header_size
+        self.encoding = encoding
+
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+
+        # Unparsed bytes live in self.buffer[self.start:self.end].
+        self.start = 0
+        self.end = 0
+        self.closed = False
+
+        # Whether frames use the binary protocol negotiated at handshake.
+        self.binary = False
+
+    def set_binary(self) -> None:
+        """Switches to the binary protocol framing for all following
+        frames."""
+
+        self.binary = True
+        self.header_size = wire_protocol.HEADER.size
+
+    def read_frames(self) -> "list[str | CommandFrame]":
+        """Blocks until at least one complete frame is received.
+
+        Returns:
+            list[str | CommandFrame]: Every complete frame received so far,
+                in order. An empty list means the peer closed the connection.
+        """
+
+        while not self.closed:
+            frames = self.parse_frames()
+            if frames:
+                return frames
+
+            self.fill_buffer()
+
+        return self.parse_frames()
+
+    def read_frame(self) -> "str | CommandFrame":
+        """Blocks until exactly one frame is received, leaving any
+        following bytes in the buffer. Used while the framing may change,
+        such as during the handshake.
+
+        Returns:
+            str | CommandFrame | None: The frame, or None if the peer closed
+                the connection.
+        """
+
+        while True:
+            frames = self.parse_frames(limit=1)
+            if frames:
+                return frames[0]
+
+            if self.closed:
+                return
+
+            self.fill_buffer()
+
+    def fill_buffer(self) -> int:
+        """Receives as many bytes as the kernel has available into the
+        free space at the end of the buffer.
+
+        Returns:
+            int: The number of bytes received. Zero if the peer closed.
+        """
+
+        self.make_room()
+
+        nbytes = self.sock.recv_into(self.view[self.end :])
+        if not nbytes:
+            self.closed = True
+
+        self.end += nbytes
+        return nbytes
+
+    def parse_frames(self, limit: int = -1) -> "list[str | CommandFrame]":
+        """Extracts the complete frames currently in the buffer.
+
+        Args:
+            limit (int, optional): The maximum number of frames to extract.
+                Defaults to -1, which extracts every complete frame.
+
+        Returns:
+            list[str | CommandFrame]: The decoded frame payloads.
+        """
+
+        frames: list[str | CommandFrame] = []
+
+        while self.end - self.start >= self.header_size:
+            if len(frames) == limit:
+                break
+
+            header_end = self.start + self.header_size
+            kind, msg_length = self.read_header(self.start)
+
+            # Wait for the rest of the payload.
+            if self.end - header_end < msg_length:
+                break
+
+            payload_end = header_end + msg_length
+            payload = self.view[header_end:payload_end]
+            if self.binary:
+                frame = wire_protocol.decode_payload(
+                    kind, payload, self.encoding
+                )
+            else:
+                frame = str(payload, self.encoding)
+
+            frames.append(frame)
+            self.start = payload_end
+
+        # Rewind when everything has been consumed to avoid copying.
+        if self.start == self.end:
+            self.start = 0
+            self.end = 0
+
+        return frames
+
+    def read_header(self, index: int) -> tuple[int, int]:
+        """Parses the header starting at the given buffer index.
+
+        Args:
+            index (int): Buffer index of the first header byte.
+
+        Raises:
+            ValueError: The header is not a valid length.
+
+        Returns:
+            tuple[int, int]: The frame kind and the payload length in bytes.
+        """
+
+        if self.binary:
+            return wire_protocol.HEADER.unpack_from(self.view, index)
+
+        header = bytes(self.view[index : index + self.header_size])
+        try:
+            msg_length = int(header)
+        except ValueError:
+            raise ValueError(f"Malformed frame header {header!r}.")
+
+        if msg_length < 0:
+            raise ValueError(f"Malformed frame header {header!r}.")
+
+        return wire_protocol.KIND_TEXT, msg_length
+
+    def make_room(self) -> None:
+        """Ensures there is free space at the end of the buffer, compacting
+        or growing it if the pending frame would not fit."""
+
+        pending = self.end - self.start
+
+        # Bytes required to hold the frame currently being received.
+        required = self.header_size
+        if pending >= self.header_size:
+            required += self.read_header(self.start)[1]
+
+        if required > len(self.buffer):
+            self.grow(required)
+            return
+
+        if self.end < len(self.buffer) and self.start + required <= len(
+            self.buffer
+        ):
+            return
+
+        # Move the partial frame to the front of the buffer.
+        self.view[:pending] = self.view[self.start : self.end]
+        self.start = 0
+        self.end = pending
+
+    def grow(self, size: int) -> None:
+        """Replaces the buffer with a larger one holding the pending bytes.
+
+        Args:
+            size (int): The minimum size of the new buffer.
+        """
+
+        pending = self.end - self.start
+        new_size = max(size, len(self.buffer) * 2)
+
+        buffer = bytearray(new_size)
+        buffer[:pending] = self.view[self.start : self.end]
+
+        self.view.release()
+        self.buffer = buffer
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = pending
+
+
+def main():
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+File:       tools/heartbeat.py
+Author:     Ali Karimiafshar
+"""
+
+import threading
+import time
+from typing import Callable
+
+from onboard_controller.agv_command import AgvCommand
+from tools.histogram import RollingHistogram
+
+# Handshake option offered by peers that send heartbeats, so that their
+# silence can be taken as a lost link. Silence from other peers is normal.
+HEARTBEAT = "HEARTBEAT"
+
+
+class LinkMonitor:
+    def __init__(
+        self,
+        send: Callable[[str], None],
+        interval: float,
+        timeout: float,
+        is_connected: Callable[[], bool] = None,
+    ) -> None:
+        """Sends a heartbeat every interval and answers the peer's, sampling
+        the round-trip time of each. Any message received counts as a
+        heartbeat. Once the link has been heard from, the link is reported
+        lost if nothing arrives for timeout seconds, and restored when
+        something does.
+
+        Args:
+            send (Callable[[str], None]): Sends a message to the peer.
+            interval (float): Seconds between heartbeats.
+            timeout (float): Seconds of silence after which the link is lost.
+            is_connected (Callable[[], bool], optional): Whether heartbeats
+                can be sent. Defaults to None, which always sends them.
+        """
+
+        self.send = send
+        self.interval = interval
+        self.timeout = timeout
+        self.is_connected = is_connected or (lambda: True)
+
+        # Round-trip times in milliseconds.
+        self.rtt = RollingHistogram()
+
+        self.last_heard: float = None
+        self.last_sent = 0.0
+        self.is_lost = False
+
+        # Whether heartbeats are sent and silence reported as a lost link,
+        # cleared if the peer has not agreed to heartbeats.
+        self.is_enabled = True
+
+        # Called when the link is lost or restored.
+        self.on_lost: Callable[[], None] = None
+        self.on_restored: Callable[[], None] = None
+
+        # Set to end the polling thread.
+        self.stopped = threading.Event()
+
+    @property
+    def period(self) -> float:
+        """Seconds between polls, several per interval to bound the time
+        taken to notice silence."""
+
+        return min(self.interval, self.timeout) / 5
+
+    @property
+    def silence(self) -> float:
+        """Seconds since the peer was last heard from."""
+
+        if self.last_heard is None:
+            return 0.0
+
+        return time.monotonic() - self.last_heard
+
+    def start(self) -> None:
+        self.stopped.clear()
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+
+    def stop(self) -> None:
+        """Ends the polling thread, such as when the socket is closed, so
+        the link is no longer reported lost."""
+
+        self.stopped.set()
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            self.poll()
+            self.stopped.wait(self.period)
+
+    def reset(self) -> None:
+        """Times the silence from now, such as after reconnecting."""
+
+        self.last_heard = time.monotonic()
+
+    def poll(self) -> None:
+        """Sends a heartbeat if one is due and checks for silence."""
+
+        now = time.monotonic()
+
+        if not self.is_enabled:
+            return
+
+        if self.is_connected() and now - self.last_sent >= self.interval:
+            self.last_sent = now
+            self.send(f"{AgvCommand.ping.value} {time.monotonic_ns()}")
+
+        if self.is_lost or self.last_heard is None:
+            return
+
+        if now - self.last_heard > self.timeout:
+            self.is_lost = True
+            if self.on_lost is not None:
+                self.on_lost()
+
+    def on_message(self, msg, reply: Callable[[str], None] = None) -> bool:
+        """Records that the peer was heard from, and handles heartbeats.
+
+        Args:
+            msg (str | CommandFrame): The received message.
+            reply (Callable[[str], None], optional): Sends the answer to a
+                heartbeat back to its sender. Defaults to None, which uses
+                send.
+
+        Returns:
+            bool: True if the message was a heartbeat, which needs no
+                further handling.
+        """
+
+        self.last_heard = time.monotonic()
+        if self.is_lost:
+            self.is_lost = False
+            if self.on_restored is not None:
+                self.on_restored()
+
+        if not isinstance(msg, str):
+            return False
+
+        command, _, token = msg.partition(" ")
+        if command == AgvCommand.ping.value:
+            (reply or self.send)(f"{AgvCommand.pong.value} {token}")
+            return True
+
+        if command == AgvCommand.pong.value:
+            if token.isdigit():
+                self.rtt.add((time.monotonic_ns() - int(token)) / 1e6)
+            return True
+
+        return False
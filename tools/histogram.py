@@ -0,0 +1,86 @@
+"""
+File:       tools/histogram.py
+Author:     Ali Karimiafshar
+"""
+
+import bisect
+import math
+import threading
+from collections import deque
+
+# Bucket upper bounds, roughly logarithmic to suit latencies in ms.
+DEFAULT_EDGES = [
+    0.5,
+    1,
+    2,
+    5,
+    10,
+    20,
+    50,
+    100,
+    200,
+    500,
+    1000,
+    math.inf,
+]
+
+
+class RollingHistogram:
+    def __init__(self, size: int = 256, edges: list[float] = None) -> None:
+        """Histogram of the most recent samples. Bucket counts are updated
+        as samples are added and evicted, and percentiles are taken from
+        the samples in the window.
+
+        Args:
+            size (int, optional): Number of samples kept. Defaults to 256.
+            edges (list[float], optional): Ascending upper bounds of the
+                buckets, ending with math.inf. Defaults to DEFAULT_EDGES.
+        """
+
+        self.edges = edges or DEFAULT_EDGES
+        self.counts = [0] * len(self.edges)
+        self.samples: deque[float] = deque()
+        self.size = size
+        self.mutex = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def bucket(self, value: float) -> int:
+        return bisect.bisect_left(self.edges, value)
+
+    def add(self, value: float) -> None:
+        with self.mutex:
+            if len(self.samples) == self.size:
+                self.counts[self.bucket(self.samples.popleft())] -= 1
+
+            self.samples.append(value)
+            self.counts[self.bucket(value)] += 1
+
+    @property
+    def last(self) -> float:
+        return self.samples[-1] if self.samples else math.nan
+
+    def percentile(self, fraction: float) -> float:
+        """Nearest-rank percentile of the samples in the window.
+
+        Args:
+            fraction (float): Between 0 and 1, e.g. 0.99.
+
+        Returns:
+            float: The percentile, or NaN if there are no samples.
+        """
+
+        with self.mutex:
+            values = sorted(self.samples)
+
+        if not values:
+            return math.nan
+
+        return values[min(int(fraction * len(values)), len(values) - 1)]
+
+    def buckets(self) -> list[tuple[float, int]]:
+        """Returns each bucket's upper bound and number of samples."""
+
+        with self.mutex:
+            return list(zip(self.edges, self.counts))
@@ -0,0 +1,176 @@
+"""
+File:       tools/motion_estimator.py
+Author:     Ali Karimiafshar
+"""
+
+import os
+
+from onboard_controller.agv_command import AgvCommand
+from onboard_controller.instructions import Instruction
+from tools.motion_profile import MotionProfile, ramp_duration
+
+# unit: seconds
+# The Controller waits this long for the drivers after changing a
+# direction.
+DIRECTION_SETTLE_TIME = 0.050
+
+# And after a rotation, before releasing the kill switches.
+ROTATE_SETTLE_TIME = 0.050
+
+
+class MotionEstimator:
+    def __init__(
+        self,
+        profile: MotionProfile,
+        routes_path: str = "./routes/",
+        drive_mode: str = "shared",
+        corner_radius: float = 0.0,
+    ) -> None:
+        """Predicts how long moves, routes and trips between stations take,
+        from the ramps the Controller transmits. Repeated queries are
+        answered from a cache, as routes reuse the same distances and
+        angles.
+
+        Args:
+            profile (MotionProfile): Profile of the AGV's moves.
+            routes_path (str, optional): Directory of the saved routes.
+                Defaults to "./routes/".
+            drive_mode (str, optional): The drive_mode option, which
+                decides how routes are compiled. Defaults to "shared".
+            corner_radius (float, optional): The corner_radius option, in
+                inches. Defaults to 0.0.
+        """
+
+        self.profile = profile
+        self.routes_path = routes_path
+        self.drive_mode = drive_mode
+        self.corner_radius = corner_radius
+
+        # Seconds by pulse count.
+        self.moves: dict[int, float] = {}
+
+        # Modification time and seconds, by route file path.
+        self.routes: dict[str, tuple[float, float]] = {}
+
+    def move_time(self, pulse_num: int) -> float:
+        """Seconds taken to transmit the ramp of a move.
+
+        Args:
+            pulse_num (int): Steps in the move.
+
+        Returns:
+            float: The duration of the ramp.
+        """
+
+        if pulse_num not in self.moves:
+            self.moves[pulse_num] = ramp_duration(self.profile.ramp(pulse_num))
+
+        return self.moves[pulse_num]
+
+    def route_time(self, instructions: list[Instruction]) -> float:
+        """Seconds taken to execute every instruction of a route, from the
+        moves the Controller compiles it into.
+
+        Args:
+            instructions (list[Instruction]): The route.
+
+        Returns:
+            float: The duration of the route.
+        """
+
+        # Imported here, as the route compiler reads routes with read_route.
+        from onboard_controller.differential_drive import (
+            DifferentialMove,
+            plan_route,
+        )
+        from onboard_controller.route_compiler import CompiledMove
+
+        plan = plan_route(
+            instructions, self.profile, self.drive_mode, self.corner_radius
+        )
+
+        seconds = 0.0
+        directions = None
+        for move in plan:
+            if not isinstance(move, CompiledMove):
+                continue
+
+            # The drivers are only waited for when a direction changes.
+            if move.pins.directions != directions:
+                seconds += DIRECTION_SETTLE_TIME
+                directions = move.pins.directions
+
+            if isinstance(move, DifferentialMove):
+                seconds += sum(
+                    count * steps / frequency
+                    for (frequency, steps, _, _), count in move.blocks
+                )
+            else:
+                seconds += ramp_duration(move.ramp)
+
+        return seconds
+
+    def route_file_time(self, file_path: str) -> float:
+        """Seconds taken to execute a saved route. The estimate is cached
+        until the file changes.
+
+        Args:
+            file_path (str): Path of the route's instruction file.
+
+        Returns:
+            float: The duration of the route.
+        """
+
+        mtime = os.path.getmtime(file_path)
+        cached = self.routes.get(file_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        seconds = self.route_time(read_route(file_path))
+        self.routes[file_path] = (mtime, seconds)
+        return seconds
+
+    def trip_time(self, start_name: str, end_name: str) -> float:
+        """Seconds taken to travel between two stations along the saved
+        route.
+
+        Args:
+            start_name (str): The starting station.
+            end_name (str): The destination station.
+
+        Raises:
+            FileNotFoundError: No route between the stations was saved.
+
+        Returns:
+            float: The duration of the trip.
+        """
+
+        file_name = f"{start_name}_to_{end_name}.txt"
+        return self.route_file_time(os.path.join(self.routes_path, file_name))
+
+
+def read_route(file_path: str) -> list[Instruction]:
+    """Reads the instructions of a saved route.
+
+    Args:
+        file_path (str): Path of the route's instruction file, with a
+            heading line followed by one "COMMAND VALUE" per line.
+
+    Returns:
+        list[Instruction]: The route's instructions.
+    """
+
+    with open(file=file_path, mode="r") as file:
+        # Ignore the heading (first line)
+        file.readline()
+
+        instructions: list[Instruction] = []
+        for line in file.readlines():
+            words = line.split()
+            if not words:
+                continue
+
+            cmd = AgvCommand(words[0]).value
+            instructions.append(Instruction(cmd, float(words[1])))
+
+        return instructions
@@ -0,0 +1,220 @@
+"""
+File:       tools/motion_profile.py
+Author:     Ali Karimiafshar
+"""
+
+import functools
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+from tools.agv_tools import STEP_DRIVER_STEPS_PER_REV, WHEEL_DIAM
+
+STEPS_PER_INCH = STEP_DRIVER_STEPS_PER_REV / (math.pi * WHEEL_DIAM)
+
+# pigpio chains are at most 600 bytes, 7 per segment, and repeat a wave
+# at most 65535 times per segment.
+MAX_CHAIN_SEGMENTS = 600 // 7
+MAX_SEGMENT_STEPS = 65535
+
+# Samples of the acceleration phase, interpolated at each step.
+SAMPLES = 2048
+
+
+@dataclass(frozen=True)
+class MotionProfile:
+    """Limits of a move. Without a jerk limit the velocity ramps linearly
+    (trapezoidal profile), otherwise the acceleration does (S-curve).
+
+    Attributes:
+        max_velocity (float): Cruise velocity in inches per second.
+        acceleration (float): Peak acceleration in inches per second².
+        jerk (float, optional): Peak jerk in inches per second³. Defaults
+            to None, a trapezoidal profile.
+        start_velocity (float, optional): Velocity of the first and last
+            step, which the motors can reach from rest. Defaults to 0.25.
+        levels (int, optional): Distinct step frequencies, each a wave on
+            pigpiod. Defaults to 24.
+    """
+
+    max_velocity: float
+    acceleration: float
+    jerk: float = None
+    start_velocity: float = 0.25
+    levels: int = 24
+
+    def __post_init__(self) -> None:
+        # Accelerating and decelerating through every level, plus cruising.
+        if not 2 <= 2 * self.levels + 1 <= MAX_CHAIN_SEGMENTS:
+            raise ValueError(
+                f"levels must be between 1 and {MAX_CHAIN_SEGMENTS // 2}."
+            )
+
+        if not 0 < self.start_velocity <= self.max_velocity:
+            raise ValueError("start_velocity must be within max_velocity.")
+
+    @classmethod
+    def from_config(cls, config) -> "MotionProfile":
+        """The profile set by the motion_* options of a ControllerConfig."""
+
+        return cls(
+            max_velocity=config.motion_max_velocity,
+            acceleration=config.motion_acceleration,
+            jerk=config.motion_jerk,
+            levels=config.motion_profile_levels,
+        )
+
+    def ramp(self, pulse_num: int) -> tuple[tuple[int, int], ...]:
+        return create_ramp(pulse_num, self)
+
+    def accel_time(self, v0: float, v1: float) -> float:
+        """Seconds taken to accelerate from v0 to v1, in steps per second."""
+
+        dv = v1 - v0
+        a = self.acceleration * STEPS_PER_INCH
+        if self.jerk is None:
+            return dv / a
+
+        j = self.jerk * STEPS_PER_INCH
+        if dv >= a * a / j:
+            return dv / a + a / j
+
+        # The peak acceleration is never reached.
+        return 2 * math.sqrt(dv / j)
+
+    def accel_distance(self, v0: float, v1: float) -> float:
+        """Steps taken to accelerate from v0 to v1. The velocity is point
+        symmetric about the middle of the acceleration, so it averages
+        halfway between the two."""
+
+        return (v0 + v1) / 2 * self.accel_time(v0, v1)
+
+    def accel_velocity(self, v0: float, v1: float) -> tuple:
+        """Samples the acceleration from v0 to v1.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Steps travelled, and the velocity
+                in steps per second, at each sample.
+        """
+
+        duration = self.accel_time(v0, v1)
+        t = np.linspace(0, duration, SAMPLES)
+
+        if self.jerk is None:
+            v = v0 + self.acceleration * STEPS_PER_INCH * t
+        else:
+            j = self.jerk * STEPS_PER_INCH
+            jerk_time = min(
+                self.acceleration * STEPS_PER_INCH / j, duration / 2
+            )
+            peak = j * jerk_time
+            v = np.where(
+                t < jerk_time,
+                v0 + j * t**2 / 2,
+                v0 + j * jerk_time**2 / 2 + peak * (t - jerk_time),
+            )
+            # Mirror of the jerk up phase.
+            v = np.where(
+                t > duration - jerk_time,
+                v1 - j * (duration - t) ** 2 / 2,
+                v,
+            )
+
+        # Trapezoidal integration of the velocity.
+        dx = (v[1:] + v[:-1]) / 2 * np.diff(t)
+        return np.concatenate(([0], np.cumsum(dx))), v
+
+
+@functools.lru_cache(maxsize=256)
+def create_ramp(
+    pulse_num: int, profile: MotionProfile
+) -> tuple[tuple[int, int], ...]:
+    """Generates the frequency of every step of a move, quantized down to
+    the profile's levels and merged into segments for AgvTools.generate_ramp.
+    Results are memoized, as routes repeat the same distances.
+
+    Args:
+        pulse_num (int): Steps in the move.
+        profile (MotionProfile): Limits of the move.
+
+    Returns:
+        tuple[tuple[int, int], ...]: tuple[tuple[frequency, steps]]
+    """
+
+    if pulse_num <= 0:
+        return ()
+
+    v0 = profile.start_velocity * STEPS_PER_INCH
+    v_max = profile.max_velocity * STEPS_PER_INCH
+
+    # Fastest velocity that can still be decelerated from in time.
+    low, high = v0, v_max
+    if 2 * profile.accel_distance(v0, high) > pulse_num:
+        for _ in range(40):
+            mid = (low + high) / 2
+            if 2 * profile.accel_distance(v0, mid) > pulse_num:
+                high = mid
+            else:
+                low = mid
+        high = low
+    v_peak = high
+
+    x, v = profile.accel_velocity(v0, v_peak)
+    accel_steps = min(int(x[-1]), pulse_num // 2)
+    accel = np.interp(np.arange(accel_steps), x, v)
+    cruise = np.full(pulse_num - 2 * accel_steps, v_peak)
+    velocities = np.concatenate((accel, cruise, accel[::-1]))
+
+    levels = np.unique(np.round(np.linspace(v0, v_max, profile.levels)))
+    index = np.searchsorted(levels, velocities + 1e-9, side="right") - 1
+    frequencies = levels[np.maximum(index, 0)].astype(int)
+
+    # A short move can peak just past a level, leaving too few steps at it
+    # to reach it and leave it again within the acceleration limit. Such a
+    # peak is lowered to the level below.
+    limit = profile.acceleration * STEPS_PER_INCH
+    while True:
+        top = frequencies.max()
+        below = levels[levels < top]
+        if not len(below):
+            break
+
+        lower = int(below[-1])
+        top_time = np.count_nonzero(frequencies == top) / top
+        lower_time = np.count_nonzero(frequencies == lower) / 2 / lower
+        if (top - lower) / ((top_time + lower_time) / 2) <= limit:
+            break
+
+        frequencies[frequencies == top] = lower
+
+    # Merge runs of steps at the same frequency.
+    starts = np.flatnonzero(np.diff(frequencies, prepend=-1))
+    counts = np.diff(np.append(starts, len(frequencies)))
+
+    output: list[tuple[int, int]] = []
+    for frequency, steps in zip(frequencies[starts], counts):
+        while steps > 0:
+            chunk = min(steps, MAX_SEGMENT_STEPS)
+            output.append((int(frequency), int(chunk)))
+            steps -= chunk
+
+    return tuple(output)
+
+
+def ramp_duration(ramp) -> float:
+    """Seconds taken to transmit a ramp of [frequency, steps] levels."""
+
+    return sum(steps / frequency for frequency, steps in ramp)
+
+
+def peak_acceleration(ramp) -> float:
+    """Largest change in velocity between consecutive levels of a ramp,
+    over the time between their middles, in inches per second²."""
+
+    peak = 0.0
+    for (f0, s0), (f1, s1) in zip(ramp, ramp[1:]):
+        seconds = (s0 / f0 + s1 / f1) / 2
+        peak = max(peak, abs(f1 - f0) / seconds)
+
+    return peak / STEPS_PER_INCH
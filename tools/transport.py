@@ -0,0 +1,349 @@
+"""
+File:       tools/transport.py
+Author:     Ali Karimiafshar
+"""
+
+import errno
+import os
+import select
+import socket
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+
+
+class Transport(ABC):
+    """Connects AgvSocket servers and clients. Connections are socket-like
+    objects providing sendall, send, recv_into, settimeout, shutdown and
+    close, so the same framing and handshake run over every transport."""
+
+    # Describes the address in log messages, e.g. "tcp://10.0.0.2:1234".
+    name = ""
+
+    @abstractmethod
+    def listen(self) -> None:
+        """Starts accepting connections at the transport's address."""
+
+    @abstractmethod
+    def accept(self) -> tuple:
+        """Blocks until a client connects.
+
+        Raises:
+            OSError: The transport was closed.
+
+        Returns:
+            tuple[socket.socket | InProcessConnection, object]: The
+                connection and the client's address.
+        """
+
+    @abstractmethod
+    def connect(self):
+        """Connects to a server listening at the transport's address.
+
+        Returns:
+            socket.socket | InProcessConnection: The connection.
+        """
+
+    @abstractmethod
+    def is_writable(self, conn) -> bool:
+        """Checks whether data can be sent without blocking.
+
+        Args:
+            conn (socket.socket | InProcessConnection): The connection.
+
+        Returns:
+            bool: True if the connection's send buffer has room.
+        """
+
+    @abstractmethod
+    def close(self) -> None:
+        """Stops listening, freeing the address for another server."""
+
+
+class SocketTransport(Transport):
+    def __init__(self, family: int, address) -> None:
+        """Transport over stream sockets of the given address family.
+
+        Args:
+            family (int): The address family, e.g. socket.AF_INET.
+            address (tuple[str, int] | str): The address to bind or connect.
+        """
+
+        self.family = family
+        self.address = address
+        self.server: socket.socket = None
+
+    def configure(self, sock: socket.socket) -> None:
+        """Sets the options of a newly connected socket."""
+
+        return
+
+    def listen(self) -> None:
+        self.server = socket.socket(self.family, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(self.address)
+        self.server.listen()
+
+    def accept(self) -> tuple:
+        conn, addr = self.server.accept()
+        self.configure(conn)
+        return conn, addr
+
+    def connect(self) -> socket.socket:
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.address)
+        except OSError:
+            sock.close()
+            raise
+
+        self.configure(sock)
+        return sock
+
+    def is_writable(self, conn: socket.socket) -> bool:
+        _, writable, _ = select.select([], [conn], [], 0)
+        return bool(writable)
+
+    def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+
+
+class TcpTransport(SocketTransport):
+    def __init__(self, ip: str, port: int) -> None:
+        """Transport over TCP, used between the AGV and the stationary
+        controller.
+
+        Args:
+            ip (str): The IP address of the server
+            port (int): The Port number of the server
+        """
+
+        super().__init__(socket.AF_INET, (ip, port))
+        self.name = f"tcp://{ip}:{port}"
+
+    def configure(self, sock: socket.socket) -> None:
+        """Sends small messages immediately instead of coalescing them, and
+        probes an idle connection, so a dropped link is noticed within
+        seconds instead of when the operating system gives up on it.
+
+        Args:
+            sock (socket.socket): The connected socket.
+        """
+
+        # Otherwise a command sent right after another can wait for the
+        # peer's delayed acknowledgement, around 40 ms.
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+        # Not every platform allows the probes to be tuned.
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 2)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 1)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+
+
+class UnixTransport(SocketTransport):
+    def __init__(self, path: str) -> None:
+        """Transport over a Unix domain socket, for tools running on the
+        same machine as the Controller.
+
+        Args:
+            path (str): Path of the socket file.
+        """
+
+        super().__init__(socket.AF_UNIX, path)
+        self.name = f"unix://{path}"
+
+    def listen(self) -> None:
+        # Left behind if a previous server did not exit cleanly.
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+        super().listen()
+
+    def close(self) -> None:
+        if self.server is not None and os.path.exists(self.address):
+            os.remove(self.address)
+
+        super().close()
+
+
+class Pipe:
+    def __init__(self, capacity: int) -> None:
+        """One direction of an in-process connection. Writers block while
+        the pipe holds capacity bytes, as they would on a full socket.
+
+        Args:
+            capacity (int): Bytes buffered before writers block.
+        """
+
+        self.data = bytearray()
+        self.capacity = capacity
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def has_room(self) -> bool:
+        return len(self.data) < self.capacity
+
+    def write(self, data: bytes) -> None:
+        view = memoryview(data)
+        with self.condition:
+            while view:
+                self.condition.wait_for(lambda: self.closed or self.has_room())
+                if self.closed:
+                    raise BrokenPipeError(errno.EPIPE, "Connection closed.")
+
+                room = self.capacity - len(self.data)
+                self.data += view[:room]
+                view = view[room:]
+                self.condition.notify_all()
+
+    def write_nowait(self, data: bytes) -> int:
+        """Writes as much of data as there is room for, without blocking.
+
+        Raises:
+            BlockingIOError: The pipe is full.
+
+        Returns:
+            int: The number of bytes written.
+        """
+
+        with self.condition:
+            if self.closed:
+                raise BrokenPipeError(errno.EPIPE, "Connection closed.")
+
+            room = self.capacity - len(self.data)
+            if room <= 0:
+                raise BlockingIOError(errno.EAGAIN, "Pipe is full.")
+
+            self.data += data[:room]
+            self.condition.notify_all()
+            return min(room, len(data))
+
+    def read_into(self, buffer, timeout: float = None) -> int:
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: self.closed or self.data, timeout
+            ):
+                raise TimeoutError(errno.ETIMEDOUT, "Timed out.")
+
+            nbytes = min(len(buffer), len(self.data))
+            buffer[:nbytes] = self.data[:nbytes]
+            del self.data[:nbytes]
+            self.condition.notify_all()
+            return nbytes
+
+    def close(self) -> None:
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class InProcessConnection:
+    def __init__(self, incoming: Pipe, outgoing: Pipe) -> None:
+        """Socket-like end of a pair of pipes."""
+
+        self.incoming = incoming
+        self.outgoing = outgoing
+
+        # Seconds a read waits for data, or None to wait indefinitely.
+        self.timeout: float = None
+
+    def settimeout(self, timeout: "float | None") -> None:
+        self.timeout = timeout
+
+    def sendall(self, data: bytes) -> None:
+        self.outgoing.write(data)
+
+    def send(self, data: bytes, flags: int = 0) -> int:
+        # Only MSG_DONTWAIT is supported, as by socket.send.
+        if flags & socket.MSG_DONTWAIT:
+            return self.outgoing.write_nowait(data)
+
+        self.outgoing.write(data)
+        return len(data)
+
+    def recv_into(self, buffer) -> int:
+        return self.incoming.read_into(buffer, self.timeout)
+
+    def shutdown(self, how: int = socket.SHUT_RDWR) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.incoming.close()
+        self.outgoing.close()
+
+
+# Listening in-process servers, by name.
+_listeners: dict[str, deque] = {}
+_mutex_listeners = threading.Condition()
+
+
+class InProcessTransport(Transport):
+    def __init__(self, name: str, capacity: int = 262144) -> None:
+        """Transport between threads of the same process, such as a
+        simulator or test driving the Controller. Frames are copied
+        between in-memory pipes without any system calls.
+
+        Args:
+            name (str): Name the server listens on.
+            capacity (int, optional): Bytes buffered in each direction.
+                Defaults to 262144.
+        """
+
+        self.address = name
+        self.name = f"inproc://{name}"
+        self.capacity = capacity
+
+    def listen(self) -> None:
+        with _mutex_listeners:
+            if self.address in _listeners:
+                raise OSError(errno.EADDRINUSE, f"{self.name} is in use.")
+
+            _listeners[self.address] = deque()
+
+    def accept(self) -> tuple[InProcessConnection, str]:
+        with _mutex_listeners:
+            pending = _listeners.get(self.address)
+
+            def is_closed() -> bool:
+                return _listeners.get(self.address) is not pending
+
+            _mutex_listeners.wait_for(lambda: is_closed() or pending)
+            if pending is None or is_closed():
+                raise OSError(errno.EBADF, f"{self.name} is not listening.")
+
+            return pending.popleft(), self.name
+
+    def connect(self) -> InProcessConnection:
+        to_server = Pipe(self.capacity)
+        to_client = Pipe(self.capacity)
+
+        with _mutex_listeners:
+            if self.address not in _listeners:
+                raise ConnectionRefusedError(
+                    errno.ECONNREFUSED, f"Nothing listening on {self.name}."
+                )
+
+            _listeners[self.address].append(
+                InProcessConnection(to_server, to_client)
+            )
+            _mutex_listeners.notify_all()
+
+        return InProcessConnection(to_client, to_server)
+
+    def is_writable(self, conn: InProcessConnection) -> bool:
+        return not conn.outgoing.closed and conn.outgoing.has_room()
+
+    def close(self) -> None:
+        """Stops listening and refuses the connections not yet accepted."""
+
+        with _mutex_listeners:
+            pending = _listeners.pop(self.address, None)
+            _mutex_listeners.notify_all()
+
+        for conn in pending or []:
+            conn.close()
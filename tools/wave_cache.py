@@ -0,0 +1,321 @@
+"""
+File:       tools/wave_cache.py
+Author:     Ali Karimiafshar
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+import pigpio
+
+# pigpiod allocates at most this many wave ids (PI_MAX_WAVES).
+MAX_WAVE_IDS = 250
+
+# Each square wave is a pulse on and a pulse off.
+PULSES_PER_WAVE = 2
+
+# A chain is at most 600 bytes, and a loop repeats at most 65535 times.
+MAX_CHAIN_BYTES = 600
+MAX_LOOP_COUNT = 65535
+
+
+class WaveCache:
+    def __init__(self, pi: pigpio.pi, size: int = 64) -> None:
+        """Square waves built on pigpiod once per session and reused by
+        every later move, which then only needs a wave_chain. The least
+        recently used wave is deleted when the cache is full or pigpiod
+        runs out of wave ids or DMA control blocks.
+
+        Note: pigpiod only reuses a deleted wave's memory for a wave of
+        the same size, or once every higher id is deleted. The square
+        waves all have two pulses, so a deleted wave's memory is always
+        reused by the next one. Differential drive blocks vary in size, and
+        a wave that does not fit evicts further waves until it does.
+
+        Args:
+            pi (pigpio.pi): Connection to pigpiod.
+            size (int, optional): Most waves kept, further limited by the
+                pulses pigpiod can hold. Defaults to 64.
+        """
+
+        self.pi = pi
+        self.size = min(
+            size,
+            MAX_WAVE_IDS,
+            pi.wave_get_max_pulses() // PULSES_PER_WAVE,
+        )
+
+        # Wave ids by (pin, frequency), or by ("block", *block_key) for
+        # differential drive blocks, least recently used first.
+        self.waves: OrderedDict[tuple, int] = OrderedDict()
+
+        # Waves of the chain being transmitted, which must not be deleted.
+        self.in_use: set[int] = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.mutex = threading.Lock()
+
+        self.reset()
+
+    def __len__(self) -> int:
+        return len(self.waves)
+
+    def reset(self) -> None:
+        """Deletes every wave on pigpiod, including any left behind by a
+        previous process, such as after pigpiod restarts."""
+
+        with self.mutex:
+            self.pi.wave_tx_stop()
+            self.pi.wave_clear()
+            self.waves.clear()
+            self.in_use.clear()
+
+    def get(self, pin: int, frequency: int) -> int:
+        """Returns the id of a square wave on pin, building it if needed.
+
+        Args:
+            pin (int): BCM number of the output pin.
+            frequency (int): Pulses, or steps, per second.
+
+        Returns:
+            int: The wave id.
+        """
+
+        with self.mutex:
+            return self.lookup(pin, frequency)
+
+    def get_block(
+        self, left_pin: int, right_pin: int, block: tuple[int, int, int, int]
+    ) -> int:
+        """Returns the id of a differential drive block, building it if
+        needed.
+
+        Args:
+            left_pin (int): BCM number of the left wheel's step pin.
+            right_pin (int): BCM number of the right wheel's step pin.
+            block (tuple[int, int, int, int]): Frequency, steps, left steps
+                and right steps, as in block_wave.
+
+        Returns:
+            int: The wave id.
+        """
+
+        with self.mutex:
+            return self.lookup_block(left_pin, right_pin, block)
+
+    def lookup(self, pin: int, frequency: int) -> int:
+        return self.lookup_wave(
+            (pin, frequency), lambda: square_wave(pin, frequency)
+        )
+
+    def lookup_block(
+        self, left_pin: int, right_pin: int, block: tuple[int, int, int, int]
+    ) -> int:
+        return self.lookup_wave(
+            ("block", left_pin, right_pin, *block),
+            lambda: block_wave(left_pin, right_pin, *block),
+        )
+
+    def lookup_wave(
+        self, key: tuple, build: Callable[[], list[pigpio.pulse]]
+    ) -> int:
+        if key in self.waves:
+            self.hits += 1
+            self.waves.move_to_end(key)
+            return self.waves[key]
+
+        self.misses += 1
+        if len(self.waves) >= self.size:
+            self.evict()
+
+        wf = build()
+        while True:
+            try:
+                wid = self.create(wf)
+                break
+            except pigpio.error:
+                # Out of wave ids or control blocks before the cache filled.
+                if not self.evict():
+                    raise
+
+        self.waves[key] = wid
+        return wid
+
+    def create(self, wf: list[pigpio.pulse]) -> int:
+        # Discard pulses left over from a failed wave_create.
+        self.pi.wave_add_new()
+        self.pi.wave_add_generic(wf)
+        return self.pi.wave_create()
+
+    def evict(self) -> bool:
+        """Deletes the least recently used wave not being transmitted.
+
+        Returns:
+            bool: False if every wave is in use.
+        """
+
+        for key, wid in self.waves.items():
+            if wid not in self.in_use:
+                del self.waves[key]
+                self.pi.wave_delete(wid)
+                return True
+
+        return False
+
+    def acquire(self, pin: int, ramp: list[list[int, int]]) -> list[int]:
+        """Returns the wave id of each level of the ramp, building any that
+        are missing. The waves are protected from eviction until the next
+        call, as the previous ramp is still transmitting until the new one
+        starts, and neither may be deleted to make room.
+
+        Args:
+            pin (int): BCM number of the output pin.
+            ramp (list[list[int, int]]): List of [Frequency, Steps].
+
+        Returns:
+            list[int]: The wave ids, in the order of the ramp.
+        """
+
+        with self.mutex:
+            wids = []
+            for frequency, _ in ramp:
+                wids.append(self.lookup(pin, frequency))
+                self.in_use.add(wids[-1])
+
+            self.in_use = set(wids)
+            return wids
+
+    def acquire_blocks(
+        self,
+        left_pin: int,
+        right_pin: int,
+        blocks: list[tuple[int, int, int, int]],
+    ) -> list[int]:
+        """Returns the wave id of each differential drive block, protected
+        from eviction as acquire does.
+
+        Args:
+            left_pin (int): BCM number of the left wheel's step pin.
+            right_pin (int): BCM number of the right wheel's step pin.
+            blocks (list[tuple[int, int, int, int]]): Frequency, steps,
+                left steps and right steps of each block.
+
+        Returns:
+            list[int]: The wave ids, in the order of the blocks.
+        """
+
+        with self.mutex:
+            wids = []
+            for block in blocks:
+                wids.append(self.lookup_block(left_pin, right_pin, block))
+                self.in_use.add(wids[-1])
+
+            self.in_use = set(wids)
+            return wids
+
+    def chain(self, pin: int, ramp: list[list[int, int]]) -> None:
+        """Transmits a square wave on pin for each level of the ramp.
+
+        Args:
+            pin (int): BCM number of the output pin.
+            ramp (list[list[int, int]]): List of [Frequency, Steps].
+
+        Raises:
+            ValueError: The ramp does not fit a single chain. Use a
+                ChainStreamer instead.
+        """
+
+        chain = []
+        for wid, (_, steps) in zip(self.acquire(pin, ramp), ramp):
+            chain += encode_segment(wid, steps)
+
+        if len(chain) > MAX_CHAIN_BYTES:
+            raise ValueError(f"Chain of {len(chain)} bytes is too long.")
+
+        self.pi.wave_chain(chain)  # Transmit chain.
+
+
+def square_wave(pin: int, frequency: int) -> list[pigpio.pulse]:
+    """One step on pin at frequency."""
+
+    micros = int(500000 / frequency)
+    wf = []
+    wf.append(pigpio.pulse(1 << pin, 0, micros))  # pulse on
+    wf.append(pigpio.pulse(0, 1 << pin, micros))  # pulse off
+    return wf
+
+
+def block_wave(
+    left_pin: int,
+    right_pin: int,
+    frequency: int,
+    steps: int,
+    left: int,
+    right: int,
+) -> list[pigpio.pulse]:
+    """Steps of both wheels in a single wave, lasting steps steps of a
+    square wave at frequency. The left and right steps are each spread
+    evenly across the wave, so the wheels turn at left / steps and right /
+    steps of the frequency's speed.
+
+    Args:
+        left_pin (int): BCM number of the left wheel's step pin.
+        right_pin (int): BCM number of the right wheel's step pin.
+        frequency (int): Steps per second of the path's centre.
+        steps (int): Centre steps covered by the wave.
+        left (int): Steps of the left wheel.
+        right (int): Steps of the right wheel.
+
+    Returns:
+        list[pigpio.pulse]: The pulses of the wave.
+    """
+
+    total = steps * 2 * int(500000 / frequency)
+
+    # Pins switched on and off at each microsecond of the wave.
+    edges: dict[int, list[int]] = {0: [0, 0]}
+    for pin, count in [(left_pin, left), (right_pin, right)]:
+        for i in range(count):
+            on = i * total // count
+            off = on + total // (2 * count)
+            edges.setdefault(on, [0, 0])[0] |= 1 << pin
+            edges.setdefault(off, [0, 0])[1] |= 1 << pin
+
+    times = sorted(edges)
+    wf = []
+    for start, end in zip(times, times[1:] + [total]):
+        on, off = edges[start]
+        wf.append(pigpio.pulse(on, off, end - start))
+
+    return wf
+
+
+def encode_segment(wid: int, steps: int) -> list[int]:
+    """Encodes a wave repeated steps times as wave_chain commands. Counts
+    beyond a single loop's 65535 repeat the wave in a nested loop, so any
+    count is transmitted exactly.
+
+    Args:
+        wid (int): The wave id.
+        steps (int): Number of times the wave is transmitted.
+
+    Returns:
+        list[int]: The chain commands.
+    """
+
+    chain = []
+
+    # Blocks of 65535 x outer repeats, outer at most 65535.
+    while steps > MAX_LOOP_COUNT:
+        outer = min(steps // MAX_LOOP_COUNT, MAX_LOOP_COUNT)
+        chain += [255, 0, 255, 0, wid]
+        chain += [255, 1, MAX_LOOP_COUNT & 255, MAX_LOOP_COUNT >> 8]
+        chain += [255, 1, outer & 255, outer >> 8]
+        steps -= outer * MAX_LOOP_COUNT
+
+    if steps:
+        chain += [255, 0, wid, 255, 1, steps & 255, steps >> 8]
+
+    return chain
@@ -0,0 +1,234 @@
+"""
+File:       tools/wire_protocol.py
+Author:     Ali Karimiafshar
+"""
+
+import struct
+from dataclasses import dataclass
+
+from onboard_controller.agv_command import AgvCommand
+
+# Handshake option offered by clients that speak the binary format.
+WIRE_BINARY = "WIRE=BINARY"
+
+# Sequenced text messages are prefixed with "#<seq> ".
+SEQUENCE_PREFIX = "#"
+
+# Binary frame header: frame kind, payload length.
+HEADER = struct.Struct("!BI")
+
+# Command payload: opcode, flags, sequence number, value.
+COMMAND = struct.Struct("!BBId")
+
+KIND_TEXT = 0
+KIND_COMMAND = 1
+
+# Opcodes are part of the wire format, never renumber them.
+OPCODES: dict[AgvCommand, int] = {
+    AgvCommand.invalid_command: 0,
+    AgvCommand.valid_command: 1,
+    AgvCommand.e_stop: 2,
+    AgvCommand.set_mode: 3,
+    AgvCommand.halt: 4,
+    AgvCommand.traverse_route: 5,
+    AgvCommand.upload_route: 6,
+    AgvCommand.telemetry: 7,
+    AgvCommand.ack: 8,
+    AgvCommand.forward: 16,
+    AgvCommand.backward: 17,
+    AgvCommand.rotate_cw: 18,
+    AgvCommand.rotate_ccw: 19,
+    AgvCommand.calibrate_home: 20,
+}
+COMMANDS: dict[int, AgvCommand] = {op: cmd for cmd, op in OPCODES.items()}
+
+# Commands the Controller turns directly into an Instruction.
+MOTION_COMMANDS = [
+    AgvCommand.forward,
+    AgvCommand.backward,
+    AgvCommand.rotate_cw,
+    AgvCommand.rotate_ccw,
+    AgvCommand.calibrate_home,
+]
+
+# Safety commands handled ahead of any queued traffic.
+CONTROL_COMMANDS = [AgvCommand.e_stop, AgvCommand.halt]
+
+
+@dataclass
+class CommandFrame:
+    command: AgvCommand
+    value: float = 0.0
+    seq: int = 0
+    flags: int = 0
+
+    def to_message(self) -> str:
+        """Returns the equivalent text protocol message."""
+
+        if self.command in MOTION_COMMANDS:
+            return f"{self.command.value} {self.value}"
+
+        return self.command.value
+
+
+def encode_text(msg: str, encoding: str) -> bytes:
+    """Encodes a text message as a binary protocol frame.
+
+    Args:
+        msg (str): The message to be transmitted.
+        encoding (str): Encoding of the message.
+
+    Returns:
+        bytes: The frame.
+    """
+
+    payload = msg.encode(encoding)
+    return HEADER.pack(KIND_TEXT, len(payload)) + payload
+
+
+def encode_command(frame: CommandFrame) -> bytes:
+    """Encodes a command as a binary protocol frame.
+
+    Args:
+        frame (CommandFrame): The command to be transmitted.
+
+    Returns:
+        bytes: The frame.
+    """
+
+    return HEADER.pack(KIND_COMMAND, COMMAND.size) + COMMAND.pack(
+        OPCODES[frame.command], frame.flags, frame.seq, frame.value
+    )
+
+
+def encode_message(msg: str, encoding: str) -> bytes:
+    """Encodes a text protocol message as a compact command frame when
+    possible, or as a text frame otherwise.
+
+    Args:
+        msg (str): The message to be transmitted, e.g. "FORWARD 30.0".
+        encoding (str): Encoding used for text frames.
+
+    Returns:
+        bytes: The frame.
+    """
+
+    seq, body = split_sequence(msg)
+    frame = command_from_message(body)
+    if frame is None:
+        return encode_text(msg, encoding)
+
+    frame.seq = seq
+    return encode_command(frame)
+
+
+def split_sequence(
+    msg: "str | CommandFrame",
+) -> "tuple[int, str | CommandFrame]":
+    """Separates the sequence number from a received message.
+
+    Args:
+        msg (str | CommandFrame): The received message.
+
+    Returns:
+        tuple[int, str | CommandFrame]: The sequence number, or 0 if the
+            message is unsequenced, and the message without its prefix.
+    """
+
+    if isinstance(msg, CommandFrame):
+        return msg.seq, msg
+
+    if not msg.startswith(SEQUENCE_PREFIX):
+        return 0, msg
+
+    prefix, _, body = msg.partition(" ")
+    if not prefix[1:].isdigit():
+        return 0, msg
+
+    return int(prefix[1:]), body
+
+
+def command_from_message(msg: str) -> CommandFrame:
+    """Converts a text protocol message to a command, if it is one.
+
+    Args:
+        msg (str): The text protocol message.
+
+    Returns:
+        CommandFrame | None: The command, or None if the message has no
+            binary representation.
+    """
+
+    words = msg.split()
+    if not words or len(words) > 2:
+        return
+
+    try:
+        command = AgvCommand(words[0].upper())
+    except ValueError:
+        return
+
+    # Commands added after the wire format was fixed stay text.
+    if command not in OPCODES:
+        return
+
+    if len(words) == 1:
+        return CommandFrame(command=command)
+
+    if command not in MOTION_COMMANDS:
+        return
+
+    try:
+        return CommandFrame(command=command, value=float(words[1]))
+    except ValueError:
+        return
+
+
+def is_control_message(msg: "str | CommandFrame") -> bool:
+    """Checks whether a received message is an e-stop or halt command.
+
+    Args:
+        msg (str | CommandFrame): The received message.
+
+    Returns:
+        bool: True if the message must bypass the message queue.
+    """
+
+    if isinstance(msg, CommandFrame):
+        return msg.command in CONTROL_COMMANDS
+
+    words = split_sequence(msg)[1].split(maxsplit=1)
+    if not words:
+        return False
+
+    return words[0].upper() in [cmd.value for cmd in CONTROL_COMMANDS]
+
+
+def decode_payload(
+    kind: int, payload: memoryview, encoding: str
+) -> "str | CommandFrame":
+    """Decodes the payload of a binary protocol frame.
+
+    Args:
+        kind (int): The frame kind from the header.
+        payload (memoryview): The payload bytes.
+        encoding (str): Encoding of text frames.
+
+    Raises:
+        ValueError: The frame kind or opcode is unknown.
+
+    Returns:
+        str | CommandFrame: The decoded message.
+    """
+
+    if kind == KIND_TEXT:
+        return str(payload, encoding)
+
+    if kind == KIND_COMMAND:
+        opcode, flags, seq, value = COMMAND.unpack(payload)
+        if opcode not in COMMANDS:
+            raise ValueError(f"Unknown opcode {opcode}.")
+
+        return CommandFrame(COMMANDS[opcode], value, seq, flags)
+
+    raise ValueError(f"Unknown frame kind {kind}.")